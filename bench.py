@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import engine
+from ledger import Ledger
+from rng import FairRNG, FairRandom
+from storage import JSONStore, LeaderboardIndex, SQLiteStore
+
+# Micro-benchmarks for the small functions that run on every click, frame or
+# save, so performance work can be measured instead of guessed:
+#
+#   python bench.py run                            # every benchmark
+#   python bench.py run -k slots -k roulette       # names containing "slots" or "roulette"
+#   python bench.py run --save baseline.json
+#   python bench.py compare baseline.json new.json --threshold 10
+#
+# Each benchmark is timed with timeit: it picks a loop count that takes at
+# least 0.2s, repeats that --repeat times and keeps the best and the median
+# time per call. `compare` flags anything slower than the baseline by more
+# than --threshold percent and exits with 1 if there is any.
+#
+# The Discord-side benchmarks (blackjack embeds, the mines board) need
+# py-cord installed and are skipped without it. Storage benchmarks run at
+# every size in --users.
+
+BENCHMARKS = {} # name -> (setup function, sized)
+
+
+# A benchmark is a setup function that returns the function to time, so
+# building its inputs isn't part of the measurement. Sized ones take the
+# number of users.
+def bench(name, sized=False):
+    def register(setup):
+        BENCHMARKS[name] = (setup, sized)
+        return setup
+    return register
+
+
+# ---------------------------- BLACKJACK ----------------------------
+
+@bench("blackjack.calculate_score")
+def _():
+    hands = [bytes(random.sample(range(52), 3)) for _ in range(100)]
+    return lambda: [engine.calculate_score(cards) for cards in hands]
+
+@bench("blackjack.hand_add")
+def _():
+    cards = bytes(random.choices(range(52), k=5))
+    def run():
+        hand = engine.Hand()
+        for card in cards:
+            hand.add(card)
+    return run
+
+@bench("blackjack.shoe_build_and_shuffle")
+def _():
+    return lambda: engine.Shoe(decks=6)
+
+@bench("blackjack.shoe_deal_card")
+def _():
+    shoe = engine.Shoe(decks=6)
+    def run():
+        shoe.start_hand()
+        shoe.deal_card()
+    return run
+
+@bench("blackjack.play_hand")
+def _():
+    shoe = engine.Shoe(decks=6)
+    return lambda: engine.play_blackjack_hand(shoe, 100)
+
+@bench("blackjack.hand_str")
+def _():
+    from blackjack import hand_str
+    hand = engine.Hand(random.sample(range(52), 4))
+    return lambda: (hand_str(hand), hand_str(hand, hide_first_card=True))
+
+@bench("blackjack.embed")
+def _():
+    import discord
+    from blackjack import hand_str
+    player, dealer = engine.Hand(random.sample(range(52), 3)), engine.Hand(random.sample(range(52), 2))
+    def run():
+        embed = discord.Embed(title="🃏 Blackjack", color=discord.Color.gold())
+        embed.add_field(name="Your Hand", value=f"{hand_str(player)}\n**Score:** {player.score}", inline=False)
+        embed.add_field(name="Dealer's Hand", value=hand_str(dealer, hide_first_card=True), inline=False)
+        return embed.to_dict()
+    return run
+
+
+# ---------------------------- MINES ----------------------------
+
+@bench("mines.multiplier")
+def _():
+    return lambda: [engine.mines_multiplier(mines, reveals) for mines in (1, 3, 5, 10) for reveals in range(1, 10)]
+
+@bench("mines.place_mines")
+def _():
+    return lambda: engine.place_mines(5)
+
+@bench("mines.reveal_mines")
+def _():
+    import mines
+    # The view wants a running loop; build it in one and keep it
+    async def build():
+        view = mines.MinesView(PLAYER, 100, 5, None)
+        view.revealed = random.getrandbits(mines.TILE_COUNT) & ~view.bombs
+        return view
+    view = asyncio.new_event_loop().run_until_complete(build())
+    def run():
+        for item in view.children:
+            item.disabled = False
+        view.reveal_mines()
+    return run
+
+
+# ---------------------------- ROULETTE ----------------------------
+
+@bench("roulette.spin_and_frames")
+def _():
+    # The outcome plus every frame of its animation (precomputed per pocket)
+    return lambda: list(engine.ROULETTE_FRAMES[engine.spin_roulette()])
+
+@bench("roulette.settle_50_bets")
+def _():
+    bets = [(random.randrange(20), random.choice(engine.ROULETTE_BET_NAMES), 10) for _ in range(50)]
+    return lambda: engine.settle_roulette(engine.spin_roulette(), bets)
+
+@bench("roulette.parse_bets")
+def _():
+    from roulette import parse_bets
+    return lambda: parse_bets("red, 17, 17-20, dozen2, col1, odd, low")
+
+
+# ---------------------------- SLOTS ----------------------------
+
+@bench("slots.spin")
+def _():
+    return lambda: engine.slot_machine.spin()
+
+@bench("slots.spin_and_payout")
+def _():
+    machine = engine.slot_machine
+    return lambda: machine.payout(machine.spin(), 100)
+
+@bench("slots.render")
+def _():
+    machine = engine.slot_machine
+    grid = machine.spin()
+    return lambda: machine.render(grid)
+
+@bench("slots.batch_1000_spins")
+def _():
+    return lambda: engine.slot_machine.play(100, 1000, random)
+
+
+# ---------------------------- CRASH / COIN FLIP ----------------------------
+
+@bench("crash.crash_point")
+def _():
+    return lambda: engine.get_skewed_crash_point()
+
+@bench("coinflip.flip")
+def _():
+    return lambda: engine.flip_coin()
+
+
+# ---------------------------- PROVABLY FAIR ----------------------------
+
+@bench("rng.fair_random_draw")
+def _():
+    rng = FairRandom(os.urandom(32), "bench")
+    return rng.random
+
+@bench("rng.round_start_finish")
+def _():
+    fair = FairRNG()
+    def run():
+        fair.finish(fair.start("bench", "client"), "done")
+    return run
+
+
+# ---------------------------- STORAGE ----------------------------
+
+PLAYER = type("Player", (), {"id": 1, "mention": "<@1>"})()
+
+def fake_users(count):
+    return {
+        str(100_000_000_000_000_000 + i): {"coins": random.randrange(10 ** 6), "last_daily": "2026-01-01"}
+        for i in range(count)
+    }
+
+_scratch = None # Temporary directory for the whole run, removed at the end
+
+def scratch(name):
+    return os.path.join(tempfile.mkdtemp(dir=_scratch), name)
+
+@bench("storage.json_load", sized=True)
+def _(users):
+    path = scratch("economy.json")
+    JSONStore(path)._write_snapshot(fake_users(users))
+    return lambda: JSONStore(path)
+
+@bench("storage.json_save", sized=True)
+def _(users):
+    store = JSONStore(scratch("economy.json"))
+    store.data = fake_users(users)
+    return lambda: store._write_snapshot(store.data)
+
+@bench("storage.leaderboard_update_and_rank", sized=True)
+def _(users):
+    data = fake_users(users)
+    index = LeaderboardIndex((user_id, user["coins"]) for user_id, user in data.items())
+    ids = list(data)
+    def run():
+        user_id = random.choice(ids)
+        index.update(user_id, random.randrange(10 ** 6))
+        index.rank(user_id)
+        index.page(0, 10)
+    return run
+
+@bench("storage.sqlite_debit", sized=True)
+def _(users):
+    path = scratch("economy.db")
+    JSONStore(path + ".json")._write_snapshot(fake_users(users))
+    store = SQLiteStore(path, import_from=path + ".json")
+    ids = [user_id for user_id, _ in store.balances()]
+    return lambda: store.try_debit(random.choice(ids), 1, 2)
+
+@bench("storage.sqlite_top_and_rank", sized=True)
+def _(users):
+    path = scratch("economy.db")
+    JSONStore(path + ".json")._write_snapshot(fake_users(users))
+    store = SQLiteStore(path, import_from=path + ".json")
+    ids = [user_id for user_id, _ in store.balances()]
+    # A deep page and a random player's rank cost the same as the top ones
+    return lambda: (store.top(10, random.randrange(len(ids))), store.rank(random.choice(ids)))
+
+@bench("storage.ledger_record")
+def _():
+    ledger = Ledger(scratch("economy.ledger"))
+    def run():
+        ledger.record(123456789, -100, "slots")
+        if len(ledger._pending) > 10_000:
+            ledger._pending.clear()
+    return run
+
+
+# ---------------------------- RUNNER ----------------------------
+
+def measure(function, repeat):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = sorted(total / number for total in timer.repeat(repeat, number))
+    return {"best": times[0], "median": times[len(times) // 2], "loops": number}
+
+def selected(names, patterns):
+    return [name for name in names if not patterns or any(pattern in name for pattern in patterns)]
+
+def run(args):
+    global _scratch
+    random.seed(args.seed)
+    sizes = [int(float(size)) for size in args.users.split(",")]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="casino-bench-") as _scratch:
+        for name in selected(BENCHMARKS, args.k):
+            setup, sized = BENCHMARKS[name]
+            for users in sizes if sized else [None]:
+                label = f"{name}[{users}]" if sized else name
+                try:
+                    function = setup(users) if sized else setup()
+                except ImportError as e:
+                    print(f"{label:<45} skipped ({e})")
+                    continue
+                results[label] = result = measure(function, args.repeat)
+                print(f"{label:<45} {format_time(result['best']):>10} best  {format_time(result['median']):>10} median")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": metadata(), "results": results}, f, indent=2)
+        print(f"Saved {len(results)} results to {args.save}")
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    print(f"baseline: {baseline['meta'].get('commit') or '?'} ({baseline['meta'].get('time')})  "
+          f"current: {current['meta'].get('commit') or '?'} ({current['meta'].get('time')})")
+
+    limit = args.threshold / 100
+    regressions = 0
+    print(f"{'benchmark':<45} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(set(baseline["results"]) | set(current["results"])):
+        old, new = baseline["results"].get(name), current["results"].get(name)
+        if old is None or new is None:
+            print(f"{name:<45} {'only in ' + ('current' if old is None else 'baseline'):>30}")
+            continue
+        change = new["best"] / old["best"] - 1
+        flag = ""
+        if change > limit:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -limit:
+            flag = "  faster"
+        print(f"{name:<45} {format_time(old['best']):>10} {format_time(new['best']):>10} {change * 100:>+7.1f}%{flag}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) slower than the baseline by more than {args.threshold:g}%")
+        sys.exit(1)
+    print(f"No regressions past {args.threshold:g}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the game hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run benchmarks")
+    run_parser.add_argument("-k", action="append", help="only benchmarks whose name contains this (repeatable)")
+    run_parser.add_argument("--users", default="1000,100000,1000000", help="user counts for the storage benchmarks")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--save", help="write the results to this JSON file")
+
+    compare_parser = commands.add_parser("compare", help="compare two saved runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="percent slower that counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
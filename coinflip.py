@@ -1,101 +1,249 @@
-import discord
-import random
 import asyncio
+from collections import OrderedDict, deque
 
-class OpenCoinFlipButtons(discord.ui.View):
-    def __init__(self, challenger, bet, save_data, load_data):
-        super().__init__(timeout=120)
+import discord
+from engine import flip_coin
+from render import renderer
+from rng import fair
+
+CHALLENGE_TIMEOUT = 120     # Seconds an open challenge waits for an opponent
+MAX_OPEN_CHALLENGES = 5000  # Across every server
+SWEEP_INTERVAL = 5          # Seconds between expiry sweeps
+
+
+class Challenge:
+    __slots__ = ("challenger", "bet", "key", "expires_at", "view", "message", "taken")
+
+    def __init__(self, challenger, bet, key, expires_at):
         self.challenger = challenger
         self.bet = bet
-        self.accepted = False
-        self.save_data = save_data
-        self.load_data = load_data
-        self.message = None # To set later
-
-    async def on_timeout(self):
-        if self.message:
+        self.key = key              # (server or DM channel id, bet)
+        self.expires_at = expires_at
+        self.view = None
+        self.message = None
+        self.taken = False          # Accepted, paired or expired: off the board
+
+
+class ChallengeBoard:
+    # Open coin flip challenges, indexed by (server, bet): a /cf for the same
+    # amount pairs with the oldest challenge waiting there straight away
+    # instead of posting one more. Each player has at most one open
+    # challenge, and there are at most `limit` in total.
+    #
+    # Every challenge lives the same `timeout`, so the order they were made
+    # in is also the order they expire in. Instead of a timer per view, a
+    # sweep every `sweep_interval` seconds pops whatever expired off the
+    # front of that queue and deletes their messages a channel at a time.
+    def __init__(self, limit=MAX_OPEN_CHALLENGES, timeout=CHALLENGE_TIMEOUT, sweep_interval=SWEEP_INTERVAL):
+        self.limit = limit
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.expired = 0            # Challenges nobody took
+        self._waiting = {}          # (server, bet) -> OrderedDict challenger id -> Challenge, oldest first
+        self._by_user = {}          # challenger id -> their open Challenge
+        self._queue = deque()       # Challenges oldest first; taken ones are dropped when they reach the front
+        self._task = None
+
+    def __len__(self):
+        return len(self._by_user)
+
+    # Why the player can't post a challenge right now, or None if they can
+    def refuse(self, user_id):
+        if user_id in self._by_user:
+            return "❌ You already have an open coin flip challenge!"
+        if len(self._by_user) >= self.limit:
+            return "⏳ Too many open coin flips right now, try again in a minute!"
+        return None
+
+    # A challenge for the player; check refuse() first. It holds their one
+    # open challenge right away, but can only be taken once add()ed, when
+    # its message is up.
+    def new(self, challenger, bet, server_id):
+        expires_at = asyncio.get_running_loop().time() + self.timeout
+        challenge = Challenge(challenger, bet, (server_id, bet), expires_at)
+        self._by_user[challenger.id] = challenge
+        return challenge
+
+    def add(self, challenge):
+        if challenge.taken:
+            return # Accepted before it even made it onto the board
+        self._waiting.setdefault(challenge.key, OrderedDict())[challenge.challenger.id] = challenge
+        self._queue.append(challenge)
+        if len(self._queue) > 2 * self.limit:
+            self._queue = deque(c for c in self._queue if not c.taken)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    # Take the oldest challenge for this server and bet that isn't the
+    # player's own, or None. Each player has one challenge at most, so this
+    # looks at two entries at most.
+    def take(self, server_id, bet, user_id):
+        waiting = self._waiting.get((server_id, bet))
+        if not waiting:
+            return None
+        for challenger_id, challenge in waiting.items():
+            if challenger_id != user_id:
+                self.remove(challenge)
+                return challenge
+        return None
+
+    def remove(self, challenge):
+        challenge.taken = True
+        waiting = self._waiting.get(challenge.key)
+        if waiting is not None and waiting.get(challenge.challenger.id) is challenge:
+            del waiting[challenge.challenger.id]
+            if not waiting:
+                del self._waiting[challenge.key]
+        if self._by_user.get(challenge.challenger.id) is challenge:
+            del self._by_user[challenge.challenger.id]
+
+    # ---------------------------- EXPIRY ----------------------------
+
+    # Take every challenge that ran out of time off the board
+    def expire(self, now):
+        expired = []
+        while self._queue and self._queue[0].expires_at <= now:
+            challenge = self._queue.popleft()
+            if not challenge.taken:
+                self.remove(challenge)
+                expired.append(challenge)
+        self.expired += len(expired)
+        return expired
+
+    async def _sweep_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            expired = self.expire(loop.time())
+            if expired:
+                try:
+                    await delete_challenges(expired)
+                except Exception as e:
+                    print(f"Failed to clear expired coin flips: {e}")
+
+
+challenges = ChallengeBoard()
+
+
+# Delete the messages of expired challenges, one bulk delete per channel
+# where we're allowed to, one at a time where we aren't
+async def delete_challenges(expired):
+    by_channel = {}
+    for challenge in expired:
+        challenge.view.stop()
+        if challenge.message is not None:
+            by_channel.setdefault(challenge.message.channel, []).append(challenge.message)
+
+    for channel, messages in by_channel.items():
+        if len(messages) > 1 and hasattr(channel, "delete_messages"):
+            try:
+                for start in range(0, len(messages), 100): # Discord's bulk delete limit
+                    await channel.delete_messages(messages[start:start + 100])
+                continue
+            except discord.HTTPException:
+                pass # No Manage Messages permission here
+        for message in messages:
             try:
-                await self.message.delete()
-            except discord.NotFound:
-                pass  # It was already deleted
+                await message.delete()
+            except discord.HTTPException:
+                pass # Already deleted
+
+
+# Flip, and settle with one transfer from the loser to the winner. Returns
+# the result message for both players.
+async def duel(challenge, opponent, economy):
+    challenger, bet = challenge.challenger, challenge.bet
+    fair_round = fair.start("coinflip", fair.client_seed(challenger.id))
+    challenger_side, opponent_side, flip_result = flip_coin(fair_round.rng)
+    winner, loser = (challenger, opponent) if challenger_side == flip_result else (opponent, challenger)
+
+    # The winner has to be able to cover the bet too, so nobody flips for
+    # free. Both are checked and the coins moved in one step, so there's no
+    # point where a stake is taken and not yet paid out.
+    try:
+        settled = await economy.transfer(loser.id, winner.id, bet, "coinflip", also_covering=(winner.id,))
+    except BaseException:
+        fair.finish(fair_round, "cancelled")
+        raise
+    if not settled:
+        fair.finish(fair_round, "cancelled")
+        broke = next((p for p in (challenger, opponent) if economy.get_balance(p.id) < bet), loser)
+        return f"❌ {broke.mention} can't cover the **{bet} coin** bet. Coin flip cancelled."
+    fair.finish(fair_round, f"{flip_result}")
+    return (
+        f"🪙 {challenger.mention} is **{challenger_side}**\n"
+        f"{opponent.mention} is **{opponent_side}**\n\n"
+        f"🪙 The coin lands... and **{winner.mention}** wins **{bet} coins**!\n{fair_round.label()}"
+    )
+
+
+class OpenCoinFlipButtons(discord.ui.View):
+    # No timeout of its own: the board expires the challenge and stops the view
+    def __init__(self, challenge, economy):
+        super().__init__(timeout=None)
+        self.challenge = challenge
+        self.economy = economy
 
     @discord.ui.button(label="Accept", style=discord.ButtonStyle.success)
     async def accept(self, button, interaction: discord.Interaction):
-        if self.accepted:
+        challenge = self.challenge
+        if challenge.taken:
             await interaction.response.send_message("⚠️ Someone already accepted this challenge!", ephemeral=True)
             return
 
-        if interaction.user.id == self.challenger.id:
+        if interaction.user.id == challenge.challenger.id:
             await interaction.response.send_message("❌ You can't accept your own challenge!", ephemeral=True)
             return
 
         opponent = interaction.user
+        if self.economy.get_balance(opponent.id) < challenge.bet:
+            await interaction.response.send_message("❌ You don't have enough coins to accept this challenge.", ephemeral=True)
+            return
 
-        # Lock in the first accepter
-        self.accepted = True
+        # Lock in the first accepter; the result replaces the challenge
+        challenges.remove(challenge)
         for child in self.children:
             child.disabled = True
-        await interaction.response.edit_message(view=self)
-
-        # Coin flip animation
-        # Assign heads/tails randomly
-        sides = random.sample(["Heads", "Tails"], 2)
-        assignments = {
-            self.challenger: sides[0],
-            opponent: sides[1]
-        }
-
-        # Announce who is heads/tails
-        assignment_msg = (
-            f"🪙 {self.challenger.mention} is **{assignments[self.challenger]}**\n"
-            f"{opponent.mention} is **{assignments[opponent]}**\n\n"
-            f"Flipping the coin..."
-        )
-        
-        flip_message = await interaction.followup.send(assignment_msg, ephemeral=False)
-        animation = ["🔃 Heads...", "🔃 Tails...", "🔃 Heads...", "🔃 Tails...", "🪙 Settling..."]
-        for frame in animation:
-            await asyncio.sleep(0.5)
-            await flip_message.edit(content=f"{assignment_msg}\n{frame}")
-
-        # Determine result of the flip
-        flip_result = random.choice(["Heads", "Tails"])
-        winner = next(player for player, side in assignments.items() if side == flip_result)
-        loser = opponent if winner == self.challenger else self.challenger
-
-        # Load and update balances
-        data = self.load_data()
-        for user in [self.challenger.id, opponent.id]:
-            uid = str(user)
-            if uid not in data:
-                data[uid] = {"coins": 1000, "last_daily": "2000-01-01"}
-
-        data[str(winner.id)]["coins"] += self.bet
-        data[str(loser.id)]["coins"] -= self.bet
-        self.save_data(data)
-
-        await flip_message.edit(content=f"🪙 The coin lands... and **{winner.mention}** wins **{self.bet} coins**!")
         self.stop()
+        await interaction.response.edit_message(content=await duel(challenge, opponent, self.economy), view=self)
 
-async def start_open_coinflip(ctx, bet: int, load_data, save_data):
+
+async def start_open_coinflip(ctx, bet: int, economy):
     if bet <= 0:
         await ctx.respond("❌ Bet must be greater than 0.", ephemeral=True)
         return
 
-    data = load_data()
-    challenger_id = str(ctx.author.id)
-    if challenger_id not in data:
-        data[challenger_id] = {"coins": 1000, "last_daily": "2000-01-01"}
-
-    if data[challenger_id]["coins"] < bet:
+    if economy.get_balance(ctx.author.id) < bet:
         await ctx.respond("❌ You don't have enough coins to place that bet.", ephemeral=True)
         return
 
-    save_data(data)
+    # Someone's already waiting for this bet here: flip against them now.
+    # Their challenge message becomes the result.
+    server_id = ctx.guild_id or ctx.channel.id # DMs pair within the DM
+    challenge = challenges.take(server_id, bet, ctx.author.id)
+    if challenge is not None:
+        for child in challenge.view.children:
+            child.disabled = True
+        challenge.view.stop()
+        result = await duel(challenge, ctx.author, economy)
+        await ctx.respond(f"🪙 You took {challenge.challenger.mention}'s **{bet} coin** coin flip!\n{result}", ephemeral=True)
+        await renderer.submit(challenge.message, final=True, content=result, view=challenge.view)
+        return
 
-    view = OpenCoinFlipButtons(ctx.author, bet, save_data, load_data)
-    response = await ctx.respond(
-        f"🪙 {ctx.author.mention} has created an open **{bet} coin** coin flip! First to accept joins the duel!",
-        view=view
-    )
-    view.message = await response.original_response()
\ No newline at end of file
+    error = challenges.refuse(ctx.author.id)
+    if error:
+        await ctx.respond(error, ephemeral=True)
+        return
+
+    challenge = challenges.new(ctx.author, bet, server_id)
+    challenge.view = OpenCoinFlipButtons(challenge, economy)
+    try:
+        response = await ctx.respond(
+            f"🪙 {ctx.author.mention} has created an open **{bet} coin** coin flip! First to accept (or `/cf {bet}`) joins the duel!",
+            view=challenge.view
+        )
+        challenge.message = await response.original_response()
+    except BaseException:
+        challenges.remove(challenge)
+        raise
+    challenges.add(challenge)
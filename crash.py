@@ -1,106 +1,312 @@
 import discord
-import random
 import asyncio
-import math
+from render import renderer
+from rng import fair
+from sessions import sessions
+from engine import get_skewed_crash_point, crash_multiplier_at as multiplier_at, crash_time_to_reach as time_to_reach
+
+BETTING_WINDOW = 10       # Seconds players have to join before takeoff
+MIN_AUTO_CASHOUT = 1.01
+MAX_LISTED_PLAYERS = 15   # Keep the round message under Discord's length limit
+FRAME_INTERVAL = 0.5      # Seconds between multiplier redraws
+
+# One round per channel: channel id -> CrashRound
+rounds = {}
+
+
+
+class CrashBet:
+    __slots__ = ("player", "bet", "auto_cashout", "cashed_out_at", "winnings", "session")
+
+    def __init__(self, player, bet, auto_cashout, session):
+        self.session = session            # Open until the bet is paid out or lost (see sessions.py)
+        self.player = player
+        self.bet = bet
+        self.auto_cashout = auto_cashout  # Multiplier to cash out at automatically, or None
+        self.cashed_out_at = None         # Multiplier they cashed out at
+        self.winnings = 0
+
+
+class CrashRound:
+    # A shared round: everyone in the channel bets during the betting window,
+    # then rides the same multiplier on the same message. The message is
+    # redrawn once per tick no matter how many players joined, and
+    # auto-cashouts are settled here without any clicks or extra edits.
+    def __init__(self, channel_id, economy):
+        self.channel_id = channel_id
+        self.economy = economy
+        self.bets = {}            # user id -> CrashBet
+        self.auto_queue = []      # Bets with an auto cashout, lowest target last
+        self.state = "betting"    # "betting" -> "running" -> "crashed"
+        self.fair_round = fair.start("crash", f"channel:{channel_id}")
+        self.crash_point = get_skewed_crash_point(self.fair_round.rng)
+        self.started_at = None    # Loop time of takeoff
+        self.crash_at = None      # Loop time of the crash, known at takeoff
+        self.message = None
+        self.view = CrashView(self)
+
+    # Take a player's bet. Returns an error message, or None if they're in.
+    async def join(self, player, bet, auto_cashout=None):
+        if self.state != "betting":
+            return "⏳ This round already took off, wait for the next one!"
+        if player.id in self.bets:
+            return "❌ You're already in this round!"
+        if bet <= 0:
+            return "❌ Your bet must be greater than 0!"
+        if auto_cashout is not None and auto_cashout < MIN_AUTO_CASHOUT:
+            return f"❌ Auto cash out must be at least x{MIN_AUTO_CASHOUT:.2f}!"
+
+        error = sessions.refuse(player.id, "crash")
+        if error:
+            return error
+
+        # The session holds the player's seat while the bet is taken, so a
+        # double click can't join twice. They're only in the round once the
+        # bet is taken and written down, so nothing refunds a bet that was
+        # never paid. Rounds end by themselves, so the session has no timeout.
+        session = sessions.open("crash", player.id, self.channel_id, bet)
+        try:
+            debited = await self.economy.debit(player.id, bet, "crash")
+        except BaseException:
+            sessions.discard(session)
+            raise
+        if debited is None:
+            sessions.discard(session)
+            return "You don't have enough coins!"
+        try:
+            await sessions.opened(session)
+        except Exception as e:
+            print(f"Failed to journal a crash bet: {e}")
+            await self.economy.credit(player.id, bet, "crash") # The session is gone, give the bet back
+            return "❌ Couldn't take your bet right now, it was returned."
+        if self.state != "betting":
+            # Took off (or was called off) while the bet was being taken
+            await self.economy.credit(player.id, bet, "crash")
+            sessions.close(session)
+            return "⏳ This round already took off, wait for the next one!"
+
+        entry = CrashBet(player, bet, auto_cashout, session)
+        self.bets[player.id] = entry
+        if auto_cashout is not None:
+            self.auto_queue.append(entry)
+            self.auto_queue.sort(key=lambda b: b.auto_cashout, reverse=True)
+        return None
+
+    async def cash_out(self, entry, multiplier):
+        # Marked before the credit so a second click can't pay it twice
+        entry.cashed_out_at = multiplier
+        entry.winnings = int(entry.bet * multiplier)
+        try:
+            await self.economy.credit(entry.player.id, entry.winnings, "crash")
+        except Exception:
+            entry.cashed_out_at = None # Not paid: still riding, or refunded if the round fails
+            entry.winnings = 0
+            raise
+        sessions.close(entry.session)
+
+    # Manual cash out from the button, at the multiplier of the moment the
+    # click arrived. Returns the bet, or None if there was nothing to cash out.
+    async def cash_out_player(self, user_id):
+        now = asyncio.get_running_loop().time()
+        entry = self.bets.get(user_id)
+        if self.state != "running" or entry is None or entry.cashed_out_at is not None:
+            return None
+        if now >= self.crash_at:
+            return None # Already crashed, the loop just hasn't drawn it yet
+        await self.cash_out(entry, multiplier_at(now - self.started_at))
+        return entry
+
+    # Call the round off before takeoff: stop taking bets and give everyone
+    # who already joined their bet back
+    async def cancel(self):
+        if rounds.get(self.channel_id) is self:
+            del rounds[self.channel_id]
+        fair.finish(self.fair_round, "cancelled")
+        self.view.stop()
+        await self.refund()
+
+    # End the round and give back every bet that wasn't paid out. A refund
+    # that fails leaves its session open, so it's made on the next start.
+    async def refund(self):
+        self.state = "crashed" # Joins still taking a bet give it back themselves
+        for entry in list(self.bets.values()):
+            if entry.cashed_out_at is not None:
+                continue
+            try:
+                await self.economy.credit(entry.player.id, entry.bet, "crash")
+            except Exception as e:
+                print(f"Failed to refund {entry.player.id}'s crash bet: {e!r}")
+                continue
+            sessions.close(entry.session)
+
+    def render(self, header):
+        lines = [header, self.fair_round.label()]
+        if self.bets:
+            lines.append(f"👥 **{len(self.bets)}** player(s), **{sum(b.bet for b in self.bets.values())}** coins in play")
+        for entry in list(self.bets.values())[:MAX_LISTED_PLAYERS]:
+            if entry.cashed_out_at is not None:
+                lines.append(f"✅ {entry.player.mention} cashed out at x{entry.cashed_out_at:.2f} for **{entry.winnings}** coins")
+            elif self.state == "crashed":
+                lines.append(f"💥 {entry.player.mention} lost **{entry.bet}** coins")
+            else:
+                auto = f" (auto x{entry.auto_cashout:.2f})" if entry.auto_cashout else ""
+                lines.append(f"🎲 {entry.player.mention} bet **{entry.bet}**{auto}")
+        if len(self.bets) > MAX_LISTED_PLAYERS:
+            lines.append(f"...and {len(self.bets) - MAX_LISTED_PLAYERS} more")
+        return "\n".join(lines)
+
+    async def run(self):
+        try:
+            # Betting window, counting down once a second
+            for remaining in range(BETTING_WINDOW, 0, -1):
+                renderer.submit(
+                    self.message,
+                    content=self.render(f"🚀 Crash round starting in **{remaining}s** - press **Join** or use `/crash` to bet!"),
+                    view=self.view
+                )
+                await asyncio.sleep(1)
+
+            loop = asyncio.get_running_loop()
+            self.state = "running"
+            self.view.join_button.disabled = True
+            self.started_at = loop.time()
+            self.crash_at = self.started_at + time_to_reach(self.crash_point)
+
+            # Auto cashouts at or above the crash point can never pay out
+            self.auto_queue = [b for b in self.auto_queue if b.auto_cashout < self.crash_point]
+
+            # Main game loop: sleep straight to whatever happens next - a
+            # redraw, an auto cashout or the crash - instead of ticking
+            next_frame = self.started_at
+            while True:
+                now = loop.time()
+
+                # Settle every auto cashout whose target time has passed, at
+                # exactly its target
+                while self.auto_queue and self.started_at + time_to_reach(self.auto_queue[-1].auto_cashout) <= now:
+                    entry = self.auto_queue.pop()
+                    if entry.cashed_out_at is None:
+                        await self.cash_out(entry, entry.auto_cashout)
+
+                if now >= self.crash_at:
+                    break
+
+                if now >= next_frame:
+                    multiplier = multiplier_at(now - self.started_at)
+                    renderer.submit(self.message, content=self.render(f"# Multiplier: 📈 x{multiplier:.2f}"), view=self.view)
+                    while next_frame <= now:
+                        next_frame += FRAME_INTERVAL
+
+                wake_at = min(next_frame, self.crash_at)
+                if self.auto_queue:
+                    wake_at = min(wake_at, self.started_at + time_to_reach(self.auto_queue[-1].auto_cashout))
+                await asyncio.sleep(max(0, wake_at - loop.time()))
+
+            # Crash condition met — everyone still riding loses their bet
+            self.state = "crashed"
+            for entry in self.bets.values():
+                if entry.cashed_out_at is None:
+                    sessions.close(entry.session)
+            self.view.cashout_button.disabled = True
+            await renderer.submit(
+                self.message,
+                final=True,
+                content=self.render(f"# 💥 Crash! Multiplier reached x{self.crash_point:.2f}"),
+                view=self.view
+            )
+        except asyncio.CancelledError:
+            raise # The bot is shutting down: the sessions stay open and the bets are refunded on the next start
+        except Exception as e:
+            # Something broke mid-round (the store, say): call it off rather
+            # than leave the players' bets and sessions hanging
+            print(f"Crash round in channel {self.channel_id} failed: {e!r}")
+            if self.state != "crashed":
+                fair.finish(self.fair_round, "cancelled")
+                await self.refund()
+            raise
+        finally:
+            fair.finish(self.fair_round, f"crashed at x{self.crash_point:.2f}")
+            self.view.stop()
+            if rounds.get(self.channel_id) is self:
+                del rounds[self.channel_id]
+
+
+class CrashJoinModal(discord.ui.Modal):
+    def __init__(self, crash_round):
+        super().__init__(title="Join Crash")
+        self.crash_round = crash_round
+        self.add_item(discord.ui.InputText(label="Bet", placeholder="100"))
+        self.add_item(discord.ui.InputText(label="Auto cash out (optional)", placeholder="2.00", required=False))
+
+    async def callback(self, interaction: discord.Interaction):
+        try:
+            bet = int(self.children[0].value)
+            auto_cashout = float(self.children[1].value) if self.children[1].value else None
+        except ValueError:
+            await interaction.response.send_message("❌ Bet must be a whole number and auto cash out a multiplier like 2.5.", ephemeral=True)
+            return
+
+        error = await self.crash_round.join(interaction.user, bet, auto_cashout)
+        await interaction.response.send_message(error or f"🚀 You're in for **{bet}** coins!", ephemeral=True)
+
 
 class CrashView(discord.ui.View):
-    def __init__(self, player, bet, save_data):
-        super().__init__(timeout=60)  # View timeout after 60 seconds
-        self.player = player          # Player who started the game
-        self.bet = bet                # Amount bet by the player
-        self.save_data = save_data    # Function to save winnings
-        self.multiplier = 1.0         # Starting multiplier
-        self.crashed = False          # Flag if the game has crashed
-        self.cashout = False          # Flag if player cashed out
-
-        # Create a "Cash Out" button and add to the view
+    def __init__(self, crash_round):
+        super().__init__(timeout=None)  # The round stops the view itself
+        self.crash_round = crash_round
+
+        # Create "Join" and "Cash Out" buttons and add to the view
+        self.join_button = discord.ui.Button(label="Join", style=discord.ButtonStyle.primary)
+        self.join_button.callback = self.join_callback
+        self.add_item(self.join_button)
+
         self.cashout_button = discord.ui.Button(label="Cash Out", style=discord.ButtonStyle.green)
         self.cashout_button.callback = self.cashout_callback
         self.add_item(self.cashout_button)
 
-    async def cashout_callback(self, interaction: discord.Interaction):
-        # Only allow the original player to cash out and if game not ended
-        if interaction.user != self.player or self.crashed or self.cashout:
-            await interaction.response.defer()  # Ignore other users or late clicks gracefully
+    async def join_callback(self, interaction: discord.Interaction):
+        if self.crash_round.state != "betting":
+            await interaction.response.send_message("⏳ This round already took off, wait for the next one!", ephemeral=True)
             return
+        await interaction.response.send_modal(CrashJoinModal(self.crash_round))
 
-        self.cashout = True  # Mark as cashed out
-
-        # Calculate winnings based on current multiplier and bet
-        winnings = int(self.bet * self.multiplier)
+    async def cashout_callback(self, interaction: discord.Interaction):
+        entry = await self.crash_round.cash_out_player(interaction.user.id)
+        if entry is None:
+            await interaction.response.defer()  # Ignore non-players or late clicks gracefully
+            return
+        # Only the player gets a reply; everyone else sees it on the next frame
+        await interaction.response.send_message(
+            f"💰 You cashed out at x{entry.cashed_out_at:.2f} for {entry.winnings} coins!",
+            ephemeral=True
+        )
 
-        # Save the winnings using provided save_data function
-        self.save_data(winnings)
 
-        # Disable the cashout button to prevent further clicks
-        self.cashout_button.disabled = True
+async def play_crash(ctx, bet, economy, auto_cashout=None):
+    channel_id = ctx.channel.id
 
-        # Update the message to show cashout info
-        await interaction.response.edit_message(
-            content=f"💰 {interaction.user.mention} cashed out at x{self.multiplier:.2f} for {winnings} coins!",
-            view=self
-        )
+    # Join the round that's taking bets in this channel
+    crash_round = rounds.get(channel_id)
+    if crash_round is not None:
+        error = await crash_round.join(ctx.author, bet, auto_cashout)
+        await ctx.respond(error or f"🚀 You're in for **{bet}** coins!", ephemeral=True)
+        return
 
-        await asyncio.sleep(0.5)
-
-async def play_crash(ctx, bet, load_data, save_data):
-    user_id = str(ctx.author.id)
-    data = load_data()
-
-    # Check if user has enough coins to bet
-    if user_id not in data or data[user_id]["coins"] < bet:
-        return await ctx.respond("You don't have enough coins!", ephemeral=True)
-    
-    # Deduct the bet from user's coins
-    data[user_id]["coins"] -= bet
-    save_data(data)
-
-    # Create the Crash game UI view for this player and bet
-    view = CrashView(ctx.author, bet, lambda winnings: update_balance(user_id, winnings, load_data, save_data))
-    # Defer response to allow sending a followup message later
-    await ctx.defer()
-
-    # Send the initial game message with multiplier and buttons
-    message = await ctx.followup.send(f"Crash game started! Multiplier: x1.00", view=view)
-    await asyncio.sleep(0.7)
-
-    # Randomly choose a crash multiplier between 1.02x and 20.0x
-    def get_skewed_crash_point():
-        r = random.random()
-        skewed = 1.02 + (5.0 - 1.02) * (1 - r) ** 3.5
-        return round(skewed, 2)
-    
-    crash_point = max(get_skewed_crash_point(), 1.05)
-
-    # Main game loop: increment multiplier until crash or cashout
-    tick = 0
-    while not view.crashed:
-        await asyncio.sleep(0.1)  # Wait 0.2 seconds between multiplier increases
-        tick += 1
-        acceleration = 0.005 * math.log(tick + 1)
-        view.multiplier += acceleration    # Accelerate multiplier smoothly
-
-        if view.multiplier >= crash_point:
-            # Crash condition met — game ends with loss
-            view.crashed = True
-            view.cashout_button.disabled = True  # Disable cashout button
-            await message.edit(
-                content=f"💥 Crash! Multiplier reached x{crash_point:.2f}. You lost your bet.",
-                view=view
-            )
-        elif view.cashout:
-            break
-        else:
-            # Update message with new multiplier while game ongoing
-            await message.edit(
-                content=f"# Multiplier: 📈 x{view.multiplier:.2f}",
-                view=view
-            )
+    # Otherwise open a new round with this player in it
+    crash_round = CrashRound(channel_id, economy)
+    rounds[channel_id] = crash_round
+    error = await crash_round.join(ctx.author, bet, auto_cashout)
+    if error:
+        # Others may have joined while the opener's bet was being taken
+        await crash_round.cancel()
+        return await ctx.respond(error, ephemeral=True)
 
-def update_balance(user_id, winnings, load_data, save_data):
-    data = load_data()
-    user_id = str(user_id)
-    if user_id not in data:
-        data[user_id] = {"coins": 1000, "last_daily": "2000-01-01"}
-    data[user_id]["coins"] += winnings
-    save_data(data)
\ No newline at end of file
+    try:
+        # Defer response to allow sending a followup message later
+        await ctx.defer()
+        crash_round.message = await ctx.followup.send(crash_round.render("🚀 Crash round starting soon!"), view=crash_round.view)
+    except discord.HTTPException:
+        # No round message, no round
+        await crash_round.cancel()
+        raise
+    await crash_round.run()
@@ -0,0 +1,68 @@
+import asyncio
+
+
+class _Waiter:
+    __slots__ = ("words", "future")
+
+    def __init__(self, words):
+        self.words = words
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class InputDispatcher:
+    # Routes a player's typed commands ("hit", "stand", "cash out") and the
+    # matching button presses to the game waiting on them. Waiters are kept
+    # by (channel id, user id), so a message is one dict lookup instead of
+    # running through a check function for every game in progress, which is
+    # what bot.wait_for("message") does.
+    def __init__(self):
+        self._waiting = {}  # (channel id, user id) -> [_Waiter], nearly always just one
+
+    # Wait for the player to send one of `words` in the channel. Returns the
+    # word, or None if the game closed the wait itself (see close). Raises
+    # asyncio.TimeoutError after `timeout` seconds; the wait is forgotten
+    # either way.
+    async def expect(self, channel_id, user_id, words, timeout=None):
+        key = (channel_id, user_id)
+        waiter = _Waiter(frozenset(words))
+        self._waiting.setdefault(key, []).append(waiter)
+        try:
+            return await asyncio.wait_for(waiter.future, timeout)
+        finally:
+            waiters = self._waiting.get(key)
+            if waiters is not None:
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    del self._waiting[key]
+
+    # Hand `word` to whatever is waiting on this player. Returns True if a
+    # game took it.
+    def press(self, channel_id, user_id, word):
+        waiters = self._waiting.get((channel_id, user_id))
+        if not waiters:
+            return False
+        handled = False
+        for waiter in waiters:
+            if word in waiter.words and not waiter.future.done():
+                waiter.future.set_result(word)
+                handled = True
+        return handled
+
+    # For on_message
+    def feed(self, message):
+        if (message.channel.id, message.author.id) not in self._waiting:
+            return False # The common case: nobody's waiting on this player here
+        return self.press(message.channel.id, message.author.id, message.content.strip().lower())
+
+    # Stop waiting on this player without any input, e.g. the game ended from
+    # a button. Only the waits for exactly `words` are closed, so another game
+    # the same player has going in this channel keeps waiting.
+    def close(self, channel_id, user_id, words):
+        words = frozenset(words)
+        for waiter in self._waiting.get((channel_id, user_id), ()):
+            if waiter.words == words and not waiter.future.done():
+                waiter.future.set_result(None)
+
+
+inputs = InputDispatcher()
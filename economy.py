@@ -0,0 +1,176 @@
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from storage import JSONStore, SQLiteStore
+
+DAILY_REWARD = 100
+
+
+# Opens the storage backend picked in .env (ECONOMY_BACKEND=json or sqlite)
+def open_store(backend, json_path, sqlite_path):
+    if backend == "json":
+        return JSONStore(json_path)
+    if backend == "sqlite":
+        return SQLiteStore(sqlite_path, import_from=json_path)
+    raise ValueError(f"Unknown economy backend: {backend}")
+
+
+class Economy:
+    # The one place games read and change balances. Where the balances
+    # actually live is up to the store (see storage.py).
+    #
+    # Games never hold on to a balance: they debit the bet when the round
+    # starts and credit the payout when it ends. Every change is a delta made
+    # under that user's lock, so two games settling at once can't overwrite
+    # each other, and games for different users never wait on each other.
+    #
+    # With a ledger (see ledger.py) every change is also appended there, and
+    # the store is brought up to date from it before the bot starts.
+    def __init__(self, store, ledger=None):
+        self.store = store
+        self.ledger = ledger
+        if ledger is not None:
+            ledger.recover(store)
+        self._locks = weakref.WeakValueDictionary() # user_id -> asyncio.Lock, dropped once unused
+        self.lock_waits = 0             # Changes that had to wait for another change to the same balance
+        self.lock_wait_seconds = 0.0    # ...and how long they waited in total
+
+    @asynccontextmanager
+    async def locked(self, *user_ids):
+        # Always lock in the same order so two transfers can't deadlock
+        locks = []
+        for user_id in sorted({str(user_id) for user_id in user_ids}):
+            lock = self._locks.get(user_id)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._locks[user_id] = lock
+            locks.append(lock)
+
+        acquired = []
+        try:
+            for lock in locks:
+                if lock.locked():
+                    self.lock_waits += 1
+                    started = time.perf_counter()
+                    await lock.acquire()
+                    self.lock_wait_seconds += time.perf_counter() - started
+                else:
+                    await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    # ---------------------------- BALANCES ----------------------------
+
+    def get_user(self, user_id):
+        return self.store.get_user(user_id)
+
+    def get_balance(self, user_id):
+        return self.store.get_balance(user_id)
+
+    async def set_balance(self, user_id, amount, game="admin"):
+        async with self.locked(user_id):
+            old = self.store.get_balance(user_id)
+            self.store.set_balance(user_id, amount)
+            self._record(user_id, amount - old, game)
+
+    # `game` only labels the ledger entry ("slots", "crash", ...)
+
+    # Take a bet. Returns the new balance, or None if the user can't cover it.
+    async def debit(self, user_id, amount, game):
+        async with self.locked(user_id):
+            balance = self.store.try_debit(user_id, amount)
+            if balance is not None:
+                self._record(user_id, -amount, game)
+            return balance
+
+    # A whole batch of rounds as one change: the user must cover `stake`,
+    # and gets `payout` back in the same step. Returns the new balance, or
+    # None (and changes nothing) if they can't cover the stake.
+    async def settle(self, user_id, stake, payout, game):
+        async with self.locked(user_id):
+            balance = self.store.try_debit(user_id, stake, payout)
+            if balance is not None:
+                self._record(user_id, payout - stake, game)
+            return balance
+
+    # Pay out coins and return the new balance
+    async def credit(self, user_id, amount, game):
+        async with self.locked(user_id):
+            balance = self.store.add_coins(user_id, amount)
+            self._record(user_id, amount, game)
+            return balance
+
+    # Blocking credit for startup, before the event loop runs and before any
+    # game can touch the balance (refunds in sessions.py)
+    def credit_now(self, user_id, amount, game):
+        balance = self.store.add_coins(user_id, amount)
+        self._record(user_id, amount, game)
+        return balance
+
+    # Move coins from one user to another. Returns False (and moves nothing)
+    # if the sender can't cover it, or if anyone in `also_covering` couldn't
+    # either - like the winner of a bet, who'd have paid had it gone the other
+    # way. All of it happens under every one of their locks.
+    async def transfer(self, from_id, to_id, amount, game, also_covering=()):
+        async with self.locked(from_id, to_id, *also_covering):
+            if any(self.store.get_balance(user_id) < amount for user_id in also_covering):
+                return False
+            moved = self.store.transfer(from_id, to_id, amount)
+            if moved:
+                self._record(from_id, -amount, game)
+                self._record(to_id, amount, game)
+            return moved
+
+    # Returns (claimed, balance). `today` is an ISO date string.
+    async def claim_daily(self, user_id, today, reward=DAILY_REWARD):
+        async with self.locked(user_id):
+            claimed, balance = self.store.claim_daily(user_id, today, reward)
+            if claimed:
+                self._record(user_id, reward, "daily")
+            return claimed, balance
+
+    # Returns once every balance change made so far is saved. SQLite commits
+    # each change as it's made; the ledger writes them in batches.
+    async def committed(self):
+        if self.ledger is not None:
+            await self.ledger.committed()
+
+    def _record(self, user_id, delta, game):
+        if self.ledger is not None:
+            self.ledger.record(user_id, delta, game)
+
+    # (user_id, coins) for every user
+    def balances(self):
+        return self.store.balances()
+
+    # (user_id, coins) for `limit` users starting `offset` places from the top
+    def top(self, limit, offset=0):
+        return self.store.top(limit, offset)
+
+    # 1-based leaderboard position, or None if the user has no balance yet
+    def rank(self, user_id):
+        return self.store.rank(user_id)
+
+    # ---------------------------- LIFECYCLE ----------------------------
+
+    # Must be called from inside the running loop
+    def start(self):
+        if self.ledger is not None:
+            self.ledger.start()
+        self.store.start()
+
+    async def close(self):
+        if self.ledger is not None:
+            await self.ledger.close()
+        await self.store.close()
+
+    # Blocking flush, for when the event loop is already gone (shutdown)
+    def flush_now(self):
+        if self.ledger is not None:
+            self.ledger.commit_now()
+        self.store.flush_now()
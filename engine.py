@@ -0,0 +1,402 @@
+import functools
+import json
+import math
+import random
+
+# Pure game logic: outcomes and payouts, no Discord. Every function that
+# needs randomness takes an `rng` (anything with the `random` module's API,
+# e.g. random.Random(seed)), so the same code runs the bot and simulate.py.
+
+# ---------------------------- SLOTS ----------------------------
+
+# Default machine: 3 reels x 3 rows, 5 paylines. A config has the same
+# shape and can come from a JSON file (see SlotMachine.load).
+#   reels:    one {symbol: weight} per reel, weights are relative
+#   rows:     symbols shown per reel
+#   pays:     {symbol: {matching reels from the left: pay per coin on the line}}
+#   paylines: the row each line crosses on every reel
+SLOTS_CONFIG = {
+    "reels": [{"🍒": 30, "🍋": 25, "🔔": 20, "💎": 15, "7️⃣": 10}] * 3,
+    "rows": 3,
+    "pays": {
+        "🍒": {"2": 2.5, "3": 8},
+        "🍋": {"3": 12},
+        "🔔": {"3": 20},
+        "💎": {"3": 40},
+        "7️⃣": {"3": 100},
+    },
+    "paylines": [[1, 1, 1], [0, 0, 0], [2, 2, 2], [0, 1, 2], [2, 1, 0]],
+}
+
+class AliasTable:
+    # Walker's alias method: after an O(n) setup, every draw from the
+    # weighted distribution is one randrange and one random(), however many
+    # outcomes there are
+    def __init__(self, weights):
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+
+    def sample(self, rng=random):
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+class SlotMachine:
+    def __init__(self, config=SLOTS_CONFIG):
+        reels = config["reels"]
+        self.rows = config["rows"]
+        self.paylines = [tuple(line) for line in config["paylines"]]
+        self.symbols = list(dict.fromkeys(symbol for reel in reels for symbol in reel))
+        index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+        # Per reel: weight of every symbol (0 if it isn't on that reel)
+        self.weights = [[reel.get(symbol, 0) for symbol in self.symbols] for reel in reels]
+        self.tables = [AliasTable(weights) for weights in self.weights]
+
+        # pays[symbol index][run length], 0 where nothing pays
+        self.pays = [[0.0] * (len(reels) + 1) for _ in self.symbols]
+        for symbol, pays in config["pays"].items():
+            for count, pay in pays.items():
+                self.pays[index[symbol]][int(count)] = pay
+
+        self.rtp = self._exact_rtp()
+
+    @classmethod
+    def load(cls, path=None):
+        if not path:
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    # Every cell is drawn independently from its reel's weights, so every
+    # line has the same odds and the RTP is one line's expected pay. A run
+    # of exactly k needs k matches from the left and a miss on reel k+1.
+    def _exact_rtp(self):
+        reel_count = len(self.weights)
+        probs = [[w / sum(weights) for w in weights] for weights in self.weights]
+        rtp = 0.0
+        for symbol in range(len(self.symbols)):
+            run_prob = 1.0
+            for count in range(1, reel_count + 1):
+                run_prob *= probs[count - 1][symbol]
+                exact = run_prob * (1 - probs[count][symbol]) if count < reel_count else run_prob
+                rtp += exact * self.pays[symbol][count]
+        return rtp
+
+    # grid[row][reel], as symbol indexes
+    def spin(self, rng=random):
+        columns = [[table.sample(rng) for _ in range(self.rows)] for table in self.tables]
+        return [list(row) for row in zip(*columns)]
+
+    # (line number, symbol index, run length, pay) for every winning line
+    def line_wins(self, grid):
+        wins = []
+        for number, line in enumerate(self.paylines):
+            first = grid[line[0]][0]
+            count = 1
+            while count < len(line) and grid[line[count]][count] == first:
+                count += 1
+            pay = self.pays[first][count]
+            if pay:
+                wins.append((number, first, count, pay))
+        return wins
+
+    # Coins returned for a spin, bet included. The bet is spread evenly over the lines.
+    def payout(self, grid, bet):
+        return int(bet * sum(win[3] for win in self.line_wins(grid)) / len(self.paylines))
+
+    # `spins` rounds in one go. Returns (total paid out, winning spins, best single payout, last grid).
+    def play(self, bet, spins, rng=random):
+        total = hits = best = 0
+        grid = None
+        for _ in range(spins):
+            grid = self.spin(rng)
+            paid = self.payout(grid, bet)
+            total += paid
+            if paid:
+                hits += 1
+                best = max(best, paid)
+        return total, hits, best, grid
+
+    def render(self, grid):
+        return "\n".join("🎰    " + " | ".join(self.symbols[i] for i in row) + "    🎰" for row in grid)
+
+slot_machine = SlotMachine()
+
+# ---------------------------- ROULETTE ----------------------------
+
+# Single-zero wheel, pockets in the order they sit on a European wheel
+ROULETTE_WHEEL = [
+    0, 32, 15, 19, 4, 21, 2, 25, 17, 34, 6, 27, 13, 36, 11, 30, 8, 23, 10,
+    5, 24, 16, 33, 1, 20, 14, 31, 9, 22, 18, 29, 7, 28, 12, 35, 3, 26,
+]
+ROULETTE_RED = {1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36}
+ROULETTE_SPIN_FRAMES = 20
+ROULETTE_WINDOW = 9    # Pockets shown per frame, the ball lands in the middle one
+
+def roulette_color(number):
+    if number == 0:
+        return "green"
+    return "red" if number in ROULETTE_RED else "black"
+
+ROULETTE_EMOJIS = {"red": "🔴", "black": "⚫", "green": "🟢"}
+
+# Every bet on the table: name -> (numbers it covers, winnings per coin).
+# Names are what players type; parse_roulette_bet maps the aliases.
+def _roulette_bets():
+    bets = {}
+    for n in range(37):
+        bets[str(n)] = ({n}, 35)
+    # Splits: two numbers next to each other on the layout (3 per row), and 0 with 1, 2 or 3
+    for n in range(1, 37):
+        if n % 3 != 0:
+            bets[f"{n}-{n + 1}"] = ({n, n + 1}, 17)
+        if n <= 33:
+            bets[f"{n}-{n + 3}"] = ({n, n + 3}, 17)
+    for n in (1, 2, 3):
+        bets[f"0-{n}"] = ({0, n}, 17)
+    for i in range(3):
+        bets[f"dozen{i + 1}"] = (set(range(12 * i + 1, 12 * i + 13)), 2)
+        bets[f"col{i + 1}"] = ({n for n in range(1, 37) if (n - 1) % 3 == i}, 2)
+    bets["red"] = (set(ROULETTE_RED), 1)
+    bets["black"] = (set(range(1, 37)) - ROULETTE_RED, 1)
+    bets["odd"] = (set(range(1, 37, 2)), 1)
+    bets["even"] = (set(range(2, 37, 2)), 1)
+    bets["low"] = (set(range(1, 19)), 1)
+    bets["high"] = (set(range(19, 37)), 1)
+    return bets
+
+ROULETTE_BETS = _roulette_bets()
+ROULETTE_BET_NAMES = list(ROULETTE_BETS)
+ROULETTE_BET_INDEX = {name: i for i, name in enumerate(ROULETTE_BET_NAMES)}
+
+# Coins returned per coin bet, bet included: ROULETTE_MATRIX[number][bet index]
+ROULETTE_MATRIX = [
+    [payout + 1 if number in numbers else 0 for numbers, payout in ROULETTE_BETS.values()]
+    for number in range(37)
+]
+
+_ROULETTE_ALIASES = {
+    "green": "0", "zero": "0",
+    "1st12": "dozen1", "2nd12": "dozen2", "3rd12": "dozen3",
+    "1-18": "low", "19-36": "high",
+    "column1": "col1", "column2": "col2", "column3": "col3",
+}
+
+# Canonical bet name for what the player typed, or None if it isn't a bet
+def parse_roulette_bet(text):
+    text = text.strip().lower().replace(" ", "")
+    text = _ROULETTE_ALIASES.get(text, text)
+    if "-" in text:
+        low, _, high = text.partition("-")
+        if low.isdigit() and high.isdigit():
+            text = f"{min(int(low), int(high))}-{max(int(low), int(high))}"
+    elif text.isdigit():
+        text = str(int(text))
+    return text if text in ROULETTE_BETS else None
+
+# The outcome: an index into ROULETTE_WHEEL. Draw this first, everything
+# else (number, color, animation) follows from it.
+def spin_roulette(rng=random):
+    return rng.randrange(len(ROULETTE_WHEEL))
+
+# Coins returned for every (key, bet name, amount) in `bets`, bet included.
+# One spin settles a whole table with one row of the matrix.
+def settle_roulette(pocket, bets):
+    row = ROULETTE_MATRIX[ROULETTE_WHEEL[pocket]]
+    payouts = {}
+    for key, name, amount in bets:
+        payouts[key] = payouts.get(key, 0) + amount * row[ROULETTE_BET_INDEX[name]]
+    return payouts
+
+# Animation: ROULETTE_FRAMES[pocket] is every frame of a spin that lands on
+# `pocket`, built once here. The last frame has it in the middle.
+def _roulette_window(center):
+    half = ROULETTE_WINDOW // 2
+    pockets = [ROULETTE_WHEEL[(center + offset) % len(ROULETTE_WHEEL)] for offset in range(-half, half + 1)]
+    arrow_line = "ㅤㅤ" * half + "⬇️"
+    return f"{arrow_line}\n🎡 {' '.join(ROULETTE_EMOJIS[roulette_color(n)] for n in pockets)} 🎡"
+
+_ROULETTE_WINDOWS = [_roulette_window(center) for center in range(len(ROULETTE_WHEEL))]
+ROULETTE_FRAMES = [
+    tuple(_ROULETTE_WINDOWS[(pocket - ROULETTE_SPIN_FRAMES + 1 + i) % len(ROULETTE_WHEEL)] for i in range(ROULETTE_SPIN_FRAMES))
+    for pocket in range(len(ROULETTE_WHEEL))
+]
+
+# ---------------------------- CRASH ----------------------------
+
+CRASH_GROWTH_RATE = 0.1  # Multiplier is e^(rate * seconds in flight): x2 at ~7s, x5 at ~16s
+
+# Randomly choose a crash multiplier between 1.05x and 5.0x
+def get_skewed_crash_point(rng=random):
+    r = rng.random()
+    skewed = 1.02 + (5.0 - 1.02) * (1 - r) ** 3.5
+    return max(round(skewed, 2), 1.05)
+
+# The multiplier is a function of time in flight only, so it doesn't matter
+# how late the loop wakes up or how slow an edit is
+def crash_multiplier_at(elapsed):
+    return math.exp(CRASH_GROWTH_RATE * elapsed)
+
+# Seconds in flight until the multiplier reaches `multiplier`
+def crash_time_to_reach(multiplier):
+    return math.log(multiplier) / CRASH_GROWTH_RATE
+
+# Payout for cashing out at `target`, 0 if the round crashed first
+def crash_payout(target, crash_point, bet):
+    return int(bet * target) if target < crash_point else 0
+
+# ---------------------------- MINES ----------------------------
+
+MINES_TILES = 25
+MINES_HOUSE_EDGE = 0.01  # Share of the fair multiplier kept by the house
+
+# Multiplier for every (mines, safe reveals) on a board of `tiles`, built
+# once per board size. Surviving k reveals with m mines has probability
+# C(tiles - m, k) / C(tiles, k); the fair multiplier is the inverse, less
+# the house edge, rounded down to 2 decimals so the displayed number is
+# exactly what pays. table[mines][safe_reveals]
+@functools.lru_cache(maxsize=None)
+def mines_table(tiles=MINES_TILES, house_edge=MINES_HOUSE_EDGE):
+    table = [[1.0]]  # 0 mines: nothing to win
+    for mines in range(1, tiles):
+        row = [1.0]
+        for reveals in range(1, tiles - mines + 1):
+            fair = math.comb(tiles, reveals) / math.comb(tiles - mines, reveals)
+            row.append(math.floor(fair * (1 - house_edge) * 100 + 1e-9) / 100)
+        table.append(row)
+    return table
+
+# Multiplier shown after `safe_reveals` safe tiles
+def mines_multiplier(mines, safe_reveals, tiles=MINES_TILES):
+    return mines_table(tiles)[mines][safe_reveals]
+
+# Bombs as a bitmask: bit i set means tile i is a mine
+def place_mines(mines, rng=random, tiles=MINES_TILES):
+    bombs = 0
+    for tile in rng.sample(range(tiles), mines):
+        bombs |= 1 << tile
+    return bombs
+
+mines_table() # Build the default board's table at import
+
+# ---------------------------- COIN FLIP ----------------------------
+
+# Returns (side assigned to the challenger, side assigned to the opponent, result)
+def flip_coin(rng=random):
+    sides = rng.sample(["Heads", "Tails"], 2)
+    return sides[0], sides[1], rng.choice(["Heads", "Tails"])
+
+# ---------------------------- BLACKJACK ----------------------------
+
+# Cards are small ints: rank * 4 + suit, 0-51. Names and values come from
+# lookup tables built once here, so nothing is allocated per card.
+RANKS = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"]
+SUIT_EMOJIS = ["♥️", "♦️", "♣️", "♠️"]
+RANK_VALUES = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11]  # Ace counts 11 until that would bust
+ACE = RANKS.index("A")
+
+CARD_STR = [f"{RANKS[card // 4]}{SUIT_EMOJIS[card % 4]}" for card in range(52)]
+CARD_VALUE = bytes(RANK_VALUES[card // 4] for card in range(52))
+CARD_IS_ACE = bytes(card // 4 == ACE for card in range(52))
+
+class Shoe:
+    # Several decks shuffled together and dealt from a bytearray, like a real
+    # table shoe. It's only reshuffled between hands once the cut card comes
+    # up, not for every hand.
+    def __init__(self, decks=6, penetration=0.75, rng=random):
+        self.decks = decks
+        self.rng = rng
+        self.cut_card = int(decks * 52 * (1 - penetration)) # Cards left when the cut card comes up
+        self.shuffle()
+
+    def shuffle(self):
+        self.cards = bytearray(range(52)) * self.decks
+        self.rng.shuffle(self.cards)
+
+    # True once the cut card has come up
+    def needs_shuffle(self):
+        return len(self.cards) <= self.cut_card
+
+    # Call before dealing a new hand
+    def start_hand(self):
+        if self.needs_shuffle():
+            self.shuffle()
+
+    def deal_card(self):
+        if not self.cards:
+            self.shuffle() # Only if a single hand ate the whole shoe
+        return self.cards.pop() # removes and returns the last card
+
+class Hand:
+    # Cards plus a running score. Each new card updates the total and the
+    # number of aces still counted as 11, instead of rescoring the hand.
+    __slots__ = ("cards", "score", "soft_aces")
+
+    def __init__(self, cards=()):
+        self.cards = bytearray()
+        self.score = 0
+        self.soft_aces = 0
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        self.cards.append(card)
+        self.score += CARD_VALUE[card]
+        self.soft_aces += CARD_IS_ACE[card]
+        # Adjust for Aces if score is over 21
+        while self.score > 21 and self.soft_aces:
+            self.score -= 10  # Count one Ace as 1 instead of 11
+            self.soft_aces -= 1
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __str__(self):
+        return " ".join(CARD_STR[card] for card in self.cards)
+
+def calculate_score(cards):
+    return Hand(cards).score
+
+DEALER_STANDS_ON = 17
+
+# Coins paid back at the end of a hand (the bet was taken up front):
+# 2 * bet for a win, bet for a tie, 0 for a loss
+def blackjack_payout(player_score, dealer_score, bet):
+    if player_score > 21:
+        return 0
+    if dealer_score > 21 or player_score > dealer_score:
+        return bet * 2
+    if player_score == dealer_score:
+        return bet
+    return 0
+
+# A whole hand with no Discord in the way, for simulate.py. The player hits
+# until reaching `stand_on`. Mirrors play_blackjack: a natural is checked
+# against the dealer's first two cards and pays even money.
+def play_blackjack_hand(shoe, bet=1, stand_on=17):
+    shoe.start_hand()
+    player_hand = Hand((shoe.deal_card(), shoe.deal_card()))
+    dealer_hand = Hand((shoe.deal_card(), shoe.deal_card()))
+
+    if player_hand.score == 21:
+        return blackjack_payout(21, dealer_hand.score, bet)
+
+    while player_hand.score < stand_on:
+        player_hand.add(shoe.deal_card())
+    if player_hand.score > 21:
+        return 0
+
+    while dealer_hand.score < DEALER_STANDS_ON:
+        dealer_hand.add(shoe.deal_card())
+    return blackjack_payout(player_hand.score, dealer_hand.score, bet)
@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from aiohttp import web, WSMsgType
+
+from economy import DAILY_REWARD
+from storage import DEFAULT_COINS
+
+# A stand-in for Discord's gateway and REST API, to try the sharded bot
+# (see shards.py) on one machine without a real token:
+#
+#   python fakegateway.py --shards 4 --guilds 40
+#   DISCORD_API_BASE=http://127.0.0.1:8900/api/v10 DISCORD_TOKEN=fake \
+#       ECONOMY_BACKEND=sqlite python shards.py --processes 2 --shards 4
+#
+# Every shard that identifies gets READY and a GUILD_CREATE for each guild
+# Discord would route to it ((guild_id >> 22) % shard_count). Once all the
+# shards are up it plays a few commands as made-up users and checks the
+# processes agree with each other:
+#
+#   - /daily in a guild on one shard, then /balance in a guild on another:
+#     the balance has to include the daily reward
+#   - /leaderboard from every shard for the same user: every shard has to
+#     answer with the same board
+#
+# Then it prints a report and keeps serving until Ctrl+C.
+
+APP_ID = 100000000000000000
+BOT_USER = {"id": str(APP_ID), "username": "casino", "discriminator": "0", "global_name": None, "avatar": None, "bot": True}
+EPOCH = 1420070400000 # Discord's snowflake epoch, ms
+
+_ids = itertools.count()
+
+def snowflake():
+    return str(((int(time.time() * 1000) - EPOCH) << 22) | (next(_ids) & 0x3FFFFF))
+
+# Discord's exact content type; py-cord only parses the body as JSON on an exact match
+def json_response(data, status=200):
+    return web.Response(body=json.dumps(data).encode(), status=status, headers={"Content-Type": "application/json"})
+
+def fake_user(user_id):
+    return {"id": str(user_id), "username": f"player{str(user_id)[-4:]}", "discriminator": "0", "global_name": None, "avatar": None}
+
+def fake_message(channel_id, content):
+    return {
+        "id": snowflake(), "channel_id": str(channel_id), "author": BOT_USER, "content": content or "",
+        "timestamp": "2026-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+        "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+        "embeds": [], "pinned": False, "type": 0, "flags": 0, "components": []
+    }
+
+
+class FakeDiscord:
+    def __init__(self, host, port, shard_count, guild_count):
+        self.host = host
+        self.port = port
+        self.shard_count = shard_count
+        self.shards = {}        # shard id -> open websocket
+        self.identified = {}    # shard id -> times it identified
+        self.guilds = {}        # guild id -> {"id", "channel_id", "shard"}
+        self.commands = {}      # command name -> id handed out on sync
+        self.pending = {}       # interaction token -> future for the first response
+        self.answered = {}      # shard id -> interactions answered
+        self.latencies = []
+        self.timeouts = 0
+        self.all_up = asyncio.Event()
+
+        # Guild ids spread evenly over the shards, the way Discord routes them
+        base = int(time.time() * 1000) - EPOCH
+        for i in range(guild_count):
+            guild_id = ((base + i) << 22) | random.getrandbits(22)
+            self.guilds[guild_id] = {"id": guild_id, "channel_id": int(snowflake()), "shard": (guild_id >> 22) % shard_count}
+
+    @property
+    def gateway_url(self):
+        return f"ws://{self.host}:{self.port}/gateway"
+
+    def guilds_on(self, shard_id):
+        return [guild for guild in self.guilds.values() if guild["shard"] == shard_id]
+
+    # ---------------------------- REST ----------------------------
+
+    def routes(self):
+        return [
+            web.get("/api/v10/users/@me", self.me),
+            web.get("/api/v10/users/{user_id}", self.user),
+            web.get("/api/v10/gateway", self.gateway),
+            web.get("/api/v10/gateway/bot", self.gateway_bot),
+            web.get("/api/v10/applications/{app_id}/commands", self.get_commands),
+            web.put("/api/v10/applications/{app_id}/commands", self.put_commands),
+            web.post("/api/v10/interactions/{interaction_id}/{token}/callback", self.interaction_callback),
+            web.post("/api/v10/webhooks/{app_id}/{token}", self.followup),
+            web.patch("/api/v10/webhooks/{app_id}/{token}/messages/{message_id}", self.edit_followup),
+            web.get("/gateway", self.websocket),
+            web.route("*", "/{path:.*}", self.unknown),
+        ]
+
+    async def me(self, request):
+        return json_response(BOT_USER)
+
+    async def user(self, request):
+        return json_response(fake_user(request.match_info["user_id"]))
+
+    async def gateway(self, request):
+        return json_response({"url": self.gateway_url})
+
+    async def gateway_bot(self, request):
+        return json_response({
+            "url": self.gateway_url, "shards": self.shard_count,
+            "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 16}
+        })
+
+    def _command_list(self):
+        return [
+            {"id": str(command_id), "application_id": str(APP_ID), "name": name, "description": name, "type": 1, "options": [], "version": "1"}
+            for name, command_id in self.commands.items()
+        ]
+
+    async def get_commands(self, request):
+        return json_response(self._command_list())
+
+    async def put_commands(self, request):
+        for command in await request.json():
+            self.commands.setdefault(command["name"], int(snowflake()))
+        return json_response(self._command_list())
+
+    # Interaction responses come as JSON or as a form with a payload_json field
+    async def _payload(self, request):
+        if request.content_type != "application/json":
+            form = await request.post()
+            return json.loads(form["payload_json"])
+        return await request.json()
+
+    def _answer(self, token, content):
+        future = self.pending.get(token)
+        if future is not None and not future.done():
+            future.set_result(content)
+
+    async def interaction_callback(self, request):
+        payload = await self._payload(request)
+        data = payload.get("data") or {}
+        if payload["type"] != 5: # A deferred response answers with a followup later
+            self._answer(request.match_info["token"], data.get("content"))
+        # Asked for with ?with_response=true, like py-cord does
+        resource = {"type": payload["type"]}
+        if payload["type"] == 4:
+            resource["message"] = fake_message(0, data.get("content"))
+        return json_response({"interaction": {"id": request.match_info["interaction_id"], "type": 2}, "resource": resource})
+
+    async def followup(self, request):
+        payload = await self._payload(request)
+        self._answer(request.match_info["token"], payload.get("content"))
+        return json_response(fake_message(0, payload.get("content")))
+
+    async def edit_followup(self, request):
+        payload = await self._payload(request)
+        return json_response(fake_message(0, payload.get("content")))
+
+    async def unknown(self, request):
+        print(f"fake gateway: no route for {request.method} {request.path}")
+        return json_response({"message": "Unknown route", "code": 0}, status=404)
+
+    # ---------------------------- GATEWAY ----------------------------
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        sequence = itertools.count(1)
+        shard_id = None
+
+        async def dispatch(event, data):
+            await ws.send_str(json.dumps({"op": 0, "t": event, "s": next(sequence), "d": data}))
+
+        await ws.send_str(json.dumps({"op": 10, "d": {"heartbeat_interval": 41250}}))
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(msg.data)
+            op = payload["op"]
+            if op == 1: # Heartbeat
+                await ws.send_str(json.dumps({"op": 11}))
+            elif op == 2: # Identify
+                shard_id, shard_count = payload["d"].get("shard", [0, 1])
+                if shard_count != self.shard_count:
+                    print(f"fake gateway: shard {shard_id} identified with {shard_count} shards, expected {self.shard_count}")
+                if shard_id in self.shards:
+                    print(f"fake gateway: shard {shard_id} identified twice!")
+                self.shards[shard_id] = ws
+                self.identified[shard_id] = self.identified.get(shard_id, 0) + 1
+                guilds = self.guilds_on(shard_id)
+                await dispatch("READY", {
+                    "v": 10, "user": BOT_USER, "session_id": snowflake(), "resume_gateway_url": self.gateway_url,
+                    "guilds": [{"id": str(guild["id"]), "unavailable": True} for guild in guilds],
+                    "shard": [shard_id, shard_count], "application": {"id": str(APP_ID), "flags": 0}
+                })
+                for guild in guilds:
+                    await dispatch("GUILD_CREATE", self._guild_payload(guild))
+                print(f"fake gateway: shard {shard_id} is up with {len(guilds)} guilds")
+                if len(self.shards) == self.shard_count:
+                    self.all_up.set()
+            elif op == 6: # Resume: we keep no sessions, so make it identify again
+                await ws.send_str(json.dumps({"op": 9, "d": False}))
+
+        if shard_id is not None and self.shards.get(shard_id) is ws:
+            del self.shards[shard_id]
+            self.all_up.clear()
+            print(f"fake gateway: shard {shard_id} disconnected")
+        return ws
+
+    def _guild_payload(self, guild):
+        guild_id = str(guild["id"])
+        return {
+            "id": guild_id, "name": f"Guild {guild_id[-4:]}", "icon": None, "owner_id": str(APP_ID),
+            "unavailable": False, "member_count": 1, "large": False, "features": [],
+            "roles": [{"id": guild_id, "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "colors": {"primary_color": 0, "secondary_color": None, "tertiary_color": None}, "hoist": False, "managed": False, "mentionable": False}],
+            "channels": [{"id": str(guild["channel_id"]), "type": 0, "name": "casino", "position": 0, "permission_overwrites": []}],
+            "members": [], "emojis": [], "stickers": [], "threads": [], "voice_states": [], "presences": [],
+            "stage_instances": [], "guild_scheduled_events": [], "soundboard_sounds": [],
+            "afk_timeout": 300, "verification_level": 0, "default_message_notifications": 0,
+            "explicit_content_filter": 0, "mfa_level": 0, "nsfw_level": 0, "premium_tier": 0,
+            "preferred_locale": "en-US", "system_channel_flags": 0, "joined_at": "2026-01-01T00:00:00+00:00"
+        }
+
+    # ---------------------------- SCENARIO ----------------------------
+
+    # Send a slash command from `user_id` in `guild` and wait for the first response
+    async def command(self, guild, user_id, name, timeout=10.0):
+        token = f"token{snowflake()}"
+        future = asyncio.get_running_loop().create_future()
+        self.pending[token] = future
+        interaction = {
+            "id": snowflake(), "application_id": str(APP_ID), "type": 2, "token": token, "version": 1,
+            "guild_id": str(guild["id"]), "channel_id": str(guild["channel_id"]),
+            "locale": "en-US", "guild_locale": "en-US", "app_permissions": "0", "entitlements": [],
+            "member": {"user": fake_user(user_id), "roles": [], "joined_at": "2026-01-01T00:00:00+00:00", "deaf": False, "mute": False, "permissions": "0", "flags": 0},
+            "data": {"id": str(self.commands.get(name, snowflake())), "name": name, "type": 1, "options": []}
+        }
+        started = time.perf_counter()
+        try:
+            await self.shards[guild["shard"]].send_str(json.dumps({"op": 0, "t": "INTERACTION_CREATE", "s": 0, "d": interaction}))
+            content = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, KeyError):
+            self.timeouts += 1
+            return None
+        finally:
+            del self.pending[token]
+        self.latencies.append(time.perf_counter() - started)
+        self.answered[guild["shard"]] = self.answered.get(guild["shard"], 0) + 1
+        return content
+
+    # /daily on one shard, /balance on another: both have to see the same coins
+    async def check_user(self, user_id):
+        first, second = random.sample(range(self.shard_count), 2) if self.shard_count > 1 else (0, 0)
+        await self.command(random.choice(self.guilds_on(first)), user_id, "daily")
+        content = await self.command(random.choice(self.guilds_on(second)), user_id, "balance")
+        return content is not None and f"**{DEFAULT_COINS + DAILY_REWARD} coins**" in content
+
+    async def run(self, users, concurrency, settle):
+        await self.all_up.wait()
+        await asyncio.sleep(settle) # Let every process finish on_ready
+        print(f"fake gateway: all {self.shard_count} shards up, playing {users} users")
+
+        started = time.perf_counter()
+        gate = asyncio.Semaphore(concurrency)
+        base = int(snowflake())
+
+        async def one(i):
+            async with gate:
+                return await self.check_user(base + i)
+
+        results = await asyncio.gather(*(one(i) for i in range(users)))
+        boards = [await self.command(self.guilds_on(shard)[0], base, "leaderboard") for shard in range(self.shard_count)]
+        self.report(results, boards, time.perf_counter() - started)
+
+    def report(self, results, boards, elapsed):
+        latencies = sorted(self.latencies)
+        answered = len(latencies)
+        print()
+        print(f"Shards identified:   {dict(sorted(self.identified.items()))}")
+        print(f"Answered per shard:  {dict(sorted(self.answered.items()))}")
+        print(f"Interactions:        {answered} answered, {self.timeouts} timed out in {elapsed:.1f}s")
+        if latencies:
+            print(f"Response time:       p50 {latencies[answered // 2] * 1000:.1f}ms, p99 {latencies[int(answered * 0.99)] * 1000:.1f}ms")
+        print(f"Balances across shards: {sum(results)}/{len(results)} consistent")
+        print(f"Leaderboard:         {'same on every shard' if boards[0] and len(set(boards)) == 1 else 'DIFFERENT between shards'}")
+        ok = all(results) and boards[0] and len(set(boards)) == 1 and not self.timeouts
+        print("PASS" if ok else "FAIL")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Discord gateway and REST API for testing shards.py locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--shards", type=int, default=2, help="total shard count the bot processes use")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="made-up users to check, 0 to only serve")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds to wait after the last shard is up")
+    args = parser.parse_args()
+
+    fake = FakeDiscord(args.host, args.port, args.shards, max(args.guilds, args.shards))
+
+    async def serve():
+        app = web.Application()
+        app.add_routes(fake.routes())
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, args.host, args.port).start()
+        print(f"fake gateway: listening on http://{args.host}:{args.port}/api/v10 with {args.shards} shards")
+        if args.users:
+            await fake.run(args.users, args.concurrency, args.settle)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
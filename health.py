@@ -0,0 +1,70 @@
+import json
+import time
+
+from aiohttp import web
+
+from metrics import registry
+
+# Health and metrics over HTTP, served from the bot's own event loop
+# (aiohttp already comes with py-cord):
+#   /         "I'm alive", for uptime pingers
+#   /healthz  200 when the gateway is connected and the loop isn't lagging, 503 otherwise
+#   /metrics  Prometheus text format
+
+
+class HealthServer:
+    def __init__(self, bot, watchdog, host="0.0.0.0", port=8080, max_lag=1.0):
+        self.bot = bot
+        self.watchdog = watchdog  # Loop lag comes from here (see watchdog.py)
+        self.host = host
+        self.port = port
+        self.max_lag = max_lag   # Seconds of loop lag before /healthz fails
+        self.started_at = time.time()
+        self._runner = None
+
+        registry.gauge("casino_up_seconds", "Seconds since the bot process started", function=lambda: time.time() - self.started_at)
+        registry.gauge("casino_gateway_connected", "1 if connected to the Discord gateway", function=lambda: int(self.connected()))
+        registry.gauge("casino_gateway_latency_seconds", "Heartbeat latency to the Discord gateway", function=self.latency)
+        registry.gauge("casino_guilds", "Guilds the bot is in", function=lambda: len(self.bot.guilds))
+
+    def connected(self):
+        return self.bot.is_ready() and not self.bot.is_closed()
+
+    def latency(self):
+        latency = self.bot.latency
+        return latency if latency == latency and latency != float("inf") else -1 # NaN/inf before the first heartbeat
+
+    async def home(self, request):
+        return web.Response(text="I'm alive")
+
+    async def healthz(self, request):
+        status = {
+            "gateway_connected": self.connected(),
+            "loop_lag_seconds": round(self.watchdog.lag, 4),
+            "gateway_latency_seconds": round(self.latency(), 4),
+        }
+        healthy = status["gateway_connected"] and self.watchdog.lag < self.max_lag
+        status["status"] = "ok" if healthy else "unhealthy"
+        return web.Response(text=json.dumps(status), content_type="application/json", status=200 if healthy else 503)
+
+    async def metrics(self, request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    # Safe to call again (on_ready fires on every reconnect)
+    async def start(self):
+        if self._runner is not None:
+            return
+        self.watchdog.start()
+        app = web.Application()
+        app.router.add_get("/", self.home)
+        app.router.add_get("/healthz", self.healthz)
+        app.router.add_get("/metrics", self.metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Health server listening on {self.host}:{self.port}")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
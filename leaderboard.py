@@ -0,0 +1,60 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import discord
+
+
+class UserNameCache:
+    # Display names for leaderboard rows. Checks our own cache, then the
+    # gateway's member cache, and only then hits the API - all missing users
+    # at once instead of one request after another.
+    def __init__(self, max_size=5000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._names = OrderedDict()     # user_id -> (name, expires_at), least recently used first
+
+    def _get(self, user_id):
+        entry = self._names.get(user_id)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._names[user_id]
+            return None
+        self._names.move_to_end(user_id)
+        return name
+
+    def _put(self, user_id, name):
+        self._names[user_id] = (name, time.monotonic() + self.ttl)
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    async def resolve(self, bot, user_ids):
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self._get(user_id)
+            if name is None:
+                user = bot.get_user(int(user_id))
+                if user is not None:
+                    name = user.name
+                    self._put(user_id, name)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+
+        fetched = await asyncio.gather(*(bot.fetch_user(int(user_id)) for user_id in missing), return_exceptions=True)
+        for user_id, user in zip(missing, fetched):
+            if isinstance(user, discord.NotFound):
+                name = f"User {user_id}"
+                self._put(user_id, name) # Deleted accounts won't come back
+            elif isinstance(user, Exception):
+                name = f"User {user_id}"
+            else:
+                name = user.name
+                self._put(user_id, name)
+            names[user_id] = name
+        return names
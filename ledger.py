@@ -0,0 +1,226 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import time
+
+from storage import DEFAULT_COINS, DEFAULT_LAST_DAILY
+
+
+class Ledger:
+    # Append-only record of every balance change, one short line per change:
+    #   "<seq> <user_id> <delta> <game> <unix time>"
+    #
+    # Changes are buffered and written in batches (group commit) with one
+    # fsync per batch, so a bet costs a few bytes of I/O instead of a full
+    # economy.json rewrite. Every `compact_after` entries the ledger is folded
+    # into `<path>.snap` and truncated, so replaying it at startup stays quick.
+    #
+    # Replaying snapshot + ledger gives every balance, which is how the JSON
+    # store recovers if the bot died before it wrote economy.json.
+    def __init__(self, path, commit_interval=0.05, commit_after=256, compact_after=100_000):
+        self.path = path
+        self.snapshot_path = path + ".snap"
+        self.commit_interval = commit_interval
+        self.commit_after = commit_after
+        self.compact_after = compact_after
+        self.seq = 0
+        self.durable_seq = 0    # Every entry up to this one is on disk
+        self._pending = []      # Lines recorded but not yet committed
+        self._waiters = []      # (seq, future) from committed(), resolved once that seq is on disk
+        self._uncompacted = 0   # Entries in the ledger file since the last compaction
+        self._file = None
+        self._wake = None
+        self._task = None
+        self._closing = False
+
+    # ---------------------------- RECORDING ----------------------------
+
+    def record(self, user_id, delta, game):
+        if not delta:
+            return
+        self.seq += 1
+        self._pending.append(f"{self.seq} {user_id} {delta} {game} {int(time.time())}\n")
+        if len(self._pending) >= self.commit_after and self._wake is not None:
+            self._wake.set()
+
+    # ---------------------------- RECOVERY ----------------------------
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "r") as f:
+            return json.load(f)
+
+    def _write_snapshot(self, snapshot):
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".ledger-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    # Fold every ledger entry newer than the snapshot into it. Entries the
+    # snapshot already covers are skipped by seq, so a crash between writing
+    # the snapshot and truncating the ledger never applies anything twice.
+    def _fold(self, snapshot):
+        users = snapshot["users"]
+        if not os.path.exists(self.path):
+            return snapshot, 0
+        entries = 0
+        with open(self.path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 5 or not line.endswith("\n"):
+                    continue # Torn last line from a crash mid-append
+                seq, user_id, delta, game, ts = parts
+                seq = int(seq)
+                entries += 1
+                if seq <= snapshot["seq"]:
+                    continue
+                user = users.setdefault(user_id, [DEFAULT_COINS, DEFAULT_LAST_DAILY])
+                user[0] += int(delta)
+                if game == "daily":
+                    user[1] = datetime.date.fromtimestamp(int(ts)).isoformat()
+                snapshot["seq"] = seq
+        return snapshot, entries
+
+    # Bring the store up to date with the ledger. Called once at startup,
+    # before anything else touches the store. The first run seeds the
+    # snapshot from whatever the store holds.
+    def recover(self, store):
+        self._trim_torn_tail()
+        snapshot = self._read_snapshot()
+        if snapshot is None:
+            snapshot = {
+                "seq": 0,
+                "users": {uid: [coins, store.get_user(uid)["last_daily"]] for uid, coins in store.balances()},
+            }
+            self._write_snapshot(snapshot)
+
+        snapshot, self._uncompacted = self._fold(snapshot)
+        self.seq = self.durable_seq = snapshot["seq"]
+
+        for user_id, (coins, last_daily) in snapshot["users"].items():
+            user = store.get_user(user_id)
+            if user["coins"] != coins:
+                store.set_balance(user_id, coins)
+            if user["last_daily"] < last_daily:
+                store.claim_daily(user_id, last_daily, 0) # A claim worth 0 coins just moves last_daily
+
+    # A crash mid-append can leave a torn last line. Replay skips it, but it
+    # has to go before anything is appended, or the first new entry would be
+    # glued onto it and skipped along with it on the next replay.
+    def _trim_torn_tail(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            end = keep = f.seek(0, os.SEEK_END)
+            while keep > 0:
+                start = max(0, keep - 4096)
+                f.seek(start)
+                newline = f.read(keep - start).rfind(b"\n")
+                if newline != -1:
+                    keep = start + newline + 1
+                    break
+                keep = start
+            if keep != end:
+                f.truncate(keep)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _compact(self):
+        snapshot, _ = self._fold(self._read_snapshot())
+        self._write_snapshot(snapshot)
+        self._file.truncate(0)
+
+    # ---------------------------- GROUP COMMIT ----------------------------
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a")
+
+    def _append(self, lines):
+        self._open()
+        self._file.write("".join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # Returns once every change recorded so far is on disk
+    async def committed(self):
+        if self.durable_seq >= self.seq:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((self.seq, future))
+        await future
+
+    def _committed_up_to(self, seq):
+        self.durable_seq = seq
+        waiting = []
+        for target, future in self._waiters:
+            if target > seq:
+                waiting.append((target, future))
+            elif not future.done():
+                future.set_result(None)
+        self._waiters = waiting
+
+    async def commit(self):
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        seq = self.seq
+        try:
+            await asyncio.to_thread(self._append, lines)
+        except BaseException:
+            self._pending[:0] = lines # Try again with the next batch
+            raise
+        self._committed_up_to(seq)
+        self._uncompacted += len(lines)
+        if self._uncompacted >= self.compact_after:
+            await asyncio.to_thread(self._compact)
+            self._uncompacted = 0
+
+    # Blocking commit, for when the event loop is already gone (shutdown)
+    def commit_now(self):
+        if self._pending:
+            lines, self._pending = self._pending, []
+            self._append(lines)
+            self._committed_up_to(self.seq)
+
+    async def _commit_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.commit_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.commit()
+            except Exception as e:
+                print(f"Failed to write ledger: {e}")
+
+    # Must be called from inside the running loop
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._commit_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.commit()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
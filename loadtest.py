@@ -0,0 +1,522 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import crash
+import engine
+import metrics
+import roulette
+from blackjack import play_blackjack
+from coinflip import start_open_coinflip
+from crash import play_crash
+from dispatch import inputs
+from economy import Economy, open_store
+from ledger import Ledger
+from metrics import TimedStore, count_rest_call, instrumented, storage_seconds
+from mines import play_mines, MineTile
+from render import renderer
+from roulette import play_roulette
+from slots import play_slots
+from watchdog import Watchdog
+
+# Plays thousands of games at once against the real game code, with fake
+# Discord objects instead of a connection, to find out how many games per
+# second one process can take before a big server joins:
+#
+#   python loadtest.py --games 5000 --concurrency 1000
+#   python loadtest.py --backend json,sqlite --render-rate 5/5,50/5
+#
+# Every fake API call (respond, defer, followup, edit) takes --api-latency
+# seconds, like a round trip to Discord. Scripted players press the same
+# buttons and type the same words real ones do. Animations run --speed
+# times faster (crash rounds and betting windows too); --speed 0 skips them.
+#
+# With several --backend / --render-rate values each combination runs in its
+# own process and the results are printed side by side.
+
+GAMES = ("slots", "blackjack", "mines", "coinflip", "roulette", "crash")
+DEFAULT_MIX = "slots=4,blackjack=3,mines=2,coinflip=1,roulette=1,crash=1"
+STARTING_COINS = 10 ** 9 # Nobody runs out halfway through
+
+
+# ---------------------------- FAKE DISCORD ----------------------------
+
+class FakeAPI:
+    # Every fake REST call goes through here: counted like a real one, and
+    # takes `latency` seconds
+    def __init__(self, latency):
+        self.latency = latency
+        self.ids = itertools.count(1)
+
+    async def call(self, method):
+        count_rest_call(method)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeChannel:
+    def __init__(self, api, channel_id):
+        self.api = api
+        self.id = channel_id
+
+    async def send(self, content=None, **fields):
+        await self.api.call("POST")
+        return FakeMessage(self, content, fields)
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, fields=None):
+        self.channel = channel
+        self.id = next(channel.api.ids)
+        self.content = content
+        self.view = (fields or {}).get("view")
+
+    async def edit(self, content=None, **fields):
+        await self.channel.api.call("PATCH")
+        if content is not None:
+            self.content = content
+        if "view" in fields:
+            self.view = fields["view"]
+        return self
+
+    async def delete(self):
+        await self.channel.api.call("DELETE")
+
+
+class FakeFollowup:
+    def __init__(self, channel, owner):
+        self.channel = channel
+        self.owner = owner # Context or interaction; remembers the last view it was sent
+
+    async def send(self, content=None, ephemeral=False, **fields):
+        message = await self.channel.send(content, **fields)
+        if message.view is not None:
+            self.owner.views.append(message.view)
+        return message
+
+
+class FakeResponse:
+    # interaction.response for button callbacks
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self, content=None, **fields):
+        self._done = True
+        await self.interaction.channel.api.call("POST")
+        self.interaction.replies.append(content)
+
+    async def send_message(self, content=None, ephemeral=False, **fields):
+        await self._respond(content, **fields)
+
+    async def edit_message(self, content=None, **fields):
+        await self._respond(content, **fields)
+
+    async def defer(self, ephemeral=False, invisible=True):
+        await self._respond()
+
+    async def send_modal(self, modal):
+        await self._respond()
+
+
+class FakeInteraction:
+    def __init__(self, user, channel):
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild_id = None
+        self.replies = []
+        self.views = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(channel, self)
+
+    async def original_response(self):
+        return FakeMessage(self.channel)
+
+
+class FakeContext:
+    # Just what the play_* functions use of discord.ApplicationContext
+    def __init__(self, user, channel):
+        self.author = user
+        self.channel = channel
+        self.guild_id = None
+        self.views = []     # Every view the game sent, oldest first
+        self.replies = []   # Everything passed to respond()
+        self.followup = FakeFollowup(channel, self)
+        self._deferred = False
+
+    async def respond(self, content=None, ephemeral=False, **fields):
+        await self.channel.api.call("POST")
+        self.replies.append(content)
+        if fields.get("view") is not None:
+            self.views.append(fields["view"])
+        return FakeInteraction(self.author, self.channel)
+
+    async def defer(self, ephemeral=False):
+        self._deferred = True
+        await self.channel.api.call("POST")
+
+    # A game refused to start: the only reply was an error
+    def rejected(self):
+        return len(self.replies) == 1 and not self.views and str(self.replies[0]).startswith(("❌", "⏳", "You don't"))
+
+
+class FakeTypedMessage:
+    # What on_message hands to inputs.feed
+    def __init__(self, user, channel, content):
+        self.author = user
+        self.channel = channel
+        self.content = content
+
+
+def click(view, label, user, channel):
+    button = next(item for item in view.children if getattr(item, "label", None) == label)
+    return button.callback(FakeInteraction(user, channel))
+
+
+# ---------------------------- SCRIPTED PLAYERS ----------------------------
+
+class Harness:
+    def __init__(self, economy, api, users, channels, speed, quick_share):
+        self.economy = economy
+        self.api = api
+        self.users = [FakeUser(1_000_000 + i) for i in range(users)]
+        self.channels = [FakeChannel(api, 5_000_000 + i) for i in range(channels)]
+        self.speed = speed
+        self.quick_share = quick_share
+        self.latencies = {game: [] for game in GAMES}
+        self.rejected = {game: 0 for game in GAMES}
+        self.errors = {}
+        self.playing = set()  # Users in a game right now; like real players, one game at a time
+
+    # How long a player takes to decide, scaled like the animations
+    async def think(self, low=0.3, high=1.5):
+        if self.speed:
+            await asyncio.sleep(random.uniform(low, high) / self.speed)
+        else:
+            await asyncio.sleep(0)
+
+    # A user who isn't in a game (if one turns up quickly), seated until the game ends
+    def free_user(self, seats):
+        for _ in range(20):
+            user = random.choice(self.users)
+            if user not in self.playing:
+                break
+        self.playing.add(user)
+        seats.append(user)
+        return user
+
+    def pick(self, seats):
+        return self.free_user(seats), random.choice(self.channels)
+
+    # Waits until the game asks the player for their next word (a wait other
+    # than `previous`) and returns that wait, or None if the game ended instead
+    async def next_prompt(self, user, channel, game, previous=None):
+        while not game.done():
+            waiters = inputs._waiting.get((channel.id, user.id))
+            if waiters and waiters[-1] is not previous and not waiters[-1].future.done():
+                return waiters[-1]
+            await asyncio.sleep(0.01)
+        return None
+
+    async def slots(self, seats):
+        user, channel = self.pick(seats)
+        ctx = FakeContext(user, channel)
+        await instrumented_games["slots"](ctx, random.choice((10, 50, 100)), self.economy, random.random() < self.quick_share)
+        return ctx
+
+    async def blackjack(self, seats):
+        user, channel = self.pick(seats)
+        ctx = FakeContext(user, channel)
+        game = asyncio.ensure_future(instrumented_games["blackjack"](ctx, 100, self.economy, random.random() < self.quick_share))
+        prompt = await self.next_prompt(user, channel, game)
+        while prompt is not None:
+            await self.think()
+            word = "hit" if random.random() < 0.4 else "stand"
+            if random.random() < 0.5 and ctx.views:
+                await click(ctx.views[-1], word.capitalize(), user, channel) # Button
+            else:
+                inputs.feed(FakeTypedMessage(user, channel, word))        # Typed
+            prompt = await self.next_prompt(user, channel, game, prompt)
+        await game
+        return ctx
+
+    async def mines(self, seats):
+        user, channel = self.pick(seats)
+        ctx = FakeContext(user, channel)
+        game = asyncio.ensure_future(instrumented_games["mines"](ctx, 100, random.choice((1, 3, 5)), self.economy))
+        if await self.next_prompt(user, channel, game) is not None:
+            view = ctx.views[-1]
+            tiles = [item for item in view.children if isinstance(item, MineTile)]
+            for tile in random.sample(tiles, random.randint(1, 6)):
+                await self.think(0.2, 0.8)
+                if view.game_over:
+                    break
+                await tile.callback(FakeInteraction(user, channel))
+            if not view.game_over:
+                inputs.feed(FakeTypedMessage(user, channel, "cash out"))
+        await game
+        return ctx
+
+    async def coinflip(self, seats):
+        (challenger, channel), opponent = self.pick(seats), self.free_user(seats)
+        ctx = FakeContext(challenger, channel)
+        await instrumented_games["coinflip"](ctx, 100, self.economy)
+        if ctx.views:
+            await self.think()
+            # Either take it with the button, or with a /cf for the same bet
+            # (which pairs with the oldest open challenge in the channel)
+            if random.random() < 0.5:
+                await click(ctx.views[-1], "Accept", opponent, channel)
+            else:
+                await instrumented_games["coinflip"](FakeContext(opponent, channel), 100, self.economy)
+        return ctx
+
+    async def roulette(self, seats):
+        user, channel = self.pick(seats)
+        ctx = FakeContext(user, channel)
+        choice = ",".join(random.sample(("red", "black", "odd", "even", "17", "dozen2", "col1", "low", "0"), random.randint(1, 3)))
+        quick = random.random() < self.quick_share
+        table = None if quick else roulette.tables.get(channel.id)
+        await instrumented_games["roulette"](ctx, 10, choice, self.economy, quick)
+        # Joined a table someone else opened: the game is over when it spins
+        if table is not None and not ctx.rejected():
+            while roulette.tables.get(channel.id) is table:
+                await asyncio.sleep(0.05)
+        return ctx
+
+    async def crash(self, seats):
+        user, channel = self.pick(seats)
+        ctx = FakeContext(user, channel)
+        auto = round(random.uniform(1.1, 3.0), 2) if random.random() < 0.5 else None
+        opening = channel.id not in crash.rounds
+        crash_round = crash.rounds.get(channel.id)
+        game = asyncio.ensure_future(instrumented_games["crash"](ctx, 50, self.economy, auto))
+        if auto is None:
+            await asyncio.sleep(0)
+            crash_round = crash.rounds.get(channel.id) or crash_round
+            if crash_round is not None and user.id in crash_round.bets:
+                # Cash out by hand at some point, if the round gets that far
+                while crash_round.state != "crashed":
+                    await asyncio.sleep(0.05)
+                    if crash_round.state == "running" and random.random() < 0.1:
+                        await crash_round.view.cashout_callback(FakeInteraction(user, channel))
+                        break
+        await game
+        if not opening and crash_round is not None and not ctx.rejected():
+            await crash_round.view.wait() # Stopped when the round ends
+        return ctx
+
+    async def play(self, game):
+        seats = []
+        started = time.perf_counter()
+        try:
+            ctx = await getattr(self, game)(seats)
+        except Exception as e:
+            name = f"{game}: {type(e).__name__}: {e}"
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return
+        finally:
+            self.playing.difference_update(seats)
+        if ctx.rejected():
+            self.rejected[game] += 1
+        else:
+            self.latencies[game].append(time.perf_counter() - started)
+
+
+# The game entry points wrapped like slash commands, so metrics.py counts them
+# per game the same way it does in the bot
+instrumented_games = {}
+for name, play in (("slots", play_slots), ("blackjack", play_blackjack), ("mines", play_mines),
+                   ("coinflip", start_open_coinflip), ("roulette", play_roulette), ("crash", play_crash)):
+    async def command(*args, _play=play):
+        return await _play(*args)
+    command.__name__ = name
+    instrumented_games[name] = instrumented(command)
+
+
+# ---------------------------- ONE RUN ----------------------------
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        game, _, weight = part.partition("=")
+        if game.strip() not in GAMES:
+            raise ValueError(f"Unknown game {game!r}; pick from {', '.join(GAMES)}")
+        weights[game.strip()] = float(weight or 1)
+    return weights
+
+def apply_speed(speed):
+    # Animations, betting windows and the crash multiplier all run `speed` times faster
+    metrics.animation_scale = 1 / speed if speed else 0
+    for module in (crash, roulette):
+        module.BETTING_WINDOW = max(1, round(module.BETTING_WINDOW / speed)) if speed else 1
+    if speed:
+        engine.CRASH_GROWTH_RATE *= speed
+        crash.FRAME_INTERVAL /= speed
+
+async def run(args, directory):
+    apply_speed(args.speed)
+    rate, _, per = args.render_rate.partition("/")
+    renderer.rate, renderer.per = int(rate), float(per or 5)
+
+    json_path = os.path.join(directory, "economy.json")
+    store = TimedStore(open_store(args.backend, json_path, os.path.join(directory, "economy.db")))
+    economy = Economy(store, Ledger(os.path.join(directory, "economy.ledger")) if args.backend == "json" else None)
+    economy.start()
+
+    watchdog = Watchdog(threshold=0.1)
+    watchdog.start()
+
+    harness = Harness(economy, FakeAPI(args.api_latency), args.users, args.channels, args.speed, args.quick)
+    for user in harness.users:
+        await economy.set_balance(user.id, STARTING_COINS, "loadtest")
+    store_calls_before = sum(storage_seconds.count(op=op) for (op,) in storage_seconds.label_values())
+    waits_before, wait_seconds_before = economy.lock_waits, economy.lock_wait_seconds
+
+    weights = parse_mix(args.mix)
+    games = random.choices(list(weights), weights=list(weights.values()), k=args.games)
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(game):
+        async with gate:
+            await harness.play(game)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(game) for game in games))
+    elapsed = time.perf_counter() - started
+    await economy.close()
+
+    store_ops = {op: (storage_seconds.count(op=op), storage_seconds.quantile(0.99, op=op)) for (op,) in storage_seconds.label_values()}
+    played = sum(len(values) for values in harness.latencies.values())
+    every_latency = [value for values in harness.latencies.values() for value in values]
+    return {
+        "backend": args.backend,
+        "render_rate": args.render_rate,
+        "games": played,
+        "rejected": sum(harness.rejected.values()),
+        "errors": harness.errors,
+        "seconds": elapsed,
+        "games_per_second": played / elapsed,
+        "p50": percentile(every_latency, 0.5),
+        "p99": percentile(every_latency, 0.99),
+        "per_game": {
+            game: {"games": len(values), "rejected": harness.rejected[game], "p50": percentile(values, 0.5), "p99": percentile(values, 0.99)}
+            for game, values in harness.latencies.items() if values or harness.rejected[game]
+        },
+        "rest_calls": metrics.rest_calls.get(method="POST") + metrics.rest_calls.get(method="PATCH") + metrics.rest_calls.get(method="DELETE"),
+        "loop_lag_max": watchdog.max_lag,
+        "blocking": [(site, entry.seconds) for site, entry in watchdog.ranked(3)],
+        "store_calls": sum(count for count, _ in store_ops.values()) - store_calls_before,
+        "store_p99": {op: p99 for op, (_, p99) in store_ops.items()},
+        "lock_waits": economy.lock_waits - waits_before,
+        "lock_wait_seconds": economy.lock_wait_seconds - wait_seconds_before,
+    }
+
+
+# ---------------------------- REPORT ----------------------------
+
+def ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+def print_result(result):
+    print(f"\n=== backend={result['backend']} render_rate={result['render_rate']} ===")
+    print(f"{result['games']} games in {result['seconds']:.1f}s: {result['games_per_second']:.1f} games/s, "
+          f"p50 {ms(result['p50'])}, p99 {ms(result['p99'])}, {result['rejected']} rejected")
+    print(f"{'game':<10} {'games':>6} {'rejected':>8} {'p50':>8} {'p99':>8}")
+    for game, row in result["per_game"].items():
+        print(f"{game:<10} {row['games']:>6} {row['rejected']:>8} {ms(row['p50']):>8} {ms(row['p99']):>8}")
+    print(f"REST calls: {result['rest_calls']} ({result['rest_calls'] / max(result['games'], 1):.1f} per game)")
+    print(f"Loop lag: worst {ms(result['loop_lag_max'])}")
+    for site, seconds in result["blocking"]:
+        print(f"  blocked {seconds:.2f}s at {site}")
+    print(f"Store: {result['store_calls']} calls, "
+          + ", ".join(f"{op} p99<={p99 * 1e6:.0f}us" for op, p99 in sorted(result["store_p99"].items()) if p99 is not None))
+    print(f"Balance locks: {result['lock_waits']} waits, {result['lock_wait_seconds']:.2f}s waited")
+    for error, count in result["errors"].items():
+        print(f"  {count}x {error}")
+
+def print_comparison(results):
+    print("\n=== comparison ===")
+    print(f"{'backend':<8} {'render':>7} {'games/s':>9} {'p50':>8} {'p99':>8} {'lag max':>8} {'lock waits':>10} {'store calls':>11}")
+    for r in results:
+        print(f"{r['backend']:<8} {r['render_rate']:>7} {r['games_per_second']:>9.1f} {ms(r['p50']):>8} {ms(r['p99']):>8} "
+              f"{ms(r['loop_lag_max']):>8} {r['lock_waits']:>10} {r['store_calls']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the games with fake Discord objects")
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500, help="games in progress at once")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="game=weight, comma separated")
+    parser.add_argument("--quick", type=float, default=0.3, help="share of games played in quick mode")
+    parser.add_argument("--speed", type=float, default=10.0, help="animation speed-up, 0 skips animations")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="seconds per fake Discord API call")
+    parser.add_argument("--backend", default="json", help="json, sqlite, or both comma separated to compare")
+    parser.add_argument("--render-rate", default="5/5", help="message edits per channel: edits/seconds, comma separated to compare")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print the result as JSON only")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    backends = args.backend.split(",")
+    render_rates = args.render_rate.split(",")
+    if len(backends) == 1 and len(render_rates) == 1:
+        if args.seed is not None:
+            random.seed(args.seed)
+        with tempfile.TemporaryDirectory(prefix="casino-loadtest-") as directory:
+            result = asyncio.run(run(args, directory))
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_result(result)
+        return
+
+    # Several configurations: one fresh process each, so nothing carries over
+    results = []
+    for backend, render_rate in itertools.product(backends, render_rates):
+        command = [sys.executable, os.path.abspath(__file__), "--json", "--backend", backend, "--render-rate", render_rate]
+        for option in ("games", "concurrency", "users", "channels", "mix", "quick", "speed", "api_latency", "seed"):
+            value = getattr(args, option)
+            if value is not None:
+                command += [f"--{option.replace('_', '-')}", str(value)]
+        print(f"Running backend={backend} render_rate={render_rate}...")
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    for result in results:
+        print_result(result)
+    print_comparison(results)
+
+
+if __name__ == "__main__":
+    main()
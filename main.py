@@ -1,199 +1,380 @@
+import time
+STARTED = time.perf_counter() # Startup timing starts before the imports (see startup_step)
+
 import discord
 import os
-import json
 import datetime
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 import random
 import asyncio
-from flask import Flask
-from threading import Thread
 from discord.ext import commands # We want to be able to use commands
 from dotenv import load_dotenv
 from slots import play_slots
-from blackjack import play_blackjack
-from roulette import play_roulette
-from coinflip import start_open_coinflip
+from blackjack import play_blackjack, tables as blackjack_tables
+from roulette import play_roulette, tables as roulette_tables
+from coinflip import start_open_coinflip, challenges as coinflip_challenges
 from mines import play_mines
-from crash import play_crash
-
+from crash import play_crash, rounds as crash_rounds
+from economy import Economy, open_store
+from ledger import Ledger
+from leaderboard import UserNameCache
+from dispatch import inputs
+from sessions import sessions
+from rng import fair, verify_seed
+from health import HealthServer
+from watchdog import Watchdog
+from metrics import registry, instrumented, install_http_hooks, TimedStore, command_summary
+
+# How long each step of startup took, printed once the bot is ready
+startup_steps = []
+startup_mark = STARTED
+def startup_step(name):
+  global startup_mark
+  now = time.perf_counter()
+  startup_steps.append((name, now - startup_mark))
+  startup_mark = now
+
+startup_step("imports")
 
 # Load token from .env
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 
+# Point the bot at another API, e.g. fakegateway.py for testing shards locally.
+# Every request URL (webhooks and the gateway lookup too) is Route.base + path
+if os.getenv("DISCORD_API_BASE"):
+  discord.http.Route.base = os.getenv("DISCORD_API_BASE").rstrip("/")
+
+# Started by shards.py: this process runs SHARD_IDS out of SHARD_COUNT shards,
+# and is number SHARD_PROCESS of SHARD_PROCESSES
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_PROCESS = int(os.getenv("SHARD_PROCESS", "0"))
+SHARD_PROCESSES = int(os.getenv("SHARD_PROCESSES", "1"))
+SYNCS_COMMANDS = SHARD_PROCESS == 0 # Commands are global; one process registering them is enough
+# Commands are only sent to Discord when they change since the last sync
+# (see sync_commands_if_changed); FORCE_COMMAND_SYNC=1 sends them anyway
+COMMANDS_HASH_FILE = "commands.hash"
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC") == "1"
+
 # Create a bot instance
 intents = discord.Intents.default()
 intents.message_content = True
-bot = discord.Bot(intents=intents)
+if SHARD_COUNT:
+  bot = discord.AutoShardedBot(
+    intents=intents,
+    shard_count=SHARD_COUNT,
+    shard_ids=[int(shard_id) for shard_id in os.getenv("SHARD_IDS").split(",")],
+    auto_sync_commands=False
+  )
+else:
+  bot = discord.Bot(intents=intents, auto_sync_commands=False)
 
 ECONOMY_FILE = "economy.json"
+ECONOMY_DB = "economy.db"
+ECONOMY_LEDGER = "economy.ledger"
+# Bets of mines and crash games still in progress (see sessions.py), one file per process
+SESSIONS_JOURNAL = "sessions.journal" if SHARD_PROCESSES == 1 else f"sessions.{SHARD_PROCESS}.journal"
+sessions.limit = int(os.getenv("MAX_SESSIONS", "10000"))
+ECONOMY_BACKEND = os.getenv("ECONOMY_BACKEND", "json") # "json" or "sqlite"
+if SHARD_PROCESSES > 1 and ECONOMY_BACKEND != "sqlite":
+  raise ValueError("Sharded processes share balances through SQLite; set ECONOMY_BACKEND=sqlite.")
+# The JSON store only writes economy.json every few seconds, so it keeps a
+# ledger of every change to recover from. SQLite commits each change itself.
+def open_economy():
+  started = time.perf_counter()
+  opened = Economy(
+    TimedStore(open_store(ECONOMY_BACKEND, ECONOMY_FILE, ECONOMY_DB)), # Every store call is timed for /metrics
+    Ledger(ECONOMY_LEDGER) if ECONOMY_BACKEND == "json" else None
+  )
+  sessions.recover(opened, SESSIONS_JOURNAL) # Refund games the last run didn't get to finish
+  return opened, time.perf_counter() - started
+
+# Reading every balance (and replaying the ledger) takes seconds with a big
+# economy.json, so it happens in a thread while the bot logs in and connects.
+# Nothing touches `economy` before economy_ready has swapped it in.
+economy = None
+economy_loading = ThreadPoolExecutor(max_workers=1, thread_name_prefix="economy-load").submit(open_economy)
+
+async def economy_ready(ctx=None):
+  global economy
+  if economy is None:
+    economy, seconds = await asyncio.wrap_future(economy_loading)
+    print(f"Loaded balances in {seconds:.2f}s")
+  return economy
+
+# Commands that arrive before the balances are loaded wait for them
+bot.before_invoke(economy_ready)
+
+# Every process hands out its own round ids, so they never clash
+fair.partition(SHARD_PROCESS, SHARD_PROCESSES)
+
+LEADERBOARD_PAGE_SIZE = 10
+user_names = UserNameCache()
+
+# Count every Discord REST call, per command (see metrics.py)
+install_http_hooks()
+
+# Loop lag and blocking call sites (see watchdog.py). WATCHDOG_THRESHOLD is
+# how long (seconds) the loop may be stuck before we look at what's doing it;
+# WATCHDOG_ASYNCIO_DEBUG=1 also turns on asyncio's slow callback reports.
+watchdog = Watchdog(
+  threshold=float(os.getenv("WATCHDOG_THRESHOLD", "0.25")),
+  asyncio_debug=os.getenv("WATCHDOG_ASYNCIO_DEBUG") == "1"
+)
+
+# /healthz and /metrics, on the bot's own loop (see health.py)
+health = HealthServer(bot, watchdog, port=int(os.getenv("HEALTH_PORT", "8080")) + SHARD_PROCESS)
+registry.gauge("casino_crash_rounds", "Crash rounds running", function=lambda: len(crash_rounds))
+registry.gauge("casino_roulette_tables", "Roulette tables open", function=lambda: len(roulette_tables))
+registry.gauge("casino_economy_lock_waits", "Balance changes that waited for another change to the same user", function=lambda: economy.lock_waits)
+registry.gauge("casino_economy_lock_wait_seconds", "Time balance changes spent waiting on each other", function=lambda: economy.lock_wait_seconds)
+registry.gauge("casino_blackjack_tables", "Blackjack shoes in use", function=lambda: len(blackjack_tables))
+registry.gauge("casino_coinflip_challenges", "Open coin flip challenges", function=lambda: len(coinflip_challenges))
+registry.gauge("casino_coinflip_expired", "Coin flip challenges nobody took", function=lambda: coinflip_challenges.expired)
+registry.gauge("casino_sessions", "Mines and crash bets in play", function=lambda: len(sessions))
+registry.gauge("casino_sessions_expired", "Games ended by their idle timeout", function=lambda: sessions.expired)
+
+# ---------------------------- COMMAND SYNC ----------------------------
+
+# Some fields (contexts, integration_types) come from sets, so their order
+# changes from run to run; lists of plain values are sorted before hashing
+def canonical(value):
+  if isinstance(value, dict):
+    return {key: canonical(item) for key, item in value.items()}
+  if isinstance(value, list):
+    items = [canonical(item) for item in value]
+    return sorted(items) if all(isinstance(item, (int, str)) for item in items) else items
+  return value
+
+# Hash of every slash command as it would be sent to Discord, and of the
+# application it's registered to
+def command_schema_hash():
+  schema = sorted((canonical(command.to_dict()) for command in bot.pending_application_commands), key=lambda command: command["name"])
+  return hashlib.sha256(json.dumps([bot.user.id, schema], sort_keys=True, default=str).encode()).hexdigest()
+
+# Syncing costs several REST calls and counts against the global rate limit,
+# so only do it when the commands changed since the last successful sync.
+# Without a sync the bot still answers by command name.
+async def sync_commands_if_changed():
+  schema_hash = command_schema_hash()
+  try:
+    with open(COMMANDS_HASH_FILE) as f:
+      synced_hash = f.read().strip()
+  except FileNotFoundError:
+    synced_hash = None
+  if schema_hash == synced_hash and not FORCE_COMMAND_SYNC:
+    return "commands unchanged"
+
+  try:
+    await bot.sync_commands()
+  except discord.HTTPException as e:
+    print(f"Syncing slash commands failed, will try again next start: {e}")
+    return "command sync failed"
+  with open(COMMANDS_HASH_FILE, "w") as f:
+    f.write(schema_hash)
+  return "command sync"
+
 
-# Creating a flask server instance
-app = Flask('') # using default name
-
-# Define a route (web page) for the root URL
-@app.route('/')
-def home():
-  return "I'm alive" # This shows up when you go to the web page
-
-# Define a function to run the Flask app
-def run():
-  app.run(host='0.0.0.0', port=8080)
-
-# Define a function to keep the Flask app alive
-def keep_alive():
-  # Create and start a thread to run the Flask app
-  t = Thread(target=run)
-  t.start()
-
-# ---------------------------- CLASS DEFINITIONS ----------------------------
-
-
-# ---------------------------- HELPER FUNCTIONS ----------------------------
-
-# Helper function to load and save user data
-def load_data():
-  if not os.path.exists(ECONOMY_FILE):
-    return {}
-  with open(ECONOMY_FILE, "r") as f:
-    return json.load(f)
-
-def save_data(data):
-  with open(ECONOMY_FILE, "w") as f:
-    json.dump(data, f, indent=4)
-
-# Get or create user balance
-def get_balance(user_id):
-  data = load_data()
-  user_id_str = str(user_id)
-  if user_id_str not in data:
-    data[user_id_str] = {"coins": 1000, "last_daily": "2000-01-01"} # Start with 1000 coins
-    save_data(data)
-  return data[user_id_str]["coins"]
-
-# Update user balance
-def update_balance(user_id, amount):
-  data = load_data()
-  user_id_str = str(user_id)
-  if user_id_str not in data:
-    data[user_id_str] = {"coins": 1000, "last_daily": "2000-01-01"} # Start with 1000 coins
-  data[user_id_str]["coins"] = amount
-  save_data(data)
 
 # ---------------------------- GENERAL COMMANDS ----------------------------
       
 # Command: !balance
 @bot.slash_command(name="balance", description="Check your balance")
+@instrumented
 async def balance(ctx):
-  bal = get_balance(ctx.author.id)
+  bal = economy.get_balance(ctx.author.id)
   await ctx.respond(f"💰 {ctx.author.mention}, you have **{bal} coins**!")
   
 #Command: !daily
 @bot.slash_command(name="daily", description="Claim your daily coins!")
+@instrumented
 async def daily(ctx):
-    user_id = str(ctx.author.id)
-    data = load_data()
-
     today = datetime.date.today().isoformat()
-    user_data = data.get(user_id, {"coins": 1000, "last_daily": "2000-01-01"})
-
-    if user_id not in data:
-        data[user_id] = user_data  # save the initial 1000 coins
-        save_data(data)
+    claimed, coins = await economy.claim_daily(ctx.author.id, today)
 
-    if user_data["last_daily"] == today:
+    if not claimed:
         await ctx.respond(f"❌ {ctx.author.mention}, you've already claimed your daily coins today!")
     else:
-        user_data["coins"] += 100
-        user_data["last_daily"] = today
-        data[user_id] = user_data
-        save_data(data)
-        await ctx.respond(f"💰 {ctx.author.mention}, you've claimed your daily coins! You now have **{user_data['coins']} coins**!")
+        await ctx.respond(f"💰 {ctx.author.mention}, you've claimed your daily coins! You now have **{coins} coins**!")
 
 # Command: !leaderboard
 @bot.slash_command(name="leaderboard", description="View the top coin holders!")
-async def leaderboard(ctx):
-  data = load_data()
-  if not data:
-    await ctx.send("❌ No data found yet!")
+@instrumented
+async def leaderboard(ctx, page: int = 1):
+  page = max(page, 1)
+  offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+
+  # One page as (user_id, coins), richest first
+  rows = economy.top(LEADERBOARD_PAGE_SIZE, offset)
+  if not rows:
+    await ctx.respond("❌ No data found yet!" if page == 1 else f"❌ There is no page {page}.", ephemeral=True)
     return
 
-# Convert to list of tuples, (user_id, coins)
-  leaderboard_data = []
-  for user_id, user_data in data.items():
-    # Skip if user_data is an int 
-    if isinstance(user_data, dict) and "coins" in user_data:
-      leaderboard_data.append((user_id, user_data["coins"]))
-
-  # Sort by coins descending
-  leaderboard_data.sort(key=lambda x: x[1], reverse=True)
-
-  # Limit to top 10
-  top_10 = leaderboard_data[:10]
+  names = await user_names.resolve(bot, [user_id for user_id, _ in rows])
 
   # Format the message
-  message = ["🏆 **Top Coin Holders** 🏆"]
-  for i, (user_id, coins) in enumerate(top_10, start=1):
-    user = await bot.fetch_user(int(user_id))
-    name = user.name if user else f"User {user_id}"
-    message.append(f"**#{i}** - {name}: **{coins} coins**")
+  message = ["🏆 **Top Coin Holders** 🏆" if page == 1 else f"🏆 **Top Coin Holders - Page {page}** 🏆"]
+  for i, (user_id, coins) in enumerate(rows, start=offset + 1):
+    message.append(f"**#{i}** - {names[user_id]}: **{coins} coins**")
+
+  rank = economy.rank(ctx.author.id)
+  if rank is not None:
+    message.append(f"\nYou are **#{rank}**")
 
   await ctx.respond("\n".join(message))
 
+# Command: /stats-internal - where the time and API calls go, per command (admins only)
+@bot.slash_command(name="stats-internal", description="Per-command latency, API calls and storage time", default_member_permissions=discord.Permissions(administrator=True))
+@instrumented
+async def stats_internal(ctx):
+  permissions = getattr(ctx.author, "guild_permissions", None)
+  if permissions is None or not permissions.administrator:
+    await ctx.respond("❌ This command is for server admins.", ephemeral=True)
+    return
+
+  rows = command_summary()
+  if not rows:
+    await ctx.respond("No commands run yet.", ephemeral=True)
+    return
+  lines = ["command          runs  err   p50s   p99s  REST/run  store ms/run  sleep s/run"]
+  for row in rows[:20]:
+    lines.append(
+      f"{row['command']:<15} {row['runs']:>5} {row['errors']:>4} {row['p50']:>6g} {row['p99']:>6g}"
+      f" {row['rest_per_run']:>9.1f} {row['storage_ms_per_run']:>13.3f} {row['sleep_per_run']:>12.2f}"
+    )
+  report = watchdog.report(limit=8)
+  await ctx.respond(("```\n" + "\n".join(lines) + "\n\n" + report)[:1990] + "\n```", ephemeral=True)
+
+# ---------------------------- PROVABLY FAIR ----------------------------
+
+# Command: /seed [client_seed] - show or change the client seed your games use
+@bot.slash_command(name="seed", description="Show or set your client seed for provably fair games")
+@instrumented
+async def seed(ctx, client_seed: str = None):
+  if client_seed:
+    fair.set_client_seed(ctx.author.id, client_seed[:64])
+    await ctx.respond(f"🔐 Your client seed is now `{client_seed[:64]}`.", ephemeral=True)
+  else:
+    await ctx.respond(f"🔐 Your client seed is `{fair.client_seed(ctx.author.id)}`.", ephemeral=True)
+
+# Command: /verify <round>
+@bot.slash_command(name="verify", description="Check a finished game round's seeds")
+@instrumented
+async def verify(ctx, round: int):
+  fair_round = fair.lookup(round)
+  if fair_round is None and not fair.owns(round):
+    await ctx.respond(f"❌ Round #{round} was played in another server; use /verify there.", ephemeral=True)
+    return
+  if fair_round is None:
+    await ctx.respond(f"❌ Round #{round} doesn't exist or is too old.", ephemeral=True)
+    return
+  lines = [f"🔐 **Round #{fair_round.id}** ({fair_round.game})", f"Hash: `{fair_round.commitment}`", f"Client seed: `{fair_round.client_seed}`"]
+  if not fair_round.revealed:
+    lines.append("Server seed: sealed until this round is over.")
+  else:
+    server_seed = fair_round.server_seed.hex()
+    lines.append(f"Server seed: `{server_seed}`")
+    lines.append("✅ SHA-256 of the seed matches the hash." if verify_seed(server_seed, fair_round.commitment) else "❌ Seed doesn't match the hash!")
+    if fair_round.outcome:
+      lines.append(f"Outcome: {fair_round.outcome}")
+  await ctx.respond("\n".join(lines), ephemeral=True)
+
 # ---------------------------- GAME COMMANDS - See Respective .py Files ----------------------------
 
-# ---------- Command: /slots <bet> ----------
+# quick: skip the animation and get the result in one message
+# ---------- Command: /slots <bet> [quick] [spins] ----------
 @bot.slash_command(name="slots", description="Bet on slots!")
+@instrumented
 async def slots(
   ctx: discord.ApplicationContext,
-  bet: int
+  bet: int,
+  quick: bool = False,
+  spins: int = 1
 ):
-  await play_slots(ctx, bet, load_data, save_data)
+  await play_slots(ctx, bet, economy, quick, spins)
     
 # ---------- END SLOTS COMMAND ----------
 
 
-# ---------- Command: /blackjack <bet> ----------
+# ---------- Command: /blackjack <bet> [quick] ----------
 @bot.slash_command(name="blackjack", description="Play blackjack!")
-async def blackjack(ctx, bet: int):
-  await play_blackjack(ctx, bet, bot, load_data, save_data)
+@instrumented
+async def blackjack(ctx, bet: int, quick: bool = False):
+  await play_blackjack(ctx, bet, economy, quick)
   
 # ---------- END BLACKJACK COMMAND ----------
 
-# ---------- Command: /roulette <bet> <color choice> ----------
-@bot.slash_command(name="roulette", description="Bet coins on red, black, or green.")
-async def roulette(ctx, bet: int, choice: str):
-  await play_roulette(ctx, bet, choice, load_data, save_data)
+# ---------- Command: /roulette <bet> <bets> [quick] ----------
+# choice: one or more bets, comma separated - "red", "17", "17-20", "dozen2", "col1", "odd", "low"...
+@bot.slash_command(name="roulette", description="Bet on the roulette table in this channel, or open one.")
+@instrumented
+async def roulette(ctx, bet: int, choice: str, quick: bool = False):
+  await play_roulette(ctx, bet, choice, economy, quick)
 
 # ---------- END ROULETTE COMMAND ----------
 
 # ---------- Command: /cf <bet> ----------
-@bot.slash_command(name="cf", description="Open coin flip challenge!")
+# Takes a waiting challenge for the same bet if there is one, or opens one
+@bot.slash_command(name="cf", description="Coin flip: take an open challenge for this bet, or open one!")
+@instrumented
 async def coinflip(ctx: discord.ApplicationContext, bet: int):
-  await start_open_coinflip(ctx, bet, load_data, save_data)
+  await start_open_coinflip(ctx, bet, economy)
 
 # ---------- END COINFLIP COMMAND ----------
 
 # ---------- Command: /mines <mines> <bet> ----------
 @bot.slash_command(name="mines", description="Play a game of Mines!")
+@instrumented
 async def mines(ctx, bet: int, mines: int):
-  await play_mines(ctx, bet, mines, load_data, save_data, bot)
+  await play_mines(ctx, bet, mines, economy)
 # ---------- END MINES COMMAND ----------
 
-# ---------- Command: /crash <bet> ----------
-@bot.slash_command(name="crash", description="Play Crash!")
-async def crash(ctx, bet: int):
-  await play_crash(ctx, bet, load_data, save_data)
+# ---------- Command: /crash <bet> [auto_cashout] ----------
+@bot.slash_command(name="crash", description="Play Crash! Joins the round in this channel, or starts one.")
+@instrumented
+async def crash(ctx, bet: int, auto_cashout: float = None):
+  await play_crash(ctx, bet, economy, auto_cashout)
 # ---------- END CRASH COMMAND ----------
 
-# When bot is good to go
+# When bot is good to go. This runs again after a reconnect that had to
+# start a new session; everything here only needs doing once.
+started = False
 @bot.event
 async def on_ready():
+  global started
   print(f"{bot.user} is ready and online!")
-  await bot.sync_commands()
+  if started:
+    return
+  started = True
+  startup_step("login and gateway")
+
+  (await economy_ready()).start() # Background writers (JSON backend only)
+  startup_step("waiting for balances")
+  await health.start()
+  startup_step("health server")
+  if SYNCS_COMMANDS:
+    startup_step(await sync_commands_if_changed())
+
+  total = time.perf_counter() - STARTED
+  registry.gauge("casino_startup_seconds", "Seconds from process start until the bot was ready", function=lambda: total)
+  print(f"Started in {total:.2f}s: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in startup_steps))
+
+# Typed game input ("hit", "stand", "cash out") goes straight to the game waiting on that player
+@bot.event
+async def on_message(message):
+  if message.author.bot:
+    return
+  inputs.feed(message)
   
 # Run the bot
 if not TOKEN:
   raise ValueError("DISCORD_TOKEN not found in .env file.")
 
-keep_alive()
-bot.run(TOKEN)
\ No newline at end of file
+startup_step("setup")
+bot.run(TOKEN)
+if economy is not None: # Still None if the bot never got as far as loading it
+  economy.flush_now() # Write anything still pending once the bot has shut down
+  sessions.commit_now() # After the balances, so nothing is marked settled before its payout is saved
+print(watchdog.report(stacks=True))
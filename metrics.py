@@ -0,0 +1,334 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+
+# A tiny Prometheus client: counters, gauges and histograms kept in plain
+# dicts and rendered in the text exposition format for /metrics (see
+# health.py). Label values are passed as keyword arguments:
+#
+#   games_played = registry.counter("casino_games_total", "Rounds played", ("game",))
+#   games_played.inc(game="slots")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}   # label values -> value
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    # `function`, if given, is called at scrape time for the (unlabelled) value
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.function is not None:
+            self._values[()] = self.function()
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # per-bucket counts, sum, count
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    # Estimate from the buckets: the upper bound of the bucket the q-th value falls in
+    def quantile(self, q, **labels):
+        state = self._values.get(self._key(labels))
+        if not state:
+            return None
+        rank = q * state[2]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, state[0]):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+    def label_values(self):
+        return list(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    # Metrics are updated from the event loop without locking. Anything that
+    # updates them from another thread (the watchdog) holds `lock`, which
+    # render() holds too.
+    def __init__(self):
+        self._metrics = {}
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._add(Gauge(name, help, labels, function))
+
+    def histogram(self, name, help, labels=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric in self._metrics.values():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# ---------------------------- INSTRUMENTATION ----------------------------
+#
+# Each slash command runs with an _Invocation in a context variable; the
+# hooks below add to whichever invocation is current, so the cost of a
+# command (REST calls, storage time, animation sleeps) adds up without
+# passing anything around. Everything is a few additions per event.
+
+class _Invocation:
+    __slots__ = ("rest_calls", "storage_seconds", "sleep_seconds")
+
+    def __init__(self):
+        self.rest_calls = 0
+        self.storage_seconds = 0.0
+        self.sleep_seconds = 0.0
+
+current_invocation = contextvars.ContextVar("current_invocation", default=None)
+
+command_seconds = registry.histogram(
+    "casino_command_seconds", "Slash command run time, animations included", ("command",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+commands_total = registry.counter("casino_commands_total", "Slash commands run", ("command", "status"))
+command_rest_calls = registry.counter("casino_command_rest_calls_total", "Discord REST calls made by slash commands", ("command",))
+command_storage_seconds = registry.counter("casino_command_storage_seconds_total", "Time slash commands spent in the economy store", ("command",))
+command_sleep_seconds = registry.counter("casino_command_animation_sleep_seconds_total", "Time slash commands spent sleeping for animations", ("command",))
+rest_calls = registry.counter("casino_discord_requests_total", "Discord REST calls", ("method",))
+storage_seconds = registry.histogram(
+    "casino_storage_seconds", "Economy store call time", ("op",),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+
+# Wrap a slash command callback. Keeps the signature, so py-cord still sees the options:
+#
+#   @bot.slash_command(name="slots")
+#   @instrumented
+#   async def slots(ctx, bet: int): ...
+def instrumented(callback):
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        invocation = _Invocation()
+        token = current_invocation.set(invocation)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await callback(*args, **kwargs)
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            current_invocation.reset(token)
+            command_seconds.observe(time.perf_counter() - started, command=name)
+            commands_total.inc(command=name, status=status)
+            command_rest_calls.inc(invocation.rest_calls, command=name)
+            command_storage_seconds.inc(invocation.storage_seconds, command=name)
+            command_sleep_seconds.inc(invocation.sleep_seconds, command=name)
+    return wrapper
+
+# Public so fakes that skip HTTP (see loadtest.py) can count their calls too
+def count_rest_call(method):
+    rest_calls.inc(method=method)
+    invocation = current_invocation.get()
+    if invocation is not None:
+        invocation.rest_calls += 1
+
+# Count every REST call: bot API calls go through HTTPClient.request,
+# interaction responses and followups through the webhook adapter
+def install_http_hooks():
+    import discord.http
+    import discord.webhook.async_ as webhook
+
+    def hook(cls):
+        original = cls.request
+        if getattr(original, "_counted", False):
+            return
+
+        @functools.wraps(original)
+        async def request(self, route, *args, **kwargs):
+            count_rest_call(route.method)
+            return await original(self, route, *args, **kwargs)
+        request._counted = True
+        cls.request = request
+
+    hook(discord.http.HTTPClient)
+    hook(webhook.AsyncWebhookAdapter)
+
+# Every animation sleep is multiplied by this; loadtest.py turns it down,
+# 0 skips them
+animation_scale = 1.0
+
+# Sleep between animation frames, counted against the current command
+async def animation_sleep(seconds):
+    seconds *= animation_scale
+    invocation = current_invocation.get()
+    if invocation is not None:
+        invocation.sleep_seconds += seconds
+    await asyncio.sleep(seconds)
+
+
+def _observe_storage(op, elapsed):
+    storage_seconds.observe(elapsed, op=op)
+    invocation = current_invocation.get()
+    if invocation is not None:
+        invocation.storage_seconds += elapsed
+
+# A generator does its work as it's iterated, so that's what gets timed,
+# observed once when it's exhausted or dropped
+def _timed_iteration(op, iterator, elapsed):
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        _observe_storage(op, elapsed)
+
+
+class TimedStore:
+    # Wraps an economy store; every (synchronous) call is timed, and so is
+    # iterating whatever generator it returns (balances). Async methods like
+    # flush and close pass straight through.
+    def __init__(self, store):
+        self._store = store
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if not callable(attr) or inspect.iscoroutinefunction(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except BaseException:
+                _observe_storage(name, time.perf_counter() - started)
+                raise
+            if inspect.isgenerator(result):
+                return _timed_iteration(name, result, time.perf_counter() - started)
+            _observe_storage(name, time.perf_counter() - started)
+            return result
+        return timed
+
+
+# Rows for /stats-internal: one per command, most REST calls first
+def command_summary():
+    rows = []
+    for (command,) in command_seconds.label_values():
+        runs = command_seconds.count(command=command)
+        rows.append({
+            "command": command,
+            "runs": runs,
+            "errors": commands_total.get(command=command, status="error"),
+            "p50": command_seconds.quantile(0.5, command=command),
+            "p99": command_seconds.quantile(0.99, command=command),
+            "rest_per_run": command_rest_calls.get(command=command) / runs,
+            "storage_ms_per_run": 1000 * command_storage_seconds.get(command=command) / runs,
+            "sleep_per_run": command_sleep_seconds.get(command=command) / runs,
+        })
+    rows.sort(key=lambda row: row["rest_per_run"] * row["runs"], reverse=True)
+    return rows
@@ -1,127 +1,145 @@
 import discord
-import random
 import asyncio
+from render import renderer
+from dispatch import inputs
+from rng import fair
+from sessions import sessions
+from engine import mines_multiplier, mines_table, place_mines
 
 BOARD_SIZE = 5
 TILE_COUNT = BOARD_SIZE * BOARD_SIZE
+IDLE_TIMEOUT = 120 # Seconds without a move before the game ends
+CASH_OUT = ("cash out",) # What the game waits for the player to type
+mines_table(TILE_COUNT) # Multipliers for this board, worked out once
 
 class MineTile(discord.ui.Button):
     def __init__(self, x, y):
         super().__init__(label="⬛", style=discord.ButtonStyle.secondary, row=y)
         self.x = x
         self.y = y
-        self.revealed = False
+        self.bit = 1 << (y * BOARD_SIZE + x)
 
     async def callback(self, interaction: discord.Interaction):
-        if self.view.game_over or self.revealed or interaction.user != self.view.player:
+        if self.view.game_over or self.view.revealed & self.bit or interaction.user != self.view.player:
             return
 
-        self.revealed = True
-        index = self.y * BOARD_SIZE + self.x
+        self.view.revealed |= self.bit
+        if self.view.session is not None:
+            sessions.touch(self.view.session, IDLE_TIMEOUT)
 
-        if index in self.view.bombs:
+        if self.view.bombs & self.bit:
             self.style = discord.ButtonStyle.danger
             self.label = "💣"
-            self.view.game_over = True
-            self.view.reveal_mines()
+            self.view.end_game("hit a mine")
+            inputs.close(interaction.channel_id, self.view.player.id, CASH_OUT) # Nothing left to cash out
             await interaction.response.edit_message(
-                content=f"💥 You hit a mine! Game over, {interaction.user.mention}.", view=self.view
+                content=f"💥 You hit a mine! Game over, {interaction.user.mention}.\n{self.view.fair_round.label()}", view=self.view
             )
         else:
             self.style = discord.ButtonStyle.success
             self.label = "✅"
             self.view.safe_reveals += 1
-            self.view.multiplier = self.view.calculate_multiplier()
+            self.view.multiplier = mines_multiplier(self.view.mines, self.view.safe_reveals, TILE_COUNT)
             await interaction.response.edit_message(content=f"{interaction.user.mention} - Type `cash out` to stop or keep playing!\n\t\t\t\t\t\t\t\t\t **Multiplier: x{self.view.multiplier}**", view=self.view)
 
 class MinesView(discord.ui.View):
-    def __init__(self, player, bet, mines, save_data):
-        super().__init__(timeout=120)
+    # No timeout of its own: the game's session times out (see sessions.py)
+    # and the view is stopped when the game ends
+    def __init__(self, player, bet, mines, economy, session=None):
+        super().__init__(timeout=None)
         self.player = player
         self.bet = bet
         self.mines = mines
         self.game_over = False
         self.safe_reveals = 0
         self.multiplier = 1.0
-        self.bombs = set(random.sample(range(TILE_COUNT), mines))
-        self.save_data = lambda winnings: save_data(player.id, winnings)
+        self.fair_round = fair.start("mines", fair.client_seed(player.id))
+        self.bombs = place_mines(mines, self.fair_round.rng, TILE_COUNT)  # Bitmask, bit i is tile i
+        self.revealed = 0                                  # Bitmask of tiles clicked so far
+        self.economy = economy
+        self.session = session
 
         for y in range(BOARD_SIZE):
             for x in range(BOARD_SIZE):
                 self.add_item(MineTile(x, y))
 
-    def calculate_multiplier(self):
-            total_tiles = TILE_COUNT
-            safe_tiles_total = total_tiles - self.mines
-            safe_left = safe_tiles_total - self.safe_reveals
-            tiles_left = total_tiles - self.safe_reveals
+    # Game's over: show the board and publish the round's seed
+    def end_game(self, outcome):
+        self.game_over = True
+        self.reveal_mines()
+        self.stop()
+        if not self.fair_round.finished:
+            fair.finish(self.fair_round, outcome)
 
-            if safe_left <= 0 or tiles_left <= 0:
-                return round(self.multiplier, 2) # No more
-            
-            # Probability of clicking a safe tile
-            prob_safe = safe_left / tiles_left
-            return round(self.multiplier * (1 / prob_safe), 2)
-    
     # Function to reveal mines, will be used at the end of the game
     def reveal_mines(self):
-        # Loop through each button
+        hidden_bombs = self.bombs & ~self.revealed
         for item in self.children:
-            # If it is a mine tile, reveal it
-            if isinstance(item, MineTile):
-                index = item.y * BOARD_SIZE + item.x
-                if index in self.bombs and not item.revealed:
-                    item.style = discord.ButtonStyle.danger
-                    item.label = "💣"
-                    item.disabled = True
-                elif not item.revealed:
-                    item.disabled = True # Disable the rest of the tiles
+            if not isinstance(item, MineTile) or self.revealed & item.bit:
+                continue
+            if hidden_bombs & item.bit:
+                item.style = discord.ButtonStyle.danger
+                item.label = "💣"
+            item.disabled = True # Disable the rest of the tiles
     
-async def play_mines(ctx, bet, mines, load_data, save_data, bot):
-    user_id = str(ctx.author.id)
-    data = load_data()
-    if user_id not in data or data[user_id]["coins"] < bet:
-        return await ctx.respond("You don't have enough coins!", ephemeral=True)
-
-    data[user_id]["coins"] -= bet
-    save_data(data)
+async def play_mines(ctx, bet, mines, economy):
+    if bet <= 0:
+        return await ctx.respond("❌ Your bet must be greater than 0!", ephemeral=True)
+    if not 1 <= mines < TILE_COUNT:
+        return await ctx.respond(f"❌ Pick between 1 and {TILE_COUNT - 1} mines!", ephemeral=True)
 
-    view = MinesView(ctx.author, bet, mines, lambda uid, winnings: update_balance(uid, winnings, load_data, save_data))
-
-   # Respond to interaction and send actual message separately
-    await ctx.defer()  # defer interaction response
-    message = await ctx.followup.send(
-        f"{ctx.author.mention} started a game of Mines! Click tiles or type `cash out` to stop.\n\t\t\t\t\t\t\t\t\t **Multiplier: x1.0**",
-        view=view
-    )
+    user_id = ctx.author.id
+    error = sessions.refuse(user_id, "mines")
+    if error:
+        return await ctx.respond(error, ephemeral=True)
+    # Nothing typed or clicked for IDLE_TIMEOUT: stop waiting for "cash out"
+    session = sessions.open("mines", user_id, ctx.channel.id, bet, IDLE_TIMEOUT,
+                            on_expire=lambda: inputs.close(ctx.channel.id, user_id, CASH_OUT))
+    if await economy.debit(user_id, bet, "mines") is None:
+        sessions.discard(session)
+        return await ctx.respond("You don't have enough coins!", ephemeral=True)
+    try:
+        await sessions.opened(session)
+    except Exception as e:
+        print(f"Failed to journal a mines bet: {e}")
+        await economy.credit(user_id, bet, "mines") # The session is gone, give the bet back
+        return await ctx.respond("❌ Couldn't start the game right now, your bet was returned.", ephemeral=True)
 
-    # Wait for user messages with "cash out"
-    def check(m):
-        return m.author == ctx.author and m.channel == ctx.channel and m.content.lower() == "cash out"
+    view = MinesView(ctx.author, bet, mines, economy, session)
 
     try:
-        # Wait up to 120 seconds or until game is over
+        # Respond to interaction and send actual message separately
+        await ctx.defer()  # defer interaction response
+        message = await ctx.followup.send(
+            f"{ctx.author.mention} started a game of Mines! Click tiles or type `cash out` to stop.\n{view.fair_round.label()}\n\t\t\t\t\t\t\t\t\t **Multiplier: x1.0**",
+            view=view
+        )
+
+        # Wait for "cash out" until a mine ends the game or the session times out
         while not view.game_over:
-            msg = await bot.wait_for("message", check=check, timeout=120)
-            if msg.content.lower() == "cash out" and not view.game_over:
-                view.game_over = True
-                view.reveal_mines()
+            word = await inputs.expect(ctx.channel.id, user_id, CASH_OUT)
+            if word == "cash out" and not view.game_over:
                 winnings = int(bet * view.multiplier)
-                view.save_data(winnings)
-                await msg.channel.send(f"🎉 {ctx.author.mention} cashed out for **{winnings} coins**! Thanks for playing!")
-                await message.edit(view=view)
-    except asyncio.TimeoutError:
+                view.end_game(f"cashed out at x{view.multiplier}")
+                await economy.credit(user_id, winnings, "mines")
+                await ctx.channel.send(f"🎉 {ctx.author.mention} cashed out for **{winnings} coins**! Thanks for playing!\n{view.fair_round.label()}")
+                await renderer.submit(message, final=True, view=view)
+            elif session.expired and not view.game_over:
+                view.end_game("timed out")
+                await ctx.followup.send(f"⏰ Timeout! Game ended.\n{view.fair_round.label()}")
+                await renderer.submit(message, final=True, view=view)
+    except asyncio.CancelledError:
+        # The bot is shutting down: a game still going keeps its session
+        # open, so the bet is refunded on the next start
+        if view.game_over:
+            sessions.close(session)
+        else:
+            view.end_game("abandoned")
+        raise
+    except Exception:
         if not view.game_over:
-            view.game_over = True
-            view.reveal_mines()
-            await ctx.followup.send("⏰ Timeout! Game ended.")
-            await message.edit(view=view)
-
-# Update user balance
-def update_balance(user_id, amount, load_data, save_data):
-  data = load_data()
-  user_id_str = str(user_id)
-  if user_id_str not in data:
-    data[user_id_str] = {"coins": 1000, "last_daily": "2000-01-01"} # Start with 1000 coins
-  data[user_id_str]["coins"] += amount
-  save_data(data)
\ No newline at end of file
+            view.end_game("abandoned")
+            await economy.credit(user_id, bet, "mines") # Discord failed us mid-game, not the player
+        sessions.close(session)
+        raise
+    sessions.close(session) # Settled: paid out, or lost to a mine or the clock
\ No newline at end of file
@@ -0,0 +1,139 @@
+import asyncio
+from collections import OrderedDict
+
+from metrics import current_invocation
+
+
+class _Bucket:
+    # Token bucket: `rate` requests per `per` seconds, bursting up to `rate`
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = asyncio.get_running_loop().time()
+
+    def _refill(self):
+        now = asyncio.get_running_loop().time()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    def full(self):
+        self._refill()
+        return self.tokens >= self.rate
+
+    async def acquire(self):
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class _Frame:
+    __slots__ = ("message", "fields", "final", "created", "done", "invocation")
+
+    def __init__(self, message, fields, final):
+        self.message = message
+        self.fields = fields
+        self.final = final
+        self.invocation = current_invocation.get() # The command that asked for this edit
+        self.created = asyncio.get_running_loop().time()
+        self.done = asyncio.get_running_loop().create_future() # True once shown, False if dropped
+
+
+class _Channel:
+    def __init__(self, rate, per):
+        self.bucket = _Bucket(rate, per)
+        self.pending = OrderedDict()  # message id -> latest _Frame, oldest message first
+        self.task = None
+
+
+class RenderScheduler:
+    # Every game animation goes through here instead of calling message.edit
+    # itself. For each message only the newest frame is kept: if a game
+    # submits faster than Discord lets us edit, the frames in between are
+    # skipped rather than queued up. Edits are paced per channel so we stay
+    # under the channel's rate limit instead of running into 429s, and
+    # messages in a channel take turns so one busy game can't starve another.
+    #
+    # A frame that waited longer than `max_age` is dropped - a newer one is
+    # on its way or the game has moved on. Final frames (the result) are
+    # never dropped or replaced by a later animation frame.
+    def __init__(self, rate=5, per=5.0, max_age=2.0):
+        self.rate = rate
+        self.per = per
+        self.max_age = max_age
+        self._channels = {}  # channel id -> _Channel
+
+    # Queue `message.edit(**fields)`. Returns a future that resolves to True
+    # once the frame is shown, or False if it was skipped. Only final frames
+    # are worth awaiting.
+    def submit(self, message, final=False, **fields):
+        frame = _Frame(message, fields, final)
+        channel_id = message.channel.id
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = _Channel(self.rate, self.per)
+            self._channels[channel_id] = channel
+
+        old = channel.pending.get(message.id)
+        if old is not None:
+            if old.final and not final:
+                frame.done.set_result(False) # Never bury a result under an animation frame
+                return frame.done
+            old.done.set_result(False)
+        channel.pending[message.id] = frame
+
+        if channel.task is None:
+            channel.task = asyncio.create_task(self._drain(channel_id, channel))
+        return frame.done
+
+    # Forget any frame still waiting for this message
+    def cancel(self, message):
+        channel = self._channels.get(message.channel.id)
+        if channel is not None:
+            frame = channel.pending.pop(message.id, None)
+            if frame is not None:
+                frame.done.set_result(False)
+
+    async def _drain(self, channel_id, channel):
+        loop = asyncio.get_running_loop()
+        try:
+            while channel.pending:
+                _, frame = channel.pending.popitem(last=False)
+                if not frame.final and loop.time() - frame.created > self.max_age:
+                    frame.done.set_result(False)
+                    continue
+
+                # Count the edit against the command that submitted it, not
+                # whichever one started this channel's drain task
+                token = current_invocation.set(frame.invocation)
+                try:
+                    await channel.bucket.acquire()
+                    await frame.message.edit(**frame.fields)
+                    frame.done.set_result(True)
+                except Exception as e:
+                    # Not just HTTP errors: a dropped connection or a timeout
+                    # mustn't end the drain and leave games waiting forever
+                    print(f"Failed to edit message {frame.message.id}: {e!r}")
+                finally:
+                    current_invocation.reset(token)
+                    if not frame.done.done():
+                        frame.done.set_result(False) # Failed, or the drain was cancelled
+
+                # Let the bucket fill back up before forgetting the channel,
+                # otherwise the next game here would get a fresh burst
+                while not channel.pending and not channel.bucket.full():
+                    await asyncio.sleep(self.per / self.rate)
+        finally:
+            channel.task = None
+            # Only left over if the drain was cancelled: nothing will show them
+            for frame in channel.pending.values():
+                if not frame.done.done():
+                    frame.done.set_result(False)
+            channel.pending.clear()
+            if self._channels.get(channel_id) is channel:
+                del self._channels[channel_id]
+
+
+renderer = RenderScheduler()
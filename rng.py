@@ -0,0 +1,166 @@
+import hashlib
+import hmac
+import os
+import random
+from collections import OrderedDict
+
+# Provably fair randomness. Every round's outcome comes from
+#
+#   HMAC-SHA256(key=server seed, msg="<client seed>:<counter>"), counter = 0, 1, 2...
+#
+# read as a stream of bytes by FairRandom. Every round draws its own
+# random server seed. It shows the seed's SHA-256 when it starts and the
+# seed once it's over, so anyone can check the seed was fixed before any
+# bets and replay the round with the same engine code:
+#
+#   engine.get_skewed_crash_point(FairRandom(server_seed, client_seed))
+#
+# Seeds are independent of each other, so a hash or a published seed says
+# nothing about any other round, and each round is published as soon as
+# it's over, whatever else is still being played.
+
+
+class EntropyPool:
+    # os.urandom in big blocks, handed out a few bytes at a time, so drawing
+    # seeds doesn't cost a syscall each
+    def __init__(self, block_size=64 * 1024):
+        self.block_size = block_size
+        self._buffer = b""
+        self._offset = 0
+
+    def read(self, n):
+        if self._offset + n > len(self._buffer):
+            self._buffer = os.urandom(max(n, self.block_size))
+            self._offset = 0
+        data = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return data
+
+
+class FairRandom(random.Random):
+    # A random.Random whose bits all come from the HMAC stream above, so
+    # randrange, choice, sample, shuffle... are as reproducible as random().
+    # Digests are made `batch` at a time.
+    def __init__(self, server_seed, client_seed, batch=32):
+        self.server_seed = server_seed
+        self.client_seed = client_seed
+        self.batch = batch
+        self._counter = 0
+        self._buffer = b""
+        self._offset = 0
+        super().__init__()
+
+    def seed(self, *args, **kwargs):
+        pass # The seeds are fixed; random.Random.__init__ calls this
+
+    def _read(self, n):
+        while self._offset + n > len(self._buffer):
+            digests = [self._buffer[self._offset:]]
+            for counter in range(self._counter, self._counter + self.batch):
+                digests.append(hmac.digest(self.server_seed, f"{self.client_seed}:{counter}".encode(), "sha256"))
+            self._counter += self.batch
+            self._buffer = b"".join(digests)
+            self._offset = 0
+        data = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return data
+
+    def random(self):
+        return (int.from_bytes(self._read(7), "big") >> 3) / (1 << 53)  # 53 bits, like random.random
+
+    def getrandbits(self, k):
+        if k == 0:
+            return 0
+        return int.from_bytes(self._read((k + 7) // 8), "big") >> (-k % 8)
+
+    # There's no Mersenne Twister state behind this: every draw is derived
+    # from the seeds. Saving or restoring (and with them copy and pickle) is
+    # refused the way Python refuses to pickle an object it can't - a
+    # TypeError - instead of handing back the unused base class state.
+    # To get the same draws again, make a new FairRandom from the same seeds.
+    def getstate(self):
+        raise TypeError("FairRandom has no state to save, its draws come from its seeds; make a new FairRandom(server_seed, client_seed) to replay them")
+
+    def setstate(self, state):
+        raise TypeError("FairRandom has no state to restore, its draws come from its seeds; make a new FairRandom(server_seed, client_seed) to replay them")
+
+
+class FairRound:
+    __slots__ = ("id", "game", "server_seed", "commitment", "client_seed", "rng", "finished", "revealed", "outcome")
+
+    def __init__(self, round_id, game, server_seed, client_seed):
+        self.id = round_id
+        self.game = game
+        self.server_seed = server_seed
+        self.commitment = hashlib.sha256(server_seed).hexdigest()  # Shown up front
+        self.client_seed = client_seed
+        self.rng = FairRandom(server_seed, client_seed)
+        self.finished = False
+        self.revealed = False
+        self.outcome = None
+
+    # Shown with the game so players can look the round up later
+    def label(self):
+        return f"🔐 Round #{self.id} · hash `{self.commitment[:16]}`"
+
+
+class FairRNG:
+    # Hands out rounds and keeps the last `history` finished ones for /verify
+    def __init__(self, history=50_000):
+        self.history = history
+        self.pool = EntropyPool()
+        self._open = {}         # round id -> FairRound still in play
+        self._rounds = OrderedDict()  # round id -> finished FairRound, oldest first
+        self._next_id = 1
+        self._first_id = 1      # First round id this process hands out
+        self._id_step = 1       # Gap between round ids (see partition)
+        self._client_seeds = {} # user id -> client seed they picked
+
+    # With several bot processes (see shards.py) process `index` of `count`
+    # hands out ids index + 1, index + 1 + count, ... so ids never clash.
+    # Call before the first round.
+    def partition(self, index, count):
+        self._next_id = self._first_id = index + 1
+        self._id_step = count
+
+    # Whether `round_id` would have been handed out by this process
+    def owns(self, round_id):
+        return round_id > 0 and (round_id - self._first_id) % self._id_step == 0
+
+    def client_seed(self, user_id):
+        return self._client_seeds.get(user_id, str(user_id))
+
+    def set_client_seed(self, user_id, seed):
+        self._client_seeds[user_id] = seed
+
+    # Start a round. Solo games use the player's client seed; shared rounds
+    # pass something everyone can see, like the channel.
+    def start(self, game, client_seed):
+        fair_round = FairRound(self._next_id, game, self.pool.read(32), client_seed)
+        self._next_id += self._id_step
+        self._open[fair_round.id] = fair_round
+        return fair_round
+
+    # The round is settled; publish its seed
+    def finish(self, fair_round, outcome=None):
+        if fair_round.finished:
+            return
+        fair_round.finished = True
+        fair_round.revealed = True
+        fair_round.outcome = outcome
+        self._open.pop(fair_round.id, None)
+        self._rounds[fair_round.id] = fair_round
+        # Forget the oldest published rounds; rounds still in play are kept apart
+        while len(self._rounds) > self.history:
+            self._rounds.popitem(last=False)
+
+    def lookup(self, round_id):
+        return self._rounds.get(round_id) or self._open.get(round_id)
+
+
+# Check a published round: does the seed match the hash shown before it started?
+def verify_seed(server_seed_hex, commitment):
+    return hashlib.sha256(bytes.fromhex(server_seed_hex)).hexdigest() == commitment
+
+
+fair = FairRNG()
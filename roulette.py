@@ -1,71 +1,202 @@
-import random
 import asyncio
+import discord
+from render import renderer
+from rng import fair
+from metrics import animation_sleep
+from engine import (
+  spin_roulette, settle_roulette, parse_roulette_bet, roulette_color,
+  ROULETTE_WHEEL, ROULETTE_EMOJIS, ROULETTE_FRAMES
+)
 
-async def play_roulette(ctx, bet, choice, load_data, save_data):
+BETTING_WINDOW = 15       # Seconds bets stay open after someone opens the table
+MAX_BETS_PER_PLAYER = 20
+MAX_LISTED_PLAYERS = 15   # Keep the table message under Discord's length limit
+
+BET_HELP = "a number (17), a split (17-20), dozen1-3, col1-3, red, black, odd, even, low or high"
+
+# One table per channel: channel id -> RouletteRound
+tables = {}
+
+
+# "red, 17, dozen2" -> ["red", "17", "dozen2"], or None if any of them isn't a bet
+def parse_bets(choice):
+  names = [parse_roulette_bet(part) for part in choice.split(",") if part.strip()]
+  if not names or None in names:
+    return None
+  return names
+
+def result_header(pocket):
+  number = ROULETTE_WHEEL[pocket]
+  color = roulette_color(number)
+  return f"🎯 The ball landed on **{number} ({color})** {ROULETTE_EMOJIS[color]}"
+
+
+class RouletteRound:
+  # A shared table: everyone in the channel places bets during the betting
+  # window, then one spin settles all of them at once.
+  def __init__(self, channel_id, economy):
+    self.channel_id = channel_id
+    self.economy = economy
+    self.players = {}   # user id -> player
+    self.bets = []      # (user id, bet name, amount)
+    self.open = True
+    self.message = None
+    self.fair_round = fair.start("roulette", f"channel:{channel_id}")
+
+  # Place `amount` on every bet in `names`. Returns an error message, or None.
+  async def join(self, player, amount, names):
+    if not self.open:
+      return "⏳ Bets are closed for this spin, wait for the next one!"
+    placed = sum(1 for user_id, _, _ in self.bets if user_id == player.id)
+    if placed + len(names) > MAX_BETS_PER_PLAYER:
+      return f"❌ You can have at most {MAX_BETS_PER_PLAYER} bets on one spin!"
+
+    # One debit for all of them
+    if await self.economy.debit(player.id, amount * len(names), "roulette") is None:
+      return "❌ You don't have enough coins to make that bet!"
+    if not self.open:
+      # The spin started while the bet was being taken
+      await self.economy.credit(player.id, amount * len(names), "roulette")
+      return "⏳ Bets are closed for this spin, wait for the next one!"
+    self.players[player.id] = player
+    self.bets.extend((player.id, name, amount) for name in names)
+    return None
+
+  # Call the spin off before it starts: close the table and give everyone
+  # who already bet their coins back
+  async def cancel(self):
+    if tables.get(self.channel_id) is self:
+      del tables[self.channel_id]
+    self.open = False
+    fair.finish(self.fair_round, "cancelled")
+    for user_id, _, amount in self.bets:
+      await self.economy.credit(user_id, amount, "roulette")
+
+  def render(self, header):
+    lines = [header, self.fair_round.label()]
+    by_player = {}
+    for user_id, name, amount in self.bets:
+      by_player.setdefault(user_id, []).append(f"{amount} on {name}")
+    for user_id, placed in list(by_player.items())[:MAX_LISTED_PLAYERS]:
+      lines.append(f"🎲 {self.players[user_id].mention}: {', '.join(placed)}")
+    if len(by_player) > MAX_LISTED_PLAYERS:
+      lines.append(f"...and {len(by_player) - MAX_LISTED_PLAYERS} more")
+    return "\n".join(lines)
+
+  def render_results(self, pocket, payouts):
+    staked = {}
+    for user_id, _, amount in self.bets:
+      staked[user_id] = staked.get(user_id, 0) + amount
+    lines = [result_header(pocket), self.fair_round.label()]
+    for user_id in list(staked)[:MAX_LISTED_PLAYERS]:
+      net = payouts[user_id] - staked[user_id]
+      mention = self.players[user_id].mention
+      if net > 0:
+        lines.append(f"🎉 {mention} won **{net} coins**!")
+      elif net == 0:
+        lines.append(f"🤝 {mention} broke even.")
+      else:
+        lines.append(f"😔 {mention} lost **{-net} coins**.")
+    if len(staked) > MAX_LISTED_PLAYERS:
+      lines.append(f"...and {len(staked) - MAX_LISTED_PLAYERS} more")
+    return "\n".join(lines)
+
+  async def run(self):
+    try:
+      for remaining in range(BETTING_WINDOW, 0, -1):
+        renderer.submit(
+          self.message,
+          content=self.render(f"🎡 Roulette spins in **{remaining}s** - use `/roulette` to place bets!")
+        )
+        await asyncio.sleep(1)
+      self.open = False
+
+      # The outcome comes first; the animation is just its precomputed frames
+      pocket = spin_roulette(self.fair_round.rng)
+      for i, frame in enumerate(ROULETTE_FRAMES[pocket]):
+        renderer.submit(self.message, content=frame)
+        await animation_sleep(0.05 + i * 0.03)
+      await animation_sleep(0.3)
+
+      # Settle the whole table in one pass, one credit per winning player
+      payouts = settle_roulette(pocket, self.bets)
+      for user_id, payout in payouts.items():
+        if payout:
+          await self.economy.credit(user_id, payout, "roulette")
+      fair.finish(self.fair_round, f"landed on {ROULETTE_WHEEL[pocket]}")
+      await renderer.submit(self.message, final=True, content=self.render_results(pocket, payouts))
+    finally:
+      if not self.fair_round.finished:
+        fair.finish(self.fair_round, "cancelled")
+      if tables.get(self.channel_id) is self:
+        del tables[self.channel_id]
+
+
+async def play_roulette(ctx, bet, choice, economy, quick=False):
   if bet <= 0:
-      await ctx.respond("❌ Your bet must be greater than 0!", ephemeral=True)
-      return
-
-  valid_choices = ["red", "black", "green"]
-  if choice.lower() not in valid_choices:
-      await ctx.respond(f"❌ Invalid choice! Please choose from {', '.join(valid_choices)}.", ephemeral=True)
-      return
-
-  user_id = str(ctx.author.id)
-  data = load_data()
-  user_data = data.get(user_id, {"coins": 0, "last_daily": "2000-01-01"})
-
-  if user_data["coins"] < bet:
-      await ctx.respond("❌ You don't have enough coins to make that bet!", ephemeral=True)
-      return
-
-  await ctx.defer()
-
-  # Create an alternating red/black wheel with one green
-  wheel = []
-  for i in range(36):
-      wheel.append("🔴" if i % 2 == 0 else "⚫")
-  green_index = random.randint(0, len(wheel))
-  wheel.insert(green_index, "🟢")  # Add one green spot
-
-  spin_message = await ctx.followup.send("🎡 Spinning the wheel...")
-
-  # Simulate a spinning animation with slowing speed
-  final_window = []
-  for i in range(20):
-      window = wheel[:9]
-      display_line = " ".join(window)
-      arrow_line = "ㅤㅤ" * 4 + "⬇️"
-      await spin_message.edit(content=f"{arrow_line}\n🎡 {display_line} 🎡")
-      await asyncio.sleep(0.05 + i * 0.03)
-      wheel = wheel[1:] + [wheel[0]]
-      final_window = window  # Save this BEFORE the final rotation
-    
-
-  await asyncio.sleep(0.3)
-
-  # Final result: middle symbol
-  final_emoji = final_window[4]
-  if final_emoji == "🔴":
-      color = "red"
-  elif final_emoji == "⚫":
-      color = "black"
-  else:
-      color = "green"
+    await ctx.respond("❌ Your bet must be greater than 0!", ephemeral=True)
+    return
 
-  number = random.randint(0, 36 if color != "green" else 0)
-  result_message = f"🎯 The ball landed on **{number} ({color})** {final_emoji}\n"
+  names = parse_bets(choice)
+  if names is None:
+    await ctx.respond(f"❌ Invalid bet! Bet on {BET_HELP}. Separate several bets with commas.", ephemeral=True)
+    return
+  if len(names) > MAX_BETS_PER_PLAYER:
+    await ctx.respond(f"❌ You can have at most {MAX_BETS_PER_PLAYER} bets on one spin!", ephemeral=True)
+    return
 
-  if choice.lower() == color:
-      winnings = bet * 14 if color == "green" else bet * 2
-      user_data["coins"] += winnings
-      result_message += f"🎉 {ctx.author.mention} won **{winnings} coins**!"
-  else:
-      user_data["coins"] -= bet
-      result_message += f"😔 {ctx.author.mention} lost **{bet} coins**."
+  if quick:
+    await play_quick_roulette(ctx, bet, names, economy)
+    return
+
+  channel_id = ctx.channel.id
 
-  data[user_id] = user_data
-  save_data(data)
+  # Bet on the table that's open in this channel
+  table = tables.get(channel_id)
+  if table is not None:
+    error = await table.join(ctx.author, bet, names)
+    await ctx.respond(error or f"🎲 You bet **{bet}** on {', '.join(names)}!", ephemeral=True)
+    return
 
-  await spin_message.edit(content=result_message)
-  
+  # Otherwise open a new table with these bets on it
+  table = RouletteRound(channel_id, economy)
+  tables[channel_id] = table
+  error = await table.join(ctx.author, bet, names)
+  if error:
+    # Others may have bet while the opener's bet was being taken
+    await table.cancel()
+    return await ctx.respond(error, ephemeral=True)
+
+  try:
+    await ctx.defer()
+    table.message = await ctx.followup.send(table.render("🎡 Roulette table open!"))
+  except discord.HTTPException:
+    # No table message, no spin
+    await table.cancel()
+    raise
+  await table.run()
+
+# A private spin for just this player, answered in one message
+async def play_quick_roulette(ctx, bet, names, economy):
+  user_id = ctx.author.id
+  if await economy.debit(user_id, bet * len(names), "roulette") is None:
+    await ctx.respond("❌ You don't have enough coins to make that bet!", ephemeral=True)
+    return
+
+  fair_round = fair.start("roulette", fair.client_seed(user_id))
+  pocket = spin_roulette(fair_round.rng)
+  payout = settle_roulette(pocket, [(user_id, name, bet) for name in names])[user_id]
+  if payout:
+    await economy.credit(user_id, payout, "roulette")
+
+  fair.finish(fair_round, f"landed on {ROULETTE_WHEEL[pocket]}")
+
+  net = payout - bet * len(names)
+  result_message = f"{result_header(pocket)}\n{fair_round.label()}\n"
+  if net > 0:
+    result_message += f"🎉 {ctx.author.mention} won **{net} coins**!"
+  elif net == 0:
+    result_message += f"🤝 {ctx.author.mention} broke even."
+  else:
+    result_message += f"😔 {ctx.author.mention} lost **{-net} coins**."
+  await ctx.respond(result_message)  # The whole round is this one response
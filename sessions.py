@@ -0,0 +1,276 @@
+import asyncio
+import os
+import tempfile
+import time
+
+
+class Session:
+    __slots__ = ("id", "game", "user_id", "channel_id", "bet", "due", "on_expire", "expired", "recorded")
+
+    def __init__(self, session_id, game, user_id, channel_id, bet, on_expire):
+        self.id = session_id
+        self.game = game
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.bet = bet            # Coins taken from the player and not yet settled
+        self.due = None           # Wheel tick it expires on, or None if it never does
+        self.on_expire = on_expire
+        self.expired = False
+        self.recorded = False     # Its bet is (about to be) in the journal
+
+    def journal_line(self):
+        return f"open {self.id} {self.game} {self.user_id} {self.bet} {self.channel_id} {int(time.time())}\n"
+
+
+class SessionRegistry:
+    # Every game that holds a player's bet between messages (mines, crash)
+    # opens a session for it, and closes it once the bet is settled.
+    #
+    #  - One session per player per game, and at most `limit` in total, so a
+    #    busy bot can't pile up games (and their views and waits) forever.
+    #  - Idle timeouts are one timer wheel for everything instead of a timer
+    #    per view: `wheel_size` buckets of `tick` seconds, swept once a tick.
+    #    Expiring calls the session's on_expire; the game then ends itself
+    #    and closes the session as usual.
+    #  - With a journal, every open bet is written down (group committed like
+    #    the ledger) and crossed off when it's settled. A bet still open when
+    #    the bot starts was lost with a crash or restart, and is refunded by
+    #    recover() before any game can run.
+    def __init__(self, limit=10_000, tick=1.0, wheel_size=512, commit_interval=0.05, compact_after=10_000):
+        self.limit = limit
+        self.tick = tick
+        self.commit_interval = commit_interval
+        self.compact_after = compact_after
+        self.expired = 0            # Sessions that ran out of time
+        self._sessions = {}         # (user id, game) -> Session
+        self._wheel = [set() for _ in range(wheel_size)]
+        self._swept = None          # Last wheel tick swept
+        self._next_id = 1
+        self._task = None
+        self.path = None            # Journal file, set by recover()
+        self.economy = None         # Whose payouts must be saved before a close is written
+        self._file = None
+        self._pending = []          # Journal lines not yet written
+        self._closing = {}          # session id -> Session whose close line isn't written yet
+        self._written = []          # Futures waiting for those lines to be on disk
+        self._entries = 0           # Lines in the journal since it was last compacted
+        self._commit_task = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user_id, game):
+        return self._sessions.get((user_id, game))
+
+    # Why the player can't start another `game` right now, or None if they can
+    def refuse(self, user_id, game):
+        if (user_id, game) in self._sessions:
+            return f"❌ You already have a game of {game} going!"
+        if len(self._sessions) >= self.limit:
+            return "⏳ The casino is full right now, try again in a minute!"
+        return None
+
+    # Take a seat for the player; check refuse() first. Call it before taking
+    # the bet so a double click can't start two games, then either opened()
+    # once the bet is taken or discard() if it couldn't be.
+    def open(self, game, user_id, channel_id, bet, timeout=None, on_expire=None):
+        self._start()
+        session = Session(self._next_id, game, user_id, channel_id, bet, on_expire)
+        self._next_id += 1
+        self._sessions[(user_id, game)] = session
+        if timeout is not None:
+            self.touch(session, timeout)
+        return session
+
+    # The bet is taken: write it down. Returns once it's in the journal, so a
+    # crash from here on gets the player their coins back. If the journal
+    # can't be written the session is dropped and this raises; the caller
+    # gives the bet back.
+    async def opened(self, session):
+        if self.path is None:
+            return
+        session.recorded = True
+        written = asyncio.get_running_loop().create_future()
+        self._pending.append(session.journal_line())
+        self._written.append(written)
+        try:
+            await written
+        except asyncio.CancelledError:
+            raise # Shutting down: commit_now still writes the line, and the bet is refunded next start
+        except BaseException:
+            session.recorded = False
+            self._forget(session)
+            raise
+
+    # Give up on a seat whose bet was never taken
+    def discard(self, session):
+        self._forget(session)
+
+    # The bet is settled (paid out, lost or refunded). The close line is only
+    # written once the payout is saved (see commit).
+    def close(self, session):
+        if self._forget(session) and self.path is not None and session.recorded:
+            self._pending.append(f"close {session.id}\n")
+            self._closing[session.id] = session
+
+    def _forget(self, session):
+        if self._sessions.get((session.user_id, session.game)) is not session:
+            return False
+        del self._sessions[(session.user_id, session.game)]
+        if session.due is not None:
+            self._wheel[session.due % len(self._wheel)].discard(session)
+        return True
+
+    # ---------------------------- TIMER WHEEL ----------------------------
+
+    def _now_tick(self):
+        return int(asyncio.get_running_loop().time() / self.tick)
+
+    # (Re)start the session's idle timeout, e.g. after every move
+    def touch(self, session, timeout):
+        if session.due is not None:
+            self._wheel[session.due % len(self._wheel)].discard(session)
+        session.due = self._now_tick() + max(1, round(timeout / self.tick))
+        self._wheel[session.due % len(self._wheel)].add(session)
+
+    def sweep(self, now_tick):
+        if self._swept is None:
+            self._swept = now_tick - 1
+        # One bucket per tick since the last sweep, but never more than a
+        # full turn of the wheel
+        for current in range(max(self._swept + 1, now_tick - len(self._wheel) + 1), now_tick + 1):
+            bucket = self._wheel[current % len(self._wheel)]
+            # Timeouts longer than a turn of the wheel stay put until their tick
+            due = [session for session in bucket if session.due <= now_tick]
+            for session in due:
+                bucket.discard(session)
+                session.due = None
+                session.expired = True
+                self.expired += 1
+                if session.on_expire is not None:
+                    try:
+                        session.on_expire()
+                    except Exception as e:
+                        print(f"Failed to expire {session.game} session {session.id}: {e}")
+        self._swept = now_tick
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.sweep(self._now_tick())
+
+    # The sweeper (and the journal writer) start with the first session, so
+    # nothing has to remember to start them
+    def _start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._sweep_loop())
+        if self.path is not None and self._commit_task is None:
+            self._commit_task = asyncio.get_running_loop().create_task(self._commit_loop())
+
+    # ---------------------------- JOURNAL ----------------------------
+
+    # Replay the journal at `path` from the last run and refund every bet
+    # that was never settled, then start a fresh journal there. Runs once at
+    # startup, before the event loop and before any game (see main.py).
+    # Returns how many bets were refunded.
+    def recover(self, economy, path):
+        self.path = path
+        self.economy = economy
+        unsettled = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 7 and parts[0] == "open":
+                        unsettled[parts[1]] = parts
+                    elif len(parts) == 2 and parts[0] == "close":
+                        unsettled.pop(parts[1], None)
+                    # Anything else is a torn last line from a crash mid-append
+
+        for _, session_id, game, user_id, bet, channel_id, _ in unsettled.values():
+            economy.credit_now(int(user_id), int(bet), game)
+            print(f"Refunded {bet} coins to {user_id} for an unfinished game of {game} (session {session_id}, channel {channel_id})")
+        if unsettled:
+            economy.flush_now() # The refunds are safe before the journal forgets them
+
+        self._rewrite([])
+        return len(unsettled)
+
+    def _rewrite(self, lines):
+        if self._file is not None:
+            self._file.close()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sessions-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._file = open(self.path, "a")
+        self._entries = len(lines)
+
+    def _append(self, lines):
+        self._file.write("".join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def commit(self):
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        written, self._written = self._written, []
+        try:
+            # Every payout behind these close lines was made before they were
+            # added, so once the economy has saved what it has so far, no
+            # close can land on disk ahead of its payout
+            if self.economy is not None:
+                await self.economy.committed()
+            await asyncio.to_thread(self._append, lines)
+        except BaseException as e:
+            # The opens' callers refund their bets; the closes are tried again
+            self._pending[:0] = [line for line in lines if line.startswith("close")]
+            for future in written:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        for future in written:
+            if not future.done():
+                future.set_result(None)
+        for line in lines:
+            if line.startswith("close"):
+                self._closing.pop(int(line.split()[1]), None)
+
+        # Keep the journal short: once it's long, write out just the sessions
+        # still open, counting those whose close isn't written yet. Lines
+        # recorded from here on go in the next commit.
+        self._entries += len(lines)
+        if self._entries >= self.compact_after:
+            still_open = [session for session in self._sessions.values() if session.recorded]
+            lines = [session.journal_line() for session in still_open + list(self._closing.values())]
+            await asyncio.to_thread(self._rewrite, lines)
+
+    async def _commit_loop(self):
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            try:
+                await self.commit()
+            except Exception as e:
+                print(f"Failed to write session journal: {e}")
+
+    # Blocking commit, for when the event loop is already gone (shutdown).
+    # Sessions still open stay in the journal and are refunded next start.
+    def commit_now(self):
+        if self._pending and self._file is not None:
+            lines, self._pending = self._pending, []
+            self._append(lines)
+            self._closing.clear()
+
+
+sessions = SessionRegistry()
@@ -0,0 +1,116 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+# Runs the bot as several processes, each one connected with its own range
+# of shards, so guilds are spread over more than one core and event loop:
+#
+#   python shards.py --processes 2 --shards 8
+#
+# A guild always lands on the same shard, so channel games (crash, roulette,
+# blackjack shoes) stay inside one process. Balances are shared through the
+# SQLite store, which every process opens in WAL mode, so this needs
+# ECONOMY_BACKEND=sqlite. Process i serves /healthz and /metrics on
+# HEALTH_PORT + i, and only process 0 syncs slash commands.
+#
+# A process that dies is started again after --restart-delay seconds.
+# Ctrl+C (or SIGTERM) stops them all; each one saves before exiting.
+
+STOP_TIMEOUT = 30 # Seconds a process gets to shut down before it's killed
+
+
+# Split shards 0..shard_count-1 into `processes` contiguous ranges
+def shard_ranges(shard_count, processes):
+    return [list(range(i * shard_count // processes, (i + 1) * shard_count // processes)) for i in range(processes)]
+
+
+class Launcher:
+    def __init__(self, processes, shard_count, stagger, restart_delay):
+        self.ranges = shard_ranges(shard_count, processes)
+        self.shard_count = shard_count
+        self.stagger = stagger
+        self.restart_delay = restart_delay
+        self.children = [None] * processes
+        self.stopping = False
+
+    def spawn(self, index):
+        env = dict(
+            os.environ,
+            SHARD_COUNT=str(self.shard_count),
+            SHARD_IDS=",".join(map(str, self.ranges[index])),
+            SHARD_PROCESS=str(index),
+            SHARD_PROCESSES=str(len(self.ranges)),
+        )
+        main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        self.children[index] = subprocess.Popen([sys.executable, main], env=env)
+        print(f"Process {index} (pid {self.children[index].pid}) running shards {self.ranges[index]}")
+
+    def run(self):
+        # Stagger the starts: Discord only lets a bot identify so many shards at once
+        for index in range(len(self.ranges)):
+            self.spawn(index)
+            if index < len(self.ranges) - 1:
+                time.sleep(self.stagger)
+
+        died_at = {}
+        while not self.stopping:
+            time.sleep(1)
+            for index, child in enumerate(self.children):
+                if self.stopping or child.poll() is None:
+                    continue
+                died_at.setdefault(index, time.monotonic())
+                if time.monotonic() - died_at[index] >= self.restart_delay:
+                    print(f"Process {index} exited with {child.returncode}, restarting")
+                    del died_at[index]
+                    self.spawn(index)
+
+    def stop(self, *args):
+        if self.stopping:
+            return
+        self.stopping = True
+        print("Stopping all processes...")
+        for child in self.children:
+            if child is not None and child.poll() is None:
+                child.send_signal(signal.SIGINT) # Same as Ctrl+C: the bot shuts down and saves
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for child in self.children:
+            if child is None:
+                continue
+            try:
+                child.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                child.kill()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the bot as several sharded processes")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=None, help="total shard count (default: one per process)")
+    parser.add_argument("--stagger", type=float, default=5.0, help="seconds between starting processes")
+    parser.add_argument("--restart-delay", type=float, default=5.0)
+    args = parser.parse_args()
+
+    shard_count = args.shards or args.processes
+    if not 1 <= args.processes <= shard_count:
+        parser.error("need at least one shard per process")
+    if os.getenv("ECONOMY_BACKEND", "json") != "sqlite":
+        parser.error("sharded processes share balances through SQLite; set ECONOMY_BACKEND=sqlite")
+
+    launcher = Launcher(args.processes, shard_count, args.stagger, args.restart_delay)
+    signal.signal(signal.SIGTERM, launcher.stop)
+    try:
+        launcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        launcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# Headless Monte Carlo simulator for every game: RTP, hit frequency and a
+# 95% confidence interval, straight from the engine's rules and paytables.
+#
+#   python simulate.py                      # every game, 10M rounds each
+#   python simulate.py slots roulette -n 1e8
+#   python simulate.py blackjack -n 1e6 --workers 8
+#
+# Needs numpy (pip install numpy). Everything except blackjack is
+# vectorized; blackjack hands are played by engine.play_blackjack_hand in a
+# process pool, since the hit/stand loop doesn't vectorize well.
+import argparse
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import engine
+
+BET = 100           # Payouts round down to whole coins, so simulate a realistic bet
+CHUNK = 1_000_000   # Rounds per vectorized batch, keeps memory flat
+
+
+class Stats:
+    # Running totals of payout / bet, merged across batches and processes
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.hits = 0
+
+    def add(self, returns):
+        self.n += len(returns)
+        self.total += float(returns.sum())
+        self.total_sq += float((returns * returns).sum())
+        self.hits += int((returns > 0).sum())
+
+    def merge(self, other):
+        self.n += other.n
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.hits += other.hits
+
+    def report(self, name):
+        rtp = self.total / self.n
+        variance = max(self.total_sq / self.n - rtp * rtp, 0.0)
+        half_width = 1.96 * math.sqrt(variance / self.n)
+        return (
+            f"{name:<28} rounds={self.n:>12,}  RTP={rtp:8.4%}  "
+            f"95% CI=[{rtp - half_width:.4%}, {rtp + half_width:.4%}]  "
+            f"hit={self.hits / self.n:7.3%}  sd={math.sqrt(variance):.3f}"
+        )
+
+
+def batches(rounds):
+    while rounds > 0:
+        size = min(rounds, CHUNK)
+        yield size
+        rounds -= size
+
+# ---------------------------- GAMES ----------------------------
+
+def sim_slots(rng, rounds):
+    machine = engine.slot_machine
+    reels = len(machine.weights)
+    probs = [np.array(weights) / sum(weights) for weights in machine.weights]
+    pays = np.array(machine.pays)
+    columns = np.arange(reels)
+    stats = Stats()
+    for size in batches(rounds):
+        # grid[spin, row, reel], every cell drawn from its reel's weights
+        grid = np.stack([rng.choice(len(machine.symbols), size=(size, machine.rows), p=p) for p in probs], axis=2)
+        line_pays = np.zeros(size)
+        for line in machine.paylines:
+            cells = grid[:, list(line), columns]
+            first = cells[:, 0]
+            matching = np.ones(size, dtype=bool)
+            run = np.ones(size, dtype=np.int64)
+            for reel in range(1, reels):
+                matching &= cells[:, reel] == first
+                run += matching
+            line_pays += pays[first, run]
+        payout = np.floor(BET * line_pays / len(machine.paylines))
+        stats.add(payout / BET)
+    return [(f"slots (exact RTP {machine.rtp:.4%})", stats)]
+
+
+def sim_roulette(rng, rounds, bets=("red", "odd", "low", "dozen1", "col1", "17-20", "17")):
+    # One spin settles every bet type at once: look up the drawn numbers'
+    # rows in the payout matrix
+    wheel = np.array(engine.ROULETTE_WHEEL)
+    matrix = np.array(engine.ROULETTE_MATRIX, dtype=np.float64)
+    columns = [engine.ROULETTE_BET_INDEX[name] for name in bets]
+    results = {name: Stats() for name in bets}
+    for size in batches(rounds):
+        numbers = wheel[rng.integers(0, len(wheel), size=size)]
+        returns = matrix[numbers][:, columns]
+        for i, stats in enumerate(results.values()):
+            stats.add(returns[:, i])
+    return [(f"roulette {name}", stats) for name, stats in results.items()]
+
+
+def crash_points(rng, size):
+    r = rng.random(size)
+    skewed = 1.02 + (5.0 - 1.02) * (1 - r) ** 3.5
+    return np.maximum(np.round(skewed, 2), 1.05)
+
+
+def sim_crash(rng, rounds, targets=(1.1, 1.5, 2.0, 3.0)):
+    results = {target: Stats() for target in targets}
+    for size in batches(rounds):
+        points = crash_points(rng, size)
+        for target, stats in results.items():
+            payout = np.where(target < points, int(BET * target), 0)
+            stats.add(payout / BET)
+    return [(f"crash auto x{target:.2f}", stats) for target, stats in results.items()]
+
+
+def sim_mines(rng, rounds, setups=((1, 3), (3, 3), (3, 5), (5, 5), (10, 3))):
+    # Revealing k tiles at random survives with hypergeometric odds, then
+    # cashes out at the multiplier MinesView would show
+    tiles = engine.MINES_TILES
+    results = {}
+    for mines, reveals in setups:
+        stats = Stats()
+        payout_if_safe = int(BET * engine.mines_multiplier(mines, reveals, tiles))
+        for size in batches(rounds):
+            safe = rng.hypergeometric(tiles - mines, mines, reveals, size=size) == reveals
+            stats.add(np.where(safe, payout_if_safe, 0) / BET)
+        results[(mines, reveals)] = stats
+    return [(f"mines {m} mines, {k} reveals", stats) for (m, k), stats in results.items()]
+
+
+def sim_coinflip(rng, rounds):
+    # One side's view of a duel: the winner takes the loser's bet
+    stats = Stats()
+    for size in batches(rounds):
+        won = rng.integers(0, 2, size=size) == 1
+        stats.add(np.where(won, 2 * BET, 0) / BET)
+    return [("coinflip", stats)]
+
+
+def _blackjack_worker(seed, hands, stand_on):
+    shoe = engine.Shoe(rng=random.Random(seed))
+    stats = Stats()
+    for size in batches(hands):
+        returns = np.fromiter((engine.play_blackjack_hand(shoe, BET, stand_on) for _ in range(size)), dtype=np.float64, count=size)
+        stats.add(returns / BET)
+    return stats
+
+
+def sim_blackjack(rng, rounds, workers=None, stand_on=17):
+    workers = workers or os.cpu_count() or 1
+    per_worker = [rounds // workers + (1 if i < rounds % workers else 0) for i in range(workers)]
+    seeds = rng.integers(0, 2**63, size=workers)
+    stats = Stats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_blackjack_worker, seeds.tolist(), per_worker, [stand_on] * workers):
+            stats.merge(result)
+    return [(f"blackjack stand on {stand_on}", stats)]
+
+
+GAMES = {
+    "slots": sim_slots,
+    "roulette": sim_roulette,
+    "crash": sim_crash,
+    "mines": sim_mines,
+    "coinflip": sim_coinflip,
+    "blackjack": sim_blackjack,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo RTP simulator for the casino games")
+    parser.add_argument("games", nargs="*", default=list(GAMES), help=f"any of: {', '.join(GAMES)}")
+    parser.add_argument("-n", "--rounds", type=float, default=1e7, help="rounds per game (default 1e7)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="processes for blackjack (default: all cores)")
+    args = parser.parse_args()
+    unknown = [game for game in args.games if game not in GAMES]
+    if unknown:
+        parser.error(f"unknown game(s): {', '.join(unknown)}")
+
+    rng = np.random.default_rng(args.seed)
+    rounds = int(args.rounds)
+    for game in args.games:
+        started = time.perf_counter()
+        if game == "blackjack":
+            results = sim_blackjack(rng, rounds, args.workers)
+        else:
+            results = GAMES[game](rng, rounds)
+        for name, stats in results:
+            print(stats.report(name))
+        print(f"  ({game}: {time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
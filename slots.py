@@ -1,50 +1,94 @@
-import random
-import asyncio
+import os
+from render import renderer
+from rng import fair
+from engine import SlotMachine
+from metrics import animation_sleep
 
-async def play_slots(ctx, bet, load_data, save_data):
+MAX_SPINS = 1000
+
+# Reels, paytable and paylines; set SLOTS_CONFIG in .env to load your own JSON
+machine = SlotMachine.load(os.getenv("SLOTS_CONFIG"))
+
+def describe_wins(wins):
+    return "\n".join(
+        f"Line {number + 1}: {count}x {machine.symbols[symbol]} pays x{pay:g}"
+        for number, symbol, count, pay in wins
+    )
+
+async def play_slots(ctx, bet, economy, quick=False, spins=1):
     # Validate bet
     if bet <= 0:
         await ctx.respond("❌ Your bet must be greater than 0!", ephemeral=True)
         return
+    if not 1 <= spins <= MAX_SPINS:
+        await ctx.respond(f"❌ You can spin between 1 and {MAX_SPINS} times at once!", ephemeral=True)
+        return
 
-    user_id = str(ctx.author.id)
-    data = load_data()
-    user_data = data.get(user_id, {"coins": 0, "last_daily": "2000-01-01"})
+    user_id = ctx.author.id
+    if spins > 1:
+        await play_slots_batch(ctx, bet, spins, economy)
+        return
 
-    if user_data["coins"] < bet:
+    # Take the bet up front; winnings (plus the bet back) are paid out at the end
+    if await economy.debit(user_id, bet, "slots") is None:
         await ctx.respond("❌ You don't have enough coins to make that bet!", ephemeral=True)
         return
 
-    # Defer the response to avoid timeout
-    await ctx.defer()
-
-    symbols = ["🍒", "🍋", "🔔", "💎", "7️⃣"]
+    if not quick:
+        # Defer the response to avoid timeout
+        await ctx.defer()
 
-    # Send initial spinning message as a followup (after defer, ctx.respond is already "deferred")
-    spinning_message = await ctx.followup.send("🎰    Spinning...    🎰")
+        # Send initial spinning message as a followup (after defer, ctx.respond is already "deferred")
+        spinning_message = await ctx.followup.send("🎰    Spinning...    🎰")
 
-    for _ in range(3):
-        spin_symbols = [random.choice(symbols) for _ in range(3)]
-        await spinning_message.edit(content="🎰    " + " | ".join(spin_symbols) + "    🎰")
-        await asyncio.sleep(0.5)
+        for _ in range(3):
+            renderer.submit(spinning_message, content=machine.render(machine.spin()))
+            await animation_sleep(0.5)
 
     # Determine winnings
-    result = [random.choice(symbols) for _ in range(3)]
-    slot_display = " | ".join(result)
-
-    if result[0] == result[1] == result[2]:
-        winnings = bet * 5
-        user_data["coins"] += winnings
-        message = f"🎰    {slot_display}    🎰\nJACKPOT! {ctx.author.mention} won {winnings} coins!"
-    elif result[0] == result[1] or result[1] == result[2] or result[0] == result[2]:
-        winnings = int(bet * 1.5)
-        user_data["coins"] += winnings
-        message = f"🎰    {slot_display}    🎰\n{ctx.author.mention} won {winnings} coins!"
+    fair_round = fair.start("slots", fair.client_seed(user_id))
+    result = machine.spin(fair_round.rng)
+    slot_display = machine.render(result)
+    wins = machine.line_wins(result)
+    payout = machine.payout(result, bet)
+    if payout:
+        await economy.credit(user_id, payout, "slots")
+    fair.finish(fair_round, f"paid {payout}")
+
+    if payout > bet:
+        message = f"{slot_display}\n{describe_wins(wins)}\n{ctx.author.mention} won {payout - bet} coins!"
+    elif payout:
+        message = f"{slot_display}\n{describe_wins(wins)}\n{ctx.author.mention} got {payout} of {bet} coins back."
+    else:
+        message = f"{slot_display}\nNo match. {ctx.author.mention} lost {bet} coins!"
+    message += f"\n{fair_round.label()}"
+
+    if quick:
+        await ctx.respond(message)  # The whole round is this one response
     else:
-        user_data["coins"] -= bet
-        message = f"🎰    {slot_display}    🎰\nNo match. {ctx.author.mention} lost {bet} coins!"
+        await renderer.submit(spinning_message, final=True, content=message)
 
-    data[user_id] = user_data
-    save_data(data)
+# Auto-spin: every spin is played up front and the balance changes once by
+# the net result, then one summary message. No animation.
+async def play_slots_batch(ctx, bet, spins, economy):
+    stake = bet * spins
+    if economy.get_balance(ctx.author.id) < stake:
+        await ctx.respond(f"❌ You need **{stake}** coins for {spins} spins!", ephemeral=True)
+        return
+
+    # All the spins are one round, drawn one after another from its stream
+    fair_round = fair.start("slots", fair.client_seed(ctx.author.id))
+    total, hits, best, last = machine.play(bet, spins, fair_round.rng)
+    if await economy.settle(ctx.author.id, stake, total, "slots") is None:
+        fair.finish(fair_round, "cancelled")
+        await ctx.respond(f"❌ You need **{stake}** coins for {spins} spins!", ephemeral=True)
+        return
+    fair.finish(fair_round, f"{spins} spins paid {total}")
 
-    await spinning_message.edit(content=message)
\ No newline at end of file
+    net = total - stake
+    outcome = f"won **{net}** coins" if net >= 0 else f"lost **{-net}** coins"
+    await ctx.respond(
+        f"🎰 {ctx.author.mention} spun **{spins}x** at **{bet}** coins and {outcome}.\n"
+        f"Paid out **{total}** of **{stake}** | {hits} winning spins | best spin **{best}**\n"
+        f"Last spin:\n{machine.render(last)}\n{fair_round.label()}"
+    )
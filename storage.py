@@ -0,0 +1,466 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+from sortedcontainers import SortedList
+
+DEFAULT_COINS = 1000              # Every new player starts with 1000 coins
+DEFAULT_LAST_DAILY = "2000-01-01" # Means "never claimed"
+
+
+def new_user():
+    return {"coins": DEFAULT_COINS, "last_daily": DEFAULT_LAST_DAILY}
+
+
+# Storage backends for the economy. Both expose the same methods so the
+# Economy service (economy.py) doesn't care where balances live:
+#   get_user, get_balance, set_balance, add_coins, try_debit, transfer,
+#   claim_daily, balances, top, rank, start, close, flush_now
+
+# ---------------------------- JSON ----------------------------
+
+class LeaderboardIndex:
+    # Users ordered by coins, kept up to date on every balance change.
+    # Updates, "my rank" and any page of the leaderboard are all O(log n),
+    # so /leaderboard never has to look at every user.
+    def __init__(self, balances=()):
+        self._coins = {}                # user_id -> coins
+        self._ranked = SortedList()     # (-coins, user_id), richest first
+        for user_id, coins in balances:
+            self.update(user_id, coins)
+
+    def update(self, user_id, coins):
+        old = self._coins.get(user_id)
+        if old == coins:
+            return
+        if old is not None:
+            self._ranked.remove((-old, user_id))
+        self._coins[user_id] = coins
+        self._ranked.add((-coins, user_id))
+
+    # (user_id, coins) for `limit` users starting at `offset`
+    def page(self, offset, limit):
+        return [(user_id, -neg_coins) for neg_coins, user_id in self._ranked.islice(offset, offset + limit)]
+
+    # 1-based rank, or None if the user has no balance yet
+    def rank(self, user_id):
+        coins = self._coins.get(user_id)
+        if coins is None:
+            return None
+        return self._ranked.bisect_left((-coins, user_id)) + 1
+
+    def __len__(self):
+        return len(self._ranked)
+
+
+class JSONStore:
+    # Keeps every balance in memory and writes economy.json in the background.
+    # The snapshot is written every `flush_interval` seconds, or sooner once
+    # `flush_after` changes piled up.
+    #
+    # The writer thread saves its own copy of the records (`_saved`) so it
+    # never sees a record that a game is changing. A flush only copies over
+    # the records changed since the last one, so it costs the event loop
+    # O(changes) rather than O(users).
+    def __init__(self, path, flush_interval=5.0, flush_after=50):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_after = flush_after
+        self.data = self._read_snapshot()
+        self.index = LeaderboardIndex(self.balances())
+        self._saved = {uid: dict(user) if isinstance(user, dict) else user for uid, user in self.data.items()}
+        self._dirty = set()     # User ids changed since the last flush
+        self._flushing = asyncio.Lock() # One writer at a time, so `_saved` holds still while it's written
+        self._changes = 0       # Changes not yet written to disk
+        self._wake = None       # Set to flush early (too many changes or closing)
+        self._task = None
+        self._closing = False
+
+    # Get or create a user's record
+    def get_user(self, user_id):
+        user_id_str = str(user_id)
+        user = self.data.get(user_id_str)
+        if not isinstance(user, dict):
+            user = new_user()
+            self.data[user_id_str] = user
+            self._changed(user_id_str, user)
+        return user
+
+    def get_balance(self, user_id):
+        return self.get_user(user_id)["coins"]
+
+    def set_balance(self, user_id, amount):
+        user = self.get_user(user_id)
+        user["coins"] = amount
+        self._changed(user_id, user)
+
+    def add_coins(self, user_id, amount):
+        user = self.get_user(user_id)
+        user["coins"] += amount
+        self._changed(user_id, user)
+        return user["coins"]
+
+    # Remove coins only if the user can cover them, adding `payout` back in
+    # the same change. Returns the new balance, or None if they can't.
+    def try_debit(self, user_id, amount, payout=0):
+        user = self.get_user(user_id)
+        if user["coins"] < amount:
+            return None
+        user["coins"] += payout - amount
+        self._changed(user_id, user)
+        return user["coins"]
+
+    # Move coins between two users if the sender can cover them
+    def transfer(self, from_id, to_id, amount):
+        sender = self.get_user(from_id)
+        receiver = self.get_user(to_id)
+        if sender["coins"] < amount:
+            return False
+        sender["coins"] -= amount
+        receiver["coins"] += amount
+        self._changed(from_id, sender)
+        self._changed(to_id, receiver)
+        return True
+
+    def claim_daily(self, user_id, today, reward):
+        user = self.get_user(user_id)
+        if user["last_daily"] == today:
+            return False, user["coins"]
+        user["coins"] += reward
+        user["last_daily"] = today
+        self._changed(user_id, user)
+        return True, user["coins"]
+
+    # (user_id, coins) for every user, skipping anything that isn't a user record
+    def balances(self):
+        for user_id, user in self.data.items():
+            if isinstance(user, dict) and "coins" in user:
+                yield user_id, user["coins"]
+
+    def top(self, limit, offset=0):
+        return self.index.page(offset, limit)
+
+    # 1-based rank, or None if the user has no balance yet
+    def rank(self, user_id):
+        return self.index.rank(str(user_id))
+
+    # Every change goes through here: keeps the leaderboard in step and
+    # counts towards the next flush
+    def _changed(self, user_id, user):
+        self.index.update(str(user_id), user["coins"])
+        self._dirty.add(str(user_id))
+        self._changes += 1
+        if self._changes >= self.flush_after and self._wake is not None:
+            self._wake.set()
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    # Write to a temp file next to the real one and rename it over, so a crash
+    # mid-write never leaves a truncated economy.json behind
+    def _write_snapshot(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".economy-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    # Copy the records changed since the last flush into the writer's
+    # snapshot. Returns how many changes that covers.
+    def _take_changes(self):
+        for user_id in self._dirty:
+            user = self.data[user_id]
+            self._saved[user_id] = dict(user) if isinstance(user, dict) else user
+        self._dirty.clear()
+        changes, self._changes = self._changes, 0
+        return changes
+
+    # Write pending changes to disk without blocking the event loop
+    async def flush(self):
+        async with self._flushing:
+            if not self._changes:
+                return
+            # Only the changed records are copied on the loop; encoding and
+            # disk I/O happen off it
+            changes = self._take_changes()
+            try:
+                await asyncio.to_thread(self._write_snapshot, self._saved)
+            except BaseException:
+                self._changes += changes # `_saved` still has them, the next flush writes them
+                raise
+
+    # Blocking flush, for when the event loop is already gone (shutdown)
+    def flush_now(self):
+        if self._changes:
+            changes = self._take_changes()
+            try:
+                self._write_snapshot(self._saved)
+            except BaseException:
+                self._changes += changes
+                raise
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to save economy: {e}")
+
+    # Start the background writer. Must be called from inside the running loop.
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    # Stop the background writer after one last flush
+    async def close(self):
+        if self._task is not None:
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+# ---------------------------- SQLITE ----------------------------
+
+class SQLiteStore:
+    # One row per user. Every operation is a primary-key lookup or a single
+    # row UPDATE, so cost doesn't grow with the number of users. WAL mode with
+    # synchronous=NORMAL means a commit is an append to the -wal file, not an
+    # fsync, which keeps these calls cheap enough to run on the event loop.
+    #
+    # Several bot processes can share one database (see shards.py): every
+    # change is a single IMMEDIATE transaction with its balance check inside
+    # the UPDATE, so they can't lose each other's updates. A process that
+    # finds the write lock taken waits up to `busy_timeout` seconds for it.
+    #
+    # The leaderboard is a LeaderboardIndex in memory, like the JSON store's,
+    # since counting rows in SQL costs more the further down the board you
+    # go. Triggers append every balance change, whichever process made it,
+    # to balance_log; each process folds in the rows it hasn't seen before
+    # answering top() or rank(), and once a second in the background. The
+    # log keeps the newest `log_keep` rows; a process that fell further
+    # behind than that rebuilds its index from the users table.
+    def __init__(self, path, import_from=None, busy_timeout=5.0, log_keep=100_000):
+        self.path = path
+        self.log_keep = log_keep
+        # We manage transactions ourselves. main.py opens the store in a
+        # loader thread and then only uses it from the event loop.
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=busy_timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            " user_id INTEGER PRIMARY KEY,"
+            " coins INTEGER NOT NULL,"
+            " last_daily TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS users_by_coins ON users (coins)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS balance_log ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER NOT NULL,"
+            " coins INTEGER NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS users_log_insert AFTER INSERT ON users BEGIN"
+            " INSERT INTO balance_log (user_id, coins) VALUES (NEW.user_id, NEW.coins); END"
+        )
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS users_log_update AFTER UPDATE OF coins ON users"
+            " WHEN NEW.coins != OLD.coins BEGIN"
+            " INSERT INTO balance_log (user_id, coins) VALUES (NEW.user_id, NEW.coins); END"
+        )
+
+        # One-time migration from the old JSON file into an empty database
+        if import_from and os.path.exists(import_from) and self._is_empty():
+            self.import_json(import_from, only_if_empty=True)
+
+        self.index = None
+        self._log_seen = 0      # Last balance_log row folded into the index
+        self._task = None
+        self._build_index()
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _is_empty(self):
+        return self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    # only_if_empty checks again inside the transaction, in case another
+    # process sharing the database imported (and started playing) first
+    def import_json(self, path, only_if_empty=False):
+        with open(path, "r") as f:
+            data = json.load(f)
+        rows = [
+            (int(user_id), user["coins"], user.get("last_daily", DEFAULT_LAST_DAILY))
+            for user_id, user in data.items()
+            if isinstance(user, dict) and "coins" in user
+        ]
+        with self._transaction() as conn:
+            if only_if_empty and not self._is_empty():
+                return
+            conn.executemany("INSERT OR REPLACE INTO users (user_id, coins, last_daily) VALUES (?, ?, ?)", rows)
+
+    def _ensure_user(self, conn, user_id):
+        conn.execute(
+            "INSERT OR IGNORE INTO users (user_id, coins, last_daily) VALUES (?, ?, ?)",
+            (user_id, DEFAULT_COINS, DEFAULT_LAST_DAILY)
+        )
+
+    def get_user(self, user_id):
+        user_id = int(user_id)
+        row = self.conn.execute("SELECT coins, last_daily FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            self._ensure_user(self.conn, user_id)
+            return new_user()
+        return {"coins": row[0], "last_daily": row[1]}
+
+    def get_balance(self, user_id):
+        return self.get_user(user_id)["coins"]
+
+    def set_balance(self, user_id, amount):
+        user_id = int(user_id)
+        self.conn.execute(
+            "INSERT INTO users (user_id, coins, last_daily) VALUES (?, ?, ?)"
+            " ON CONFLICT (user_id) DO UPDATE SET coins = excluded.coins",
+            (user_id, amount, DEFAULT_LAST_DAILY)
+        )
+
+    def add_coins(self, user_id, amount):
+        user_id = int(user_id)
+        with self._transaction() as conn:
+            self._ensure_user(conn, user_id)
+            conn.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (amount, user_id))
+            return conn.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    # The balance check is part of the UPDATE, so two debits can never both
+    # pass it with the same coins
+    def try_debit(self, user_id, amount, payout=0):
+        user_id = int(user_id)
+        with self._transaction() as conn:
+            self._ensure_user(conn, user_id)
+            debited = conn.execute(
+                "UPDATE users SET coins = coins + ? WHERE user_id = ? AND coins >= ?",
+                (payout - amount, user_id, amount)
+            ).rowcount == 1
+            if not debited:
+                return None
+            return conn.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def transfer(self, from_id, to_id, amount):
+        from_id, to_id = int(from_id), int(to_id)
+        with self._transaction() as conn:
+            self._ensure_user(conn, from_id)
+            self._ensure_user(conn, to_id)
+            debited = conn.execute(
+                "UPDATE users SET coins = coins - ? WHERE user_id = ? AND coins >= ?",
+                (amount, from_id, amount)
+            ).rowcount == 1
+            if debited:
+                conn.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (amount, to_id))
+        return debited
+
+    def claim_daily(self, user_id, today, reward):
+        user_id = int(user_id)
+        with self._transaction() as conn:
+            self._ensure_user(conn, user_id)
+            claimed = conn.execute(
+                "UPDATE users SET coins = coins + ?, last_daily = ? WHERE user_id = ? AND last_daily != ?",
+                (reward, today, user_id, today)
+            ).rowcount == 1
+            coins = conn.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+        return claimed, coins
+
+    def balances(self):
+        for user_id, coins in self.conn.execute("SELECT user_id, coins FROM users"):
+            yield str(user_id), coins
+
+    def top(self, limit, offset=0):
+        self._catch_up()
+        return self.index.page(offset, limit)
+
+    # 1-based rank, or None if the user has no balance yet
+    def rank(self, user_id):
+        self._catch_up()
+        return self.index.rank(str(user_id))
+
+    # ---------------------------- LEADERBOARD ----------------------------
+
+    # Every balance as of one read, and where the log stood at that moment
+    def _build_index(self):
+        self.conn.execute("BEGIN")
+        try:
+            seen = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM balance_log").fetchone()[0]
+            self.index = LeaderboardIndex(self.balances())
+        finally:
+            self.conn.execute("COMMIT")
+        self._log_seen = seen
+
+    def _catch_up(self):
+        rows = self.conn.execute(
+            "SELECT id, user_id, coins FROM balance_log WHERE id > ? ORDER BY id", (self._log_seen,)
+        ).fetchall()
+        if not rows:
+            return
+        if rows[0][0] != self._log_seen + 1:
+            # Rows we never saw were pruned (ids have no other gaps)
+            print("Leaderboard fell behind the balance log, rebuilding it")
+            self._build_index()
+            return
+        for _, user_id, coins in rows:
+            self.index.update(str(user_id), coins)
+        seen, self._log_seen = self._log_seen, rows[-1][0]
+        if seen // self.log_keep != self._log_seen // self.log_keep:
+            # Every `log_keep` rows, drop what every process has had time to read
+            self.conn.execute("DELETE FROM balance_log WHERE id <= ?", (self._log_seen - self.log_keep,))
+
+    async def _catch_up_loop(self):
+        while True:
+            await asyncio.sleep(1)
+            try:
+                self._catch_up()
+            except sqlite3.Error as e:
+                print(f"Failed to update the leaderboard: {e}")
+
+    # Commits are already durable; only the leaderboard catches up in the
+    # background. Must be called from inside the running loop.
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._catch_up_loop())
+
+    def flush_now(self):
+        pass
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.conn.close()
@@ -0,0 +1,63 @@
+import asyncio
+
+from coinflip import Challenge, duel
+from economy import Economy
+from storage import JSONStore
+
+
+class FakePlayer:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+
+def setup(tmp_path, challenger_coins, opponent_coins):
+    economy = Economy(JSONStore(str(tmp_path / "economy.json")))
+    challenger, opponent = FakePlayer(1), FakePlayer(2)
+    economy.store.set_balance(challenger.id, challenger_coins)
+    economy.store.set_balance(opponent.id, opponent_coins)
+    return economy, Challenge(challenger, 100, (0, 100), 0), opponent
+
+def balances(economy):
+    return sorted((economy.get_balance(1), economy.get_balance(2)))
+
+
+def test_duel_moves_the_bet_from_loser_to_winner(tmp_path):
+    economy, challenge, opponent = setup(tmp_path, 500, 500)
+    result = asyncio.run(duel(challenge, opponent, economy))
+    assert "wins **100 coins**" in result
+    assert balances(economy) == [400, 600]
+
+
+def test_duel_is_called_off_if_either_player_cant_cover_it(tmp_path):
+    for challenger_coins, opponent_coins in ((50, 500), (500, 50)):
+        economy, challenge, opponent = setup(tmp_path, challenger_coins, opponent_coins)
+        result = asyncio.run(duel(challenge, opponent, economy))
+        assert "cancelled" in result
+        assert (economy.get_balance(1), economy.get_balance(2)) == (challenger_coins, opponent_coins)
+
+
+def test_cancelled_duel_keeps_every_coin(tmp_path):
+    async def main():
+        economy, challenge, opponent = setup(tmp_path, 500, 500)
+        holding = asyncio.Event()
+        release = asyncio.Event()
+
+        async def busy_game():
+            async with economy.locked(opponent.id):
+                holding.set()
+                await release.wait()
+
+        game = asyncio.create_task(busy_game())
+        await holding.wait()
+        flip = asyncio.create_task(duel(challenge, opponent, economy))
+        await asyncio.sleep(0.01) # Waiting for the opponent's lock, mid-settlement
+        flip.cancel()
+        release.set()
+        await game
+        try:
+            await flip
+        except asyncio.CancelledError:
+            pass
+        assert (economy.get_balance(1), economy.get_balance(2)) == (500, 500)
+    asyncio.run(main())
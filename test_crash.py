@@ -0,0 +1,84 @@
+import asyncio
+
+import crash
+from sessions import sessions
+
+
+class FakeEconomy:
+    def __init__(self, balances, debit_delays=None):
+        self.balances = dict(balances)
+        self.debit_delays = debit_delays or {}  # user id -> seconds a debit takes
+        self.fail_credits = 0   # Credits left to fail, like a locked database
+
+    async def debit(self, user_id, amount, game):
+        await asyncio.sleep(self.debit_delays.get(user_id, 0))
+        if self.balances[user_id] < amount:
+            return None
+        self.balances[user_id] -= amount
+        return self.balances[user_id]
+
+    async def credit(self, user_id, amount, game):
+        await asyncio.sleep(0)
+        if self.fail_credits:
+            self.fail_credits -= 1
+            raise RuntimeError("database is locked")
+        self.balances[user_id] += amount
+        return self.balances[user_id]
+
+
+class FakePlayer:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+
+class FakeChannel:
+    id = 1
+
+
+class FakeMessage:
+    id = 1
+    channel = FakeChannel()
+
+    async def edit(self, **fields):
+        pass
+
+
+def test_cancel_refunds_only_bets_that_were_taken():
+    async def main():
+        economy = FakeEconomy({1: 100, 2: 100}, debit_delays={2: 0.05})
+        crash_round = crash.CrashRound(1, economy)
+        opener = asyncio.create_task(crash_round.join(FakePlayer(1), 500)) # Can't cover it
+        late = asyncio.create_task(crash_round.join(FakePlayer(2), 50))
+        assert await opener is not None
+        await crash_round.cancel()
+        assert await late is not None # Paid after the cancel, and got it back itself
+        assert economy.balances == {1: 100, 2: 100}
+        assert sessions.get(1, "crash") is None and sessions.get(2, "crash") is None
+    asyncio.run(main())
+
+
+def test_failing_round_refunds_and_frees_every_player():
+    async def main():
+        crash.BETTING_WINDOW, window = 0, crash.BETTING_WINDOW
+        try:
+            economy = FakeEconomy({1: 100, 2: 100})
+            crash_round = crash.CrashRound(1, economy)
+            crash_round.crash_point = 50.0
+            crash_round.message = FakeMessage()
+            assert await crash_round.join(FakePlayer(1), 40, auto_cashout=1.01) is None
+            assert await crash_round.join(FakePlayer(2), 60) is None
+
+            economy.fail_credits = 1 # The auto cash out fails
+            try:
+                await crash_round.run()
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("run() should re-raise")
+            assert economy.balances == {1: 100, 2: 100}
+            assert sessions.get(1, "crash") is None and sessions.get(2, "crash") is None
+            assert crash_round.fair_round.outcome == "cancelled"
+        finally:
+            crash.BETTING_WINDOW = window
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+from ledger import Ledger
+from storage import JSONStore
+
+
+def restart(tmp_path):
+    store = JSONStore(str(tmp_path / "economy.json"))
+    ledger = Ledger(str(tmp_path / "economy.ledger"))
+    ledger.recover(store)
+    return store, ledger
+
+def spend(store, ledger, user_id, amount):
+    store.add_coins(user_id, -amount)
+    ledger.record(user_id, -amount, "slots")
+    ledger.commit_now()
+    ledger._file.close()
+
+
+def test_replay_after_a_torn_last_line(tmp_path):
+    store = JSONStore(str(tmp_path / "economy.json"))
+    store.set_balance(1, 900)
+    store.flush_now()
+    store, ledger = restart(tmp_path)
+    spend(store, ledger, 1, 200)
+
+    # The bot dies halfway through appending the next entry
+    with open(tmp_path / "economy.ledger", "a") as f:
+        f.write("2 1 -5")
+
+    store, ledger = restart(tmp_path)
+    assert store.get_balance(1) == 700
+    spend(store, ledger, 1, 50)
+
+    store, ledger = restart(tmp_path)
+    assert store.get_balance(1) == 650
+    with open(tmp_path / "economy.ledger") as f:
+        assert all(len(line.split()) == 5 for line in f)
+
+
+def test_torn_line_with_every_field_is_not_replayed(tmp_path):
+    store = JSONStore(str(tmp_path / "economy.json"))
+    store.set_balance(1, 900)
+    store.flush_now()
+    store, ledger = restart(tmp_path)
+
+    # Cut off inside the timestamp: five fields, but never fully written
+    with open(tmp_path / "economy.ledger", "a") as f:
+        f.write("1 1 -300 slots 17")
+
+    store, ledger = restart(tmp_path)
+    assert store.get_balance(1) == 900
@@ -0,0 +1,52 @@
+import hashlib
+
+from rng import FairRNG, FairRandom, verify_seed
+
+
+def test_commitment_never_gives_away_a_sealed_seed():
+    fair = FairRNG()
+    rounds = [fair.start("test", "client") for _ in range(200)]
+    for fair_round in rounds[::3]:
+        fair.finish(fair_round, "done")
+
+    sealed = {fair_round.server_seed for fair_round in rounds if not fair_round.revealed}
+    sealed_hex = {seed.hex() for seed in sealed}
+    for fair_round in rounds:
+        assert fair_round.commitment not in sealed_hex
+        assert bytes.fromhex(fair_round.commitment) not in sealed
+        # Neither does any seed that's been published
+        if fair_round.revealed:
+            assert hashlib.sha256(fair_round.server_seed).digest() not in sealed
+
+
+def test_round_is_revealed_while_an_earlier_one_is_open():
+    fair = FairRNG()
+    shoe = fair.start("blackjack", "channel:1")
+    spin = fair.start("slots", "client")
+    fair.finish(spin, "paid 0")
+
+    assert spin.revealed
+    assert not shoe.revealed
+    assert verify_seed(spin.server_seed.hex(), spin.commitment)
+    assert fair.lookup(spin.id) is spin
+    assert fair.lookup(shoe.id) is shoe
+
+
+def test_history_is_bounded_with_a_round_left_open():
+    fair = FairRNG(history=10)
+    shoe = fair.start("blackjack", "channel:1")
+    for _ in range(100):
+        fair.finish(fair.start("slots", "client"), "paid 0")
+
+    assert len(fair._rounds) == 10
+    assert fair.lookup(shoe.id) is shoe
+
+
+def test_round_replays_from_its_seeds():
+    fair = FairRNG()
+    fair_round = fair.start("slots", "client")
+    draws = [fair_round.rng.random() for _ in range(5)]
+    fair.finish(fair_round, "done")
+
+    replay = FairRandom(fair_round.server_seed, fair_round.client_seed)
+    assert [replay.random() for _ in range(5)] == draws
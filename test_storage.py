@@ -0,0 +1,46 @@
+import random
+
+from storage import SQLiteStore
+
+
+def board(store):
+    return sorted(((-coins, user_id) for user_id, coins in store.balances()))
+
+def check(store):
+    expected = board(store)
+    assert store.top(len(expected) + 5) == [(user_id, -neg_coins) for neg_coins, user_id in expected]
+    assert store.top(3, 7) == [(user_id, -neg_coins) for neg_coins, user_id in expected[7:10]]
+    for place, (_, user_id) in enumerate(expected, start=1):
+        assert store.rank(user_id) == place
+
+
+def test_sqlite_leaderboard_follows_every_process(tmp_path):
+    path = str(tmp_path / "economy.db")
+    here = SQLiteStore(path)
+    there = SQLiteStore(path) # Another bot process on the same database
+    rng = random.Random(5)
+    for _ in range(300):
+        store = rng.choice((here, there))
+        user_id = rng.randrange(40)
+        action = rng.randrange(3)
+        if action == 0:
+            store.add_coins(user_id, rng.randrange(-50, 500))
+        elif action == 1:
+            store.try_debit(user_id, rng.randrange(2000))
+        else:
+            store.transfer(user_id, rng.randrange(40), rng.randrange(300))
+    check(here)
+    check(there)
+    assert here.rank(12345) is None
+
+
+def test_sqlite_leaderboard_rebuilds_after_falling_behind_the_log(tmp_path):
+    path = str(tmp_path / "economy.db")
+    behind = SQLiteStore(path, log_keep=10)
+    busy = SQLiteStore(path, log_keep=10)
+    for user_id in range(30):
+        busy.add_coins(user_id, user_id * 7)
+        busy.top(1) # Keeps up, and prunes the log as it goes
+    assert busy.conn.execute("SELECT COUNT(*) FROM balance_log").fetchone()[0] < 30
+    check(behind)
+    check(busy)
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+
+from metrics import registry
+
+# Finds whatever is blocking the event loop. Three parts:
+#
+#   - a task that wakes up every `interval` and records how late it was
+#     (the loop lag), touching a heartbeat each time
+#   - a thread that notices when the heartbeat stops for longer than
+#     `threshold` and grabs the loop thread's stack with sys._current_frames,
+#     again every `threshold / 2` while it stays stuck
+#   - optionally asyncio's debug mode, which logs every callback slower than
+#     `threshold` ("Executing <Task ...> took 0.4 seconds")
+#
+# Both sources add up per call site, so report() can rank the code that
+# stalls every other game.
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Site:
+    __slots__ = ("hits", "seconds", "worst", "stack")
+
+    def __init__(self):
+        self.hits = 0
+        self.seconds = 0.0
+        self.worst = 0.0
+        self.stack = None  # Stack from the worst hit
+
+
+class _SlowCallbackHandler(logging.Handler):
+    # asyncio debug mode reports slow callbacks as log warnings; count them
+    # per callback instead of just printing them
+    PATTERN = re.compile(r"Executing (.*) took (\d+\.\d+) seconds")
+
+    def __init__(self, watchdog):
+        super().__init__(logging.WARNING)
+        self.watchdog = watchdog
+
+    def emit(self, record):
+        match = self.PATTERN.search(record.getMessage())
+        if match:
+            callback = re.sub(r" at 0x[0-9a-f]+|, id=\d+", "", match.group(1)) # Same code, same site
+            seconds = float(match.group(2))
+            self.watchdog._add(f"slow callback: {callback[:200]}", seconds, None, seconds)
+
+
+class Watchdog:
+    def __init__(self, interval=0.1, threshold=0.25, asyncio_debug=False):
+        self.interval = interval
+        self.threshold = threshold
+        self.asyncio_debug = asyncio_debug
+        self.lag = 0.0       # Latest sample, seconds
+        self.max_lag = 0.0   # Worst since start
+        self.sites = {}      # call site -> _Site
+        self._heartbeat = time.monotonic()
+        self._loop_thread = None
+        self._task = None
+        self._lock = threading.Lock()  # sites is written from both threads
+
+        self._blocked_seconds = registry.counter("casino_loop_blocked_seconds_total", "Time the event loop was seen blocked")
+        registry.gauge("casino_event_loop_lag_seconds", "Latest event loop lag sample", function=lambda: self.lag)
+        registry.gauge("casino_event_loop_lag_max_seconds", "Worst event loop lag since start", function=lambda: self.max_lag)
+
+    # ---------------------------- LOOP SIDE ----------------------------
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+            self._heartbeat = time.monotonic()
+
+    # Must be called from inside the running loop; safe to call again
+    def start(self):
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._sample())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+        if self.asyncio_debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+            logging.getLogger("asyncio").addHandler(_SlowCallbackHandler(self))
+
+    # ---------------------------- WATCHDOG THREAD ----------------------------
+
+    def _watch(self):
+        check_every = self.threshold / 2
+        episode = 0.0  # How long the current block has lasted, as far as we've seen
+        while True:
+            time.sleep(check_every)
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled < self.threshold:
+                episode = 0.0
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                return # Loop thread is gone
+            stack = traceback.extract_stack(frame)
+            del frame
+            # Time since the last sample of this block (or since it started)
+            seen = stalled - episode
+            new_block = episode == 0.0
+            episode = stalled
+            self._add(self._call_site(stack), seen, stack, stalled, new_block)
+
+    # Where the loop is stuck: the innermost frame in our own code, plus the
+    # innermost frame overall if that's somewhere else (json, sqlite3, ...)
+    def _call_site(self, stack):
+        ours = next((f for f in reversed(stack) if f.filename.startswith(PROJECT_DIR)), None)
+        innermost = stack[-1]
+        if ours is None:
+            return f"{innermost.filename}:{innermost.lineno} in {innermost.name}"
+        site = f"{os.path.relpath(ours.filename, PROJECT_DIR)}:{ours.lineno} in {ours.name}"
+        if ours is not innermost:
+            site += f" -> {os.path.basename(innermost.filename)}:{innermost.lineno} in {innermost.name}"
+        return site
+
+    # `duration` is how long the block has lasted so far, `seconds` how much
+    # of it this sample adds
+    def _add(self, site, seconds, stack, duration, new_block=True):
+        with self._lock:
+            entry = self.sites.get(site)
+            if entry is None:
+                entry = self.sites[site] = _Site()
+            entry.seconds += seconds
+            if new_block:
+                entry.hits += 1
+            if duration > entry.worst:
+                entry.worst = duration
+                entry.stack = stack
+        with registry.lock:  # Called from the watchdog thread too
+            self._blocked_seconds.inc(seconds)
+
+    # ---------------------------- REPORT ----------------------------
+
+    # Call sites ranked by total time they held the loop
+    def ranked(self, limit=10):
+        with self._lock:
+            sites = sorted(self.sites.items(), key=lambda item: item[1].seconds, reverse=True)
+        return sites[:limit]
+
+    def report(self, limit=10, stacks=False):
+        sites = self.ranked(limit)
+        if not sites:
+            return "No blocking seen."
+        lines = [f"Loop lag now {self.lag * 1000:.0f}ms, worst {self.max_lag * 1000:.0f}ms. Blocking call sites:"]
+        for rank, (site, entry) in enumerate(sites, start=1):
+            lines.append(f"{rank:>2}. {entry.seconds:7.2f}s total  {entry.hits:>4} hits  worst {entry.worst:.2f}s  {site}")
+            if stacks and entry.stack:
+                lines.extend("      " + line for line in "".join(entry.stack.format()[-6:]).rstrip().splitlines())
+        return "\n".join(lines)